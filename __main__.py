@@ -1,55 +1,247 @@
-from pydub import AudioSegment
+import argparse
 
-from songs import download_song, get_song_lyrics, select_song
-from align import align_texts_timestamps
-from utils import stretch_audio_segment
-from matcher import find_quote_matches
-from separator import separate_audio
-from quotes import get_all_quotes
+from pipeline import (
+    RenderOptions,
+    align,
+    fetch_audio,
+    fetch_lyrics,
+    match,
+    render_plans,
+    separate,
+)
+from batch import BATCH_DIR, print_throughput, read_manifest, run_batch
+from server import serve
+from songs import select_song
+from align import align_corpus
+from stretch import MODES, StretchCache
+from matcher import OBJECTIVES
+from checkpoints import Checkpoints
+from quotes import get_all_quotes, QUOTES_PATH
+from store import export_json
+from features import compute_features
+from sessions import session_stats
+from pcm import pack_audio
+import profiling
 
 
-song = select_song()
-lyrics = get_song_lyrics(song)
+def render(options: RenderOptions):
+    song = select_song()
+    checkpoints = Checkpoints()
 
-download_song(song)
-print("Downloaded song.")
+    lyrics = fetch_lyrics(checkpoints, song)
+    if lyrics is None:
+        print("Found no lyrics of the song on Genius.")
+        return
+    song_path = fetch_audio(checkpoints, song)
+    print("Downloaded song.")
 
-separate_audio("data/temp.mp3")
-print("Separated audio into vocals and accompaniment.")
+    stems = separate(checkpoints, song_path)
+    print("Separated audio into vocals and accompaniment.")
 
-matches = find_quote_matches(lyrics, get_all_quotes())
-print(f"Found {len(matches)} matches that make up a sequence.")
+    quotes = get_all_quotes()
+    plans = match(checkpoints, lyrics, quotes, options)
+    if not plans:
+        print("Found no matches.")
+        return
+    print(
+        f"Found {len(plans)} cover plans of {', '.join(str(len(plan)) for plan in plans)} matches."
+    )
 
-timed_lyrics = align_texts_timestamps(
-    "data/vocals.mp3", lyrics, [match.quote_segment for match in matches]
-)
-print(f"Aligned lyrics with timestamps.")
+    words = align(checkpoints, stems["vocals.wav"], lyrics, options.workers)
+    print(f"Aligned lyrics with timestamps.")
 
-start_time = timed_lyrics[0][0]
-end_time = timed_lyrics[-1][1]
-padding = 2000
-segment_start = max(0, start_time - padding)
-segment_end = end_time + padding
+    stretch_cache = StretchCache()
+    for output in render_plans(
+        plans,
+        quotes,
+        lyrics,
+        words,
+        stems["accompaniment.wav"],
+        options,
+        "data/output.mp3",
+        "data/debug.txt",
+        stretch_cache,
+    ):
+        print(f"Rendered {output}.")
+    print(f"Stretch cache: {stretch_cache.stats}")
 
-accompaniment_audio = AudioSegment.from_file("data/accompaniment.mp3")
-accompaniment_audio = accompaniment_audio[segment_start:segment_end] - 15
 
-output: AudioSegment = accompaniment_audio
+def _add_render_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--stretch-mode",
+        choices=MODES,
+        default="quality",
+        help="phase vocoder (quality) or WSOLA (fast) time-stretching",
+    )
+    parser.add_argument(
+        "--objective",
+        choices=OBJECTIVES,
+        default="contiguous",
+        help="sing the longest run of back-to-back quotes (contiguous) or the whole song with gaps (cover)",
+    )
+    parser.add_argument(
+        "--variants",
+        type=int,
+        default=1,
+        help="number of covers to render, the best cover plans of one matcher pass",
+    )
+    parser.add_argument(
+        "--diversity",
+        type=float,
+        default=0,
+        help="weight of the number of distinct characters when ranking cover plans",
+    )
+    parser.add_argument(
+        "--seed", type=int, help="seed of the random choices of the matcher"
+    )
 
-with open("data/debug.txt", "w") as f:
-    for i in range(len(timed_lyrics)):
-        start_ms, end_ms = timed_lyrics[i]
-        target_duration = end_ms - start_ms
 
-        scaled_audio_segment = stretch_audio_segment(
-            matches[i].audio_segment, target_duration
+def _run(args: argparse.Namespace):
+    if args.command == "refresh":
+        aligned = align_corpus(get_all_quotes(refresh=True))
+        print(f"Aligned {aligned} quotes.")
+    elif args.command == "pack":
+        packed = pack_audio(get_all_quotes())
+        print(f"Packed {packed} quotes.")
+    elif args.command == "features":
+        computed = compute_features(get_all_quotes())
+        print(f"Computed the features of {computed} quotes.")
+    elif args.command == "export-json":
+        export_json(get_all_quotes(), QUOTES_PATH)
+    elif args.command == "serve":
+        serve(args.host, args.port, args.workers)
+    elif args.command == "align-corpus":
+        aligned = align_corpus(get_all_quotes())
+        print(f"Aligned {aligned} quotes.")
+    else:
+        options = RenderOptions(
+            args.stretch_mode,
+            args.workers,
+            args.objective,
+            args.variants,
+            args.diversity,
+            args.seed,
         )
+        if args.command == "batch":
+            workers = {
+                "fetch": args.fetch_workers,
+                "analyze": args.analyze_workers,
+                "render": args.render_workers,
+            }
+            stats = run_batch(
+                read_manifest(args.manifest, options),
+                args.output_dir,
+                workers["fetch"],
+                workers["analyze"],
+                workers["render"],
+            )
+            print_throughput(stats, workers)
+        else:
+            render(options)
 
-        relative_start = start_ms - segment_start
-        output = output.overlay(scaled_audio_segment, position=relative_start)
 
-        f.write(
-            f"{matches[i].quote.character}: {matches[i].quote_segment} @{relative_start}\n"
-        )
+def main():
+    parser = argparse.ArgumentParser(description="Cover songs using OW2's voice lines.")
+    parser.set_defaults(
+        stretch_mode="quality",
+        workers=None,
+        objective="contiguous",
+        variants=1,
+        diversity=0,
+        seed=None,
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="TRACE",
+        help="record the time, CPU and memory of every stage, write them as a Chrome trace and print a summary"
+        " (stages run in batch worker processes aren't recorded)",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    render_parser = subparsers.add_parser(
+        "render", help="select a song and render its cover (default)"
+    )
+    _add_render_arguments(render_parser)
+    render_parser.add_argument(
+        "--workers",
+        type=int,
+        help="number of stretching processes (default: CPUs) and alignment processes (default: 1, at most 4)",
+    )
+    batch_parser = subparsers.add_parser(
+        "batch", help="render every song of a manifest, without prompts"
+    )
+    batch_parser.add_argument(
+        "manifest",
+        help='JSON Lines file, one song per line: {"song": query} or {"audio": path, "lyrics": path}',
+    )
+    _add_render_arguments(batch_parser)
+    batch_parser.add_argument(
+        "--output-dir", default=BATCH_DIR, help="directory of the rendered covers"
+    )
+    batch_parser.add_argument(
+        "--fetch-workers",
+        type=int,
+        default=4,
+        help="number of songs whose lyrics and audio are downloaded at once",
+    )
+    batch_parser.add_argument(
+        "--analyze-workers",
+        type=int,
+        default=1,
+        help="number of separation and alignment processes, each with its own models",
+    )
+    batch_parser.add_argument(
+        "--render-workers",
+        type=int,
+        default=2,
+        help="number of rendering processes",
+    )
+    serve_parser = subparsers.add_parser(
+        "serve",
+        help="run a render server that keeps the corpus and the models loaded between jobs",
+    )
+    serve_parser.add_argument(
+        "--host", default="127.0.0.1", help="address to listen on"
+    )
+    serve_parser.add_argument(
+        "--port", type=int, default=8765, help="port to listen on"
+    )
+    serve_parser.add_argument(
+        "--workers", type=int, default=1, help="number of jobs rendered at once"
+    )
+    subparsers.add_parser(
+        "align-corpus",
+        help="align the words of every new or changed quote and store their timings",
+    )
+    subparsers.add_parser(
+        "refresh",
+        help="update the quote corpus from the wiki, downloading only new or changed quotes",
+    )
+    subparsers.add_parser(
+        "export-json", help=f"export the quote corpus to {QUOTES_PATH}"
+    )
+    subparsers.add_parser(
+        "pack", help="decode the audio of every quote once into the PCM bank"
+    )
+    subparsers.add_parser(
+        "features",
+        help="compute the loudness, pitch and silences of every aligned quote, to rank and level voice lines",
+    )
+    args = parser.parse_args()
+
+    if args.profile:
+        profiling.enable()
+    try:
+        _run(args)
+    finally:
+        if args.profile:
+            profiling.export_trace(args.profile)
+            print(profiling.summary())
+            for name, stats in session_stats().items():
+                print(
+                    f"Model {name}: loaded in {stats['load_seconds']:.1f}s, reused {stats['reuses']} times."
+                )
+            print(f"Wrote the trace to {args.profile}.")
+
 
-output.export("data/output.mp3", format="mp3")
+if __name__ == "__main__":
+    main()
@@ -1,40 +1,59 @@
-from typing import Tuple, List
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, Tuple, List
+import threading
+import os
+import re
 
-from forcealign.forcealign import Word
-from forcealign import ForceAlign
 from pydub import AudioSegment
-import nltk
+import numpy as np
 
-from models import Quote
+from pcm import get_bank, to_audio_segment
+from sessions import get_model
+from timings import WordTiming, get_timings, set_timings, load_timings, save_timings
+from index import normalize_and_tokenize
+from models import Quote, Word
+from profiling import span
 
-nltk.download("averaged_perceptron_tagger_eng", quiet=True)
+if TYPE_CHECKING:
+    from torchaudio.pipelines import Wav2Vec2ASRBundle
+    import torch
 
+# Frame length, in seconds, of the loudness analysis that finds the silences songs are split at
+_SILENCE_FRAME_S = 0.02
 
-def _find_word_index(substring: str, tokens: List[str]) -> Tuple[int, int]:
+# The most worker processes aligning a song, as every worker loads its own acoustic model (about 380 MB)
+_MAX_ALIGNMENT_WORKERS = 4
+
+# The worker processes aligning songs, kept between songs so that their acoustic models stay loaded
+_alignment_pool: ProcessPoolExecutor | None = None
+_alignment_pool_workers = 0
+_alignment_pool_lock = threading.Lock()
+
+
+def _find_tokens(tokens: List[str], wanted_tokens: List[str], start: int = 0) -> int:
     """
-    This function finds the index of a substring in a list of tokens.
+    This function finds the first occurrence of a run of tokens in a list of tokens.
 
     Args:
-        substring (str): The substring to find in the list of tokens.
         tokens (List[str]): The list of tokens to search within.
+        wanted_tokens (List[str]): The run of tokens to find.
+        start (int): The index the search starts at.
 
     Returns:
-        Tuple[int, int]: The index of the substring in the list of tokens, or -1 if not found and the length of the substring as token count.
+        int: The index of the first token of the run, or -1 if not found.
     """
 
-    tokens = [token.lower() for token in tokens]
-    tokenized_substring = substring.lower().replace("'", "").split()
-    substring_token_length = len(tokenized_substring)
-
-    for i in range(len(tokens) - substring_token_length + 1):
-        if tokens[i : i + substring_token_length] == tokenized_substring:
-            return i, substring_token_length
-    return -1, substring_token_length
+    length = len(wanted_tokens)
+    for i in range(start, len(tokens) - length + 1):
+        if tokens[i] == wanted_tokens[0] and tokens[i : i + length] == wanted_tokens:
+            return i
+    return -1
 
 
 def align_words(audio_path: str, complete_text: str) -> List[Word]:
     """
-    This function aligns the words in a transcript with the corresponding audio timestamps
+    This function aligns the words in a transcript with the corresponding audio timestamps,
+    reusing the acoustic model loaded by previous calls.
 
     Args:
         audio_path (str): The path to the audio file.
@@ -44,72 +63,588 @@ def align_words(audio_path: str, complete_text: str) -> List[Word]:
         List[Word]: A list of Word objects containing the word, start time, and end time.
     """
 
-    align = ForceAlign(audio_file=audio_path, transcript=complete_text)
-    return align.inference()
+    return align_words_batch([(audio_path, complete_text)])[0]
 
 
-def align_text(audio_path: str, complete_text: str, wanted_part: str) -> AudioSegment:
+def _load_waveform(audio_path: str, sample_rate: int) -> np.ndarray:
     """
-    This function aligns a specific part of the text with the corresponding audio timestamps.
+    This function loads an audio file as a mono float32 waveform in [-1.0, +1.0], from the PCM bank if it's packed.
 
     Args:
         audio_path (str): The path to the audio file.
-        complete_text (str): The complete transcript of the audio.
-        wanted_part (str): The specific part of the text to align.
+        sample_rate (int): The sample rate to resample the audio to.
+
+    Returns:
+        np.ndarray: The waveform of the audio.
+    """
+
+    bank = get_bank()
+    if bank is not None and audio_path in bank:
+        import torchaudio.functional as F
+        import torch
+
+        samples = torch.from_numpy(np.array(bank.samples(audio_path)))
+        return F.resample(samples, bank.sample_rate, sample_rate).numpy()
+
+    with span("decode", path=audio_path):
+        audio = AudioSegment.from_file(audio_path)
+    audio = audio.set_channels(1).set_frame_rate(sample_rate)
+    samples = np.array(audio.get_array_of_samples(), dtype=np.float32)
+    return samples / float(2 ** (8 * audio.sample_width - 1))
+
+
+def _acoustic_model() -> "Wav2Vec2ASRBundle":
+    """
+    This function returns the bundle of the wav2vec2 acoustic model used for forced alignment, with its sample rate and
+    labels. Torch is only imported here and in the functions running the model, on first use, since importing it takes seconds.
+    """
+
+    import torchaudio
+
+    return torchaudio.pipelines.WAV2VEC2_ASR_BASE_960H
+
+
+def _load_acoustic_model() -> "torch.nn.Module":
+    """
+    This function loads the wav2vec2 acoustic model used for forced alignment.
+    """
+
+    import torch
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    return _acoustic_model().get_model().to(device).eval()
+
+
+def warm_up_aligner():
+    """
+    This function loads the acoustic model into the model session of the process, so that the first alignment doesn't wait for it.
+    """
+
+    get_model("wav2vec2_asr_base_960h", _load_acoustic_model)
+
+
+def _transcript_words(transcript: str) -> List[str]:
+    """
+    This function splits a transcript into the words the acoustic model can align,
+    uppercased and without apostrophes or any other non-letter characters.
+    """
+
+    words = [re.sub(r"[^A-Z]", "", word) for word in transcript.upper().split()]
+    return [word for word in words if word]
+
+
+def _words_from_emission(
+    emission: "torch.Tensor",
+    words: List[str],
+    labels: Tuple[str, ...],
+    seconds_per_frame: float,
+) -> List[Word]:
+    """
+    This function force-aligns the words of a transcript to the emission of the acoustic model for its audio.
+
+    Args:
+        emission (torch.Tensor): The log-probabilities of the labels for every frame, of shape (frames, labels).
+        words (List[str]): The words of the transcript.
+        labels (Tuple[str, ...]): The labels of the acoustic model, where "|" separates words.
+        seconds_per_frame (float): The duration of a frame of the emission in seconds.
 
     Returns:
-        AudioSegment: An AudioSegment object containing the audio segment corresponding to the wanted part of the text.
+        List[Word]: A list of Word objects containing the word, start time, and end time.
     """
 
-    words = align_words(audio_path, complete_text)
-    word_index, wanted_word_count = _find_word_index(
-        wanted_part, [w.word for w in words]
+    import torchaudio.functional as F
+    import torch
+
+    dictionary = {label: i for i, label in enumerate(labels)}
+    targets = torch.tensor(
+        [[dictionary[char] for char in "|".join(words)]], dtype=torch.int32
     )
+    alignment, scores = F.forced_align(emission[None], targets, blank=0)
+    spans = F.merge_tokens(alignment[0], scores[0].exp())
+
+    word_spans = [[]]
+    for span in spans:
+        if span.token == dictionary["|"]:
+            word_spans.append([])
+        else:
+            word_spans[-1].append(span)
+
+    return [
+        Word(
+            word=word,
+            time_start=spans_of_word[0].start * seconds_per_frame,
+            time_end=spans_of_word[-1].end * seconds_per_frame,
+        )
+        for word, spans_of_word in zip(words, word_spans)
+    ]
 
-    first_word = words[word_index]
-    last_word = words[word_index + wanted_word_count - 1]
 
-    audio = AudioSegment.from_file(audio_path)
-    return audio[first_word.time_start * 1000 : last_word.time_end * 1000]
+def align_words_batch(
+    pairs: List[Tuple[str, str]], batch_size: int = 8, skip_errors: bool = False
+) -> List[List[Word]]:
+    """
+    This function aligns the words of many transcripts with their audio, using the acoustic model session
+    of the process and running it once per minibatch instead of once per audio. Audios are grouped by length so that little padding is needed.
 
+    Args:
+        pairs (List[Tuple[str, str]]): A list of (audio path, complete transcript) pairs.
+        batch_size (int): The number of audios run through the acoustic model at once.
+        skip_errors (bool): If True, pairs that can't be aligned are reported and get None instead of raising.
 
-def align_texts_timestamps(
-    audio_path: str, complete_text: str, texts_to_align: List[str]
-) -> List[Tuple[float, float]]:
+    Returns:
+        List[List[Word]]: For every pair, in the given order, a list of Word objects containing the word, start time, and end time.
+    """
+
+    if not pairs:
+        return []
+
+    import torch
+
+    model = get_model("wav2vec2_asr_base_960h", _load_acoustic_model)
+    device = next(model.parameters()).device
+    sample_rate = _acoustic_model().sample_rate
+    labels = _acoustic_model().get_labels()
+
+    results: List[List[Word]] = [None for _ in pairs]
+
+    def fail(i: int, e: Exception):
+        if not skip_errors:
+            raise e
+        print(f"Error aligning {pairs[i][0]}: {e}")
+        print("Continuing with the next audio...")
+
+    waveforms = {}
+    for i, (path, _) in enumerate(pairs):
+        try:
+            waveforms[i] = _load_waveform(path, sample_rate)
+        except Exception as e:
+            fail(i, e)
+
+    order = sorted(waveforms, key=lambda i: len(waveforms[i]))
+    for batch_start in range(0, len(order), batch_size):
+        batch = order[batch_start : batch_start + batch_size]
+        lengths = torch.tensor([len(waveforms[i]) for i in batch])
+
+        padded = torch.zeros(len(batch), int(lengths.max()))
+        for row, i in enumerate(batch):
+            padded[row, : len(waveforms[i])] = torch.from_numpy(waveforms[i])
+
+        with torch.inference_mode():
+            emissions, frame_counts = model(padded.to(device), lengths.to(device))
+            emissions = torch.log_softmax(emissions, dim=-1).cpu()
+
+        for row, i in enumerate(batch):
+            frame_count = (
+                int(frame_counts[row])
+                if frame_counts is not None
+                else emissions.shape[1]
+            )
+            seconds_per_frame = len(waveforms[i]) / frame_count / sample_rate
+            try:
+                results[i] = _words_from_emission(
+                    emissions[row, :frame_count],
+                    _transcript_words(pairs[i][1]),
+                    labels,
+                    seconds_per_frame,
+                )
+            except Exception as e:
+                fail(i, e)
+
+    return results
+
+
+def _lyric_sections(lyrics: str) -> List[List[str]]:
+    """
+    This function splits lyrics into sections at blank lines and section headers (e.g. "[Chorus]" on Genius),
+    falling back to lines if the lyrics have no section structure.
+
+    Returns:
+        List[List[str]]: The words of every non-empty section, which concatenated are the words of the lyrics.
+    """
+
+    lines = lyrics.split("\n")
+    sections = [[]]
+    for line in lines:
+        if not line.strip() or re.fullmatch(r"\s*\[.*\]\s*", line):
+            sections.append([])
+        sections[-1].extend(_transcript_words(line))
+
+    sections = [section for section in sections if section]
+    if len(sections) <= 1:
+        sections = [_transcript_words(line) for line in lines]
+    return [section for section in sections if section]
+
+
+def _silence_cuts(
+    waveform: np.ndarray, sample_rate: int, min_silence_s: float, silence_db: float
+) -> Tuple[List[Tuple[int, float]], float]:
     """
-    This function aligns multiple texts with the corresponding audio timestamps.
+    This function finds the silences of a vocal track, where it can be split without cutting words.
 
     Args:
-        audio_path (str): The path to the audio file.
-        complete_text (str): The complete transcript of the audio.
-        texts_to_align (List[str]): A list of texts to align with the audio.
+        waveform (np.ndarray): The mono samples of the track.
+        sample_rate (int): The sample rate of the track.
+        min_silence_s (float): The minimum duration of a silence in seconds.
+        silence_db (float): The loudness, relative to the loud parts of the track, below which it's silent.
 
     Returns:
-        List[Tuple[float, float]]: A list of tuples containing the start and end timestamps of the aligned texts
+        Tuple[List[Tuple[int, float]], float]: The middle of every silence in samples with the duration of voice
+            before it in seconds, and the total duration of voice in seconds.
     """
 
-    words = align_words(audio_path, complete_text)
-    words_tokenized = [w.word for w in words]
+    hop = int(_SILENCE_FRAME_S * sample_rate)
+    frame_count = len(waveform) // hop
+    if frame_count == 0:
+        return [], 0
 
-    timestamps = []
-    last_word_index = 0
-    for text in texts_to_align:
-        index_offset, wanted_words_count = _find_word_index(
-            text, words_tokenized[last_word_index:]
+    rms = np.sqrt(
+        np.mean(np.square(waveform[: frame_count * hop].reshape(-1, hop)), axis=1)
+    )
+    voiced = rms > np.percentile(rms, 95) * 10 ** (silence_db / 20)
+    voiced_before = np.concatenate([[0], np.cumsum(voiced)])
+
+    min_frames = max(1, int(min_silence_s / _SILENCE_FRAME_S))
+    cuts = []
+    run_start = None
+    for i, is_voiced in enumerate([*voiced, True]):
+        if not is_voiced and run_start is None:
+            run_start = i
+        elif is_voiced and run_start is not None:
+            if i - run_start >= min_frames and 0 < run_start and i < frame_count:
+                middle = (run_start + i) // 2
+                cuts.append((middle * hop, voiced_before[middle] * _SILENCE_FRAME_S))
+            run_start = None
+    return cuts, voiced_before[-1] * _SILENCE_FRAME_S
+
+
+def _assign_sections(
+    sections: List[List[str]], cuts: List[Tuple[int, float]], voiced_s: float
+) -> List[Tuple[int, List[str]]]:
+    """
+    This function assigns lyric sections to the parts of a track between silences. Every section boundary is
+    placed at the silence closest to where it's expected, assuming the words are spread evenly over the voiced
+    parts of the track. Boundaries that find no silence of their own merge their sections.
+
+    Args:
+        sections (List[List[str]]): The words of every section.
+        cuts (List[Tuple[int, float]]): The silences of the track and the duration of voice before them, see `_silence_cuts`.
+        voiced_s (float): The total duration of voice in the track in seconds.
+
+    Returns:
+        List[Tuple[int, List[str]]]: The start of every segment in samples and the words sung in it.
+    """
+
+    word_count = sum(len(section) for section in sections)
+    segments = [(0, list(sections[0]))]
+    next_cut = 0
+    words_before = len(sections[0])
+
+    for section in sections[1:]:
+        expected_s = words_before / word_count * voiced_s
+        words_before += len(section)
+
+        best = None
+        for k in range(next_cut, len(cuts)):
+            if best is None or abs(cuts[k][1] - expected_s) < abs(
+                cuts[best][1] - expected_s
+            ):
+                best = k
+            elif cuts[k][1] > expected_s:
+                break
+
+        if best is None:
+            segments[-1][1].extend(section)
+        else:
+            segments.append((cuts[best][0], list(section)))
+            next_cut = best + 1
+
+    return segments
+
+
+def _init_alignment_worker(threads: int):
+    """
+    This function limits the threads of an alignment worker process, so that the workers don't oversubscribe the CPU.
+    """
+
+    import torch
+
+    torch.set_num_threads(threads)
+
+
+def _get_alignment_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    This function returns the process pool aligning song sections, which is created on first use and replaced only
+    when a different number of workers is asked for.
+    """
+
+    global _alignment_pool, _alignment_pool_workers
+
+    with _alignment_pool_lock:
+        if _alignment_pool is None or _alignment_pool_workers != workers:
+            if _alignment_pool is not None:
+                _alignment_pool.shutdown()
+            _alignment_pool = ProcessPoolExecutor(
+                workers,
+                initializer=_init_alignment_worker,
+                initargs=(max(1, (os.cpu_count() or 1) // workers),),
+            )
+            _alignment_pool_workers = workers
+        return _alignment_pool
+
+
+def _align_segment(waveform: np.ndarray, words: List[str]) -> List[Word]:
+    """
+    This function aligns the words sung in a segment of a track with it, using the acoustic model session of the process.
+    Segments that can't be aligned get their words spread evenly over their duration, so that the words of the
+    other segments keep their place.
+
+    Args:
+        waveform (np.ndarray): The mono samples of the segment at the sample rate of the acoustic model.
+        words (List[str]): The words sung in the segment.
+
+    Returns:
+        List[Word]: A list of Word objects containing the word, and its start and end time within the segment.
+    """
+
+    import torch
+
+    bundle = _acoustic_model()
+    duration = len(waveform) / bundle.sample_rate
+
+    try:
+        model = get_model("wav2vec2_asr_base_960h", _load_acoustic_model)
+        device = next(model.parameters()).device
+        with torch.inference_mode():
+            emission, _ = model(torch.from_numpy(waveform)[None].to(device))
+            emission = torch.log_softmax(emission, dim=-1)[0].cpu()
+        return _words_from_emission(
+            emission, words, bundle.get_labels(), duration / len(emission)
+        )
+    except Exception as e:
+        print(
+            f"Error aligning a segment of {duration:.1f}s with {len(words)} words: {e}"
+        )
+        print("Spreading its words evenly over the segment...")
+        step = duration / len(words)
+        return [
+            Word(word=word, time_start=i * step, time_end=(i + 1) * step)
+            for i, word in enumerate(words)
+        ]
+
+
+def align_song_words(
+    audio_path: str,
+    lyrics: str,
+    workers: int | None = None,
+    min_silence_s: float = 0.3,
+    silence_db: float = -35,
+) -> List[Word]:
+    """
+    This function aligns the lyrics of a song with its vocals section by section. The track is split at silences,
+    lyric sections are assigned to the parts between them, and the parts are aligned independently, with the
+    acoustic model session of this process or in a pool of worker processes kept between songs. Memory then depends
+    on the longest part instead of the whole song, and a misaligned part doesn't shift the words of the other parts.
+
+    Args:
+        audio_path (str): The path to the vocals of the song.
+        lyrics (str): The lyrics of the song.
+        workers (int | None): The number of worker processes, at most 4, each loading its own acoustic model.
+            By default, or with 1, parts are aligned in this process.
+        min_silence_s (float): The minimum duration of a silence the track is split at, in seconds.
+        silence_db (float): The loudness, relative to the loud parts of the track, below which it's silent.
+
+    Returns:
+        List[Word]: A list of Word objects containing the word, start time, and end time in the song.
+    """
+
+    sample_rate = _acoustic_model().sample_rate
+    waveform = _load_waveform(audio_path, sample_rate)
+    sections = _lyric_sections(lyrics)
+    if not sections:
+        return []
+
+    cuts, voiced_s = _silence_cuts(waveform, sample_rate, min_silence_s, silence_db)
+    segments = _assign_sections(sections, cuts, voiced_s)
+    starts = [start for start, _ in segments]
+    ends = starts[1:] + [len(waveform)]
+    waveforms = [waveform[start:end] for start, end in zip(starts, ends)]
+    segment_words = [words for _, words in segments]
+
+    workers = min(workers or 1, _MAX_ALIGNMENT_WORKERS)
+    if workers <= 1 or len(segments) <= 1:
+        aligned = map(_align_segment, waveforms, segment_words)
+    else:
+        aligned = list(
+            _get_alignment_pool(workers).map(_align_segment, waveforms, segment_words)
+        )
+
+    return [
+        Word(
+            word=word.word,
+            time_start=word.time_start + start / sample_rate,
+            time_end=word.time_end + start / sample_rate,
         )
-        word_index = last_word_index + index_offset
-        last_word_index = word_index + wanted_words_count - 1
-        first_word = words[word_index]
-        last_word = words[last_word_index]
+        for start, words in zip(starts, aligned)
+        for word in words
+    ]
 
-        timestamps.append((first_word.time_start * 1000, last_word.time_end * 1000))
+
+def lyric_word_indexes(text: str) -> List[int]:
+    """
+    This function maps the tokens of a text, as the matcher tokenizes it (`index.normalize_and_tokenize`), to the words
+    the aligner aligns in it (`_transcript_words`). Both split the text at whitespace first, so every token comes from
+    one whitespace-separated word, which is aligned unless it has no letters (e.g. a number): the tokens of such words
+    are mapped to the aligned word before them.
+
+    Args:
+        text (str): The text, e.g. the lyrics of a song or the text of a quote.
+
+    Returns:
+        List[int]: For every token of the text, the index of the aligned word it's part of.
+    """
+
+    indexes = []
+    word_index = 0
+    word_count = 0
+    for word in text.split():
+        if _transcript_words(word):
+            word_index = word_count
+            word_count += 1
+        indexes.extend([word_index] * len(normalize_and_tokenize(word)))
+
+    return indexes
+
+
+def spans_timestamps(
+    words: List[WordTiming], word_indexes: List[int], spans: List[Tuple[int, int]]
+) -> List[Tuple[float, float]]:
+    """
+    This function finds the timestamps of spans of tokens in already aligned words, so that several sets of spans
+    (e.g. the matches of different cover plans) can share one alignment of the audio.
+
+    Args:
+        words (List[WordTiming]): The aligned words of the complete text, as (word, start, end) in seconds.
+        word_indexes (List[int]): The aligned word of every token of the complete text, see `lyric_word_indexes`.
+        spans (List[Tuple[int, int]]): The spans to find, as (position of the first token, token count).
+
+    Returns:
+        List[Tuple[float, float]]: A list of tuples containing the start and end timestamps of the spans in milliseconds
+    """
+
+    timestamps = []
+    for position, length in spans:
+        _, start, _ = words[word_indexes[position]]
+        _, _, end = words[word_indexes[position + length - 1]]
+        timestamps.append((start * 1000, end * 1000))
 
     return timestamps
 
 
+def align_corpus(quotes: List[Quote], batch_size: int = 8) -> int:
+    """
+    This function aligns every quote whose word timings are missing or whose audio changed since it was aligned,
+    and drops the timings of quotes that are no longer in the corpus.
+
+    Args:
+        quotes (List[Quote]): All quotes of the corpus.
+        batch_size (int): The number of quotes run through the acoustic model at once.
+
+    Returns:
+        int: The number of quotes that were (re-)aligned.
+    """
+
+    table = load_timings()
+    quote_ids = {quote.id for quote in quotes}
+    for quote_id in [quote_id for quote_id in table if quote_id not in quote_ids]:
+        del table[quote_id]
+
+    stale = [quote for quote in quotes if get_timings(quote) is None]
+    stale_words = align_words_batch(
+        [(quote.audio_path, quote.text) for quote in stale],
+        batch_size,
+        skip_errors=True,
+    )
+
+    aligned = 0
+    for quote, words in zip(stale, stale_words):
+        if words is not None:
+            set_timings(quote, [(w.word, w.time_start, w.time_end) for w in words])
+            aligned += 1
+
+    save_timings()
+    return aligned
+
+
+def quote_word_span(quote: Quote, wanted_part: str) -> Tuple[int, int]:
+    """
+    This function finds the words of a quote that a specific part of its text is sung in.
+
+    Args:
+        quote (Quote): The quote object containing the text.
+        wanted_part (str): The specific part of the quote text, e.g. the segment of a match.
+
+    Returns:
+        Tuple[int, int]: The indexes of the first and the last aligned word of the wanted part.
+    """
+
+    wanted_tokens = normalize_and_tokenize(wanted_part)
+    position = _find_tokens(normalize_and_tokenize(quote.text), wanted_tokens)
+    if position == -1:
+        raise ValueError(f"{wanted_part!r} isn't in quote {quote.id}")
+
+    word_indexes = lyric_word_indexes(quote.text)
+    return word_indexes[position], word_indexes[position + len(wanted_tokens) - 1]
+
+
+def _quote_span(quote: Quote, wanted_part: str) -> Tuple[float, float]:
+    """
+    This function finds the start and end of a specific part of a quote, using the word timings of the timing table.
+    Quotes are never aligned at render time: the matcher only chooses quotes with timings, see `align_corpus`.
+
+    Args:
+        quote (Quote): The quote object containing the audio path and text.
+        wanted_part (str): The specific part of the quote text to align.
+
+    Returns:
+        Tuple[float, float]: The start and end of the wanted part in seconds.
+    """
+
+    words = get_timings(quote)
+    if words is None:
+        raise ValueError(
+            f"Quote {quote.id} has no word timings, run `python __main__.py align-corpus`"
+        )
+
+    first_word, last_word = quote_word_span(quote, wanted_part)
+    _, start, _ = words[first_word]
+    _, _, end = words[last_word]
+    return start, end
+
+
+def align_quote_samples(quote: Quote, wanted_part: str) -> np.ndarray | None:
+    """
+    This function returns the samples of a specific part of a quote as a view into the PCM bank, without decoding it.
+
+    Args:
+        quote (Quote): The quote object containing the audio path and text.
+        wanted_part (str): The specific part of the quote text to align.
+
+    Returns:
+        np.ndarray | None: The float32 mono samples at pcm.SAMPLE_RATE, or None if the quote audio isn't packed.
+    """
+
+    bank = get_bank()
+    if bank is None or quote.audio_path not in bank:
+        return None
+
+    start, end = _quote_span(quote, wanted_part)
+    return bank.samples(quote.audio_path, start, end)
+
+
 def align_quote(quote: Quote, wanted_part: str) -> AudioSegment:
     """
-    This function aligns a specific part of a quote with the corresponding audio timestamps.
+    This function cuts a specific part of a quote out of its audio, using the word timings of the timing table.
+    The audio is taken from the PCM bank if the quote is packed, otherwise it's decoded from the audio file.
 
     Args:
         quote (Quote): The quote object containing the audio path and text.
@@ -119,4 +654,11 @@ def align_quote(quote: Quote, wanted_part: str) -> AudioSegment:
         AudioSegment: An AudioSegment object containing the audio segment corresponding to the wanted part of the quote.
     """
 
-    return align_text(quote.audio_path, quote.text, wanted_part)
+    samples = align_quote_samples(quote, wanted_part)
+    if samples is not None:
+        return to_audio_segment(samples, get_bank().sample_rate)
+
+    start, end = _quote_span(quote, wanted_part)
+    with span("decode", path=quote.audio_path):
+        audio = AudioSegment.from_file(quote.audio_path)
+    return audio[start * 1000 : end * 1000]
@@ -0,0 +1,281 @@
+"""
+This module renders many songs listed in a manifest, without any prompts. Songs flow through the stages as a
+pipeline: lyrics and audio are fetched in threads, separated and aligned in worker processes that keep their
+models loaded between songs, and rendered in another pool of worker processes, so every stage works on a
+different song at the same time. Only a few songs are in flight at once, and their checkpoints are pinned until
+they're rendered, so that fetching can't run ahead and evict the files of songs still waiting for a stage.
+"""
+
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Dict, List, Tuple
+import json
+import time
+import uuid
+import os
+import re
+
+from pipeline import (
+    RenderOptions,
+    align,
+    fetch_audio,
+    fetch_lyrics,
+    match,
+    render_plans,
+    separate,
+)
+from checkpoints import Checkpoints
+from timings import WordTiming
+from quotes import get_all_quotes
+
+
+BATCH_DIR = "data/batch"
+STAGES = ["fetch", "analyze", "render"]
+
+
+@dataclass
+class BatchJob:
+    """
+    A song to render: either a query for Genius and YouTube (`song`), or local `audio` and `lyrics` files,
+    which are rendered fully offline.
+    """
+
+    name: str
+    song: str | None = None
+    audio: str | None = None
+    lyrics: str | None = None
+    options: RenderOptions = field(default_factory=RenderOptions)
+
+
+def read_manifest(path: str, defaults: RenderOptions) -> List[BatchJob]:
+    """
+    Reads a manifest in the JSON Lines format, one song per line: {"song": "query"} or
+    {"audio": "path", "lyrics": "path"}, with an optional "name" for the output files and optional
+    render options (e.g. "objective" or "variants") overriding the defaults.
+
+    Args:
+        path (str): The path of the manifest.
+        defaults (RenderOptions): The render options of songs that don't override them.
+
+    Returns:
+        List[BatchJob]: The songs of the manifest, in order.
+    """
+
+    jobs = []
+    with open(path, "r") as file:
+        for line_number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+
+            entry = json.loads(line)
+            song, audio, lyrics = (
+                entry.pop("song", None),
+                entry.pop("audio", None),
+                entry.pop("lyrics", None),
+            )
+            if not song and not (audio and lyrics):
+                raise ValueError(
+                    f"{path}:{line_number}: expected a song, or an audio and a lyrics file"
+                )
+
+            name = entry.pop("name", None) or song or os.path.splitext(audio)[0]
+            jobs.append(
+                BatchJob(
+                    re.sub(r"[^\w.-]+", "_", os.path.basename(name)).strip("_"),
+                    song,
+                    audio,
+                    lyrics,
+                    replace(defaults, **entry),
+                )
+            )
+
+    return jobs
+
+
+def _timed(function: Callable, *args) -> Tuple[Any, float]:
+    start = time.perf_counter()
+    return function(*args), time.perf_counter() - start
+
+
+def _fetch(job: BatchJob, pin: str) -> Tuple[str, str]:
+    """
+    Returns the lyrics and the path of the audio of a song, reading local files instead of fetching them if given.
+    """
+
+    checkpoints = Checkpoints(pin=pin)
+
+    if job.lyrics:
+        with open(job.lyrics, "r") as file:
+            lyrics = file.read()
+    else:
+        lyrics = fetch_lyrics(checkpoints, job.song)
+        if lyrics is None:
+            raise ValueError(f"No lyrics found for {job.song!r}")
+
+    return lyrics, job.audio or fetch_audio(checkpoints, job.song)
+
+
+def _analyze(
+    audio_path: str, lyrics: str, pin: str
+) -> Tuple[Dict[str, str], List[WordTiming]]:
+    """
+    Separates a song and aligns its lyrics with its vocals. Runs in a worker process, which loads the models once.
+    """
+
+    checkpoints = Checkpoints(pin=pin)
+    stems = separate(checkpoints, audio_path)
+    return stems, align(checkpoints, stems["vocals.wav"], lyrics, workers=1)
+
+
+def _render(
+    job: BatchJob,
+    lyrics: str,
+    stems: Dict[str, str],
+    words: List[WordTiming],
+    output_dir: str,
+    pin: str,
+) -> List[str]:
+    """
+    Matches the lyrics of a song with the quotes and renders its covers. Runs in a worker process.
+    """
+
+    checkpoints = Checkpoints(pin=pin)
+    quotes = get_all_quotes()
+    plans = match(checkpoints, lyrics, quotes, job.options)
+    if not plans:
+        raise ValueError("Found no matches")
+
+    return render_plans(
+        plans,
+        quotes,
+        lyrics,
+        words,
+        stems["accompaniment.wav"],
+        replace(job.options, workers=1),
+        os.path.join(output_dir, f"{job.name}.mp3"),
+        os.path.join(output_dir, f"{job.name}.txt"),
+    )
+
+
+def run_batch(
+    jobs: List[BatchJob],
+    output_dir: str = BATCH_DIR,
+    fetch_workers: int = 4,
+    analyze_workers: int = 1,
+    render_workers: int = 2,
+    max_in_flight: int | None = None,
+) -> Dict[str, Any]:
+    """
+    Renders every song of a batch, reporting every finished song and the throughput of the batch.
+    A song that fails at any stage is reported and skipped.
+
+    Args:
+        jobs (List[BatchJob]): The songs to render.
+        output_dir (str): The directory the covers are written to, as <name>.mp3.
+        fetch_workers (int): The number of songs whose lyrics and audio are fetched at once.
+        analyze_workers (int): The number of processes separating and aligning songs, each with its own models.
+        render_workers (int): The number of processes rendering covers.
+        max_in_flight (int | None): The most songs between the start of their fetch and the end of their render,
+            one per worker of every stage by default. The next song is only fetched once one is finished.
+
+    Returns:
+        Dict[str, Any]: The statistics of the batch: rendered and failed song counts, wall time in seconds,
+            and the count and total time in seconds of every stage.
+    """
+
+    stats = {
+        "rendered": 0,
+        "failed": 0,
+        "seconds": 0.0,
+        "stages": {stage: {"count": 0, "seconds": 0.0} for stage in STAGES},
+    }
+    start = time.perf_counter()
+    max_in_flight = max_in_flight or fetch_workers + analyze_workers + render_workers
+    queued = iter(jobs)
+    checkpoints = Checkpoints()
+
+    with ThreadPoolExecutor(fetch_workers) as fetchers, ProcessPoolExecutor(
+        analyze_workers
+    ) as analyzers, ProcessPoolExecutor(render_workers) as renderers:
+        # Every pending future, with its stage, its song, the pin of its checkpoints and its lyrics once fetched
+        pending: Dict[Future, Tuple[str, BatchJob, str, str | None]] = {}
+
+        def fetch_next():
+            job = next(queued, None)
+            if job is not None:
+                pin = uuid.uuid4().hex
+                future = fetchers.submit(_timed, _fetch, job, pin)
+                pending[future] = ("fetch", job, pin, None)
+
+        for _ in range(max_in_flight):
+            fetch_next()
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, job, pin, lyrics = pending.pop(future)
+                finished = stats["rendered"] + stats["failed"] + 1
+
+                try:
+                    result, seconds = future.result()
+                except Exception as e:
+                    stats["failed"] += 1
+                    print(
+                        f"[{finished}/{len(jobs)}] {job.name}: failed to {stage}: {e}"
+                    )
+                    checkpoints.unpin(pin)
+                    fetch_next()
+                    continue
+
+                stats["stages"][stage]["count"] += 1
+                stats["stages"][stage]["seconds"] += seconds
+
+                if stage == "fetch":
+                    lyrics, audio_path = result
+                    next_future = analyzers.submit(
+                        _timed, _analyze, audio_path, lyrics, pin
+                    )
+                    pending[next_future] = ("analyze", job, pin, lyrics)
+                elif stage == "analyze":
+                    stems, words = result
+                    next_future = renderers.submit(
+                        _timed, _render, job, lyrics, stems, words, output_dir, pin
+                    )
+                    pending[next_future] = ("render", job, pin, lyrics)
+                else:
+                    stats["rendered"] += 1
+                    print(f"[{finished}/{len(jobs)}] {job.name}: {', '.join(result)}")
+                    checkpoints.unpin(pin)
+                    fetch_next()
+
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def print_throughput(stats: Dict[str, Any], workers: Dict[str, int]):
+    """
+    Prints the throughput of a batch and, for every stage, its mean time per song and how busy its workers were.
+
+    Args:
+        stats (Dict[str, Any]): The statistics returned by `run_batch`.
+        workers (Dict[str, int]): The number of workers of every stage.
+    """
+
+    seconds = max(stats["seconds"], 1e-9)
+    print(
+        f"Rendered {stats['rendered']} songs ({stats['failed']} failed) in {seconds:.1f}s, "
+        f"{stats['rendered'] * 3600 / seconds:.1f} songs per hour."
+    )
+
+    print(f"{'stage':>8} {'songs':>6} {'mean (s)':>9} {'busy':>6}")
+    for stage, stage_stats in stats["stages"].items():
+        count = stage_stats["count"]
+        mean = stage_stats["seconds"] / count if count else 0
+        busy = stage_stats["seconds"] / (seconds * workers[stage])
+        print(f"{stage:>8} {count:>6} {mean:>9.1f} {busy:>6.0%}")
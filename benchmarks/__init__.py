@@ -0,0 +1,4 @@
+"""
+Offline benchmarks for the hot paths of the pipeline. Run them from the project root, e.g.
+`python -m benchmarks.bench_matcher`.
+"""
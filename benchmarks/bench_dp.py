@@ -0,0 +1,123 @@
+"""
+Stress-tests the DP of `find_quote_matches` on lyrics up to the length of several full albums, against the DP it
+replaced. The old DP kept a full list of matches per token position and copied it for every candidate, so its
+time and memory grew quadratically with the lyrics, while the back-pointer DP grows linearly.
+"""
+
+from typing import List, Tuple
+from random import shuffle
+import random
+import tracemalloc
+import time
+
+from benchmarks.synthetic import make_quotes, make_lyrics
+from index import normalize_and_tokenize, build_index, find_candidates
+from matcher import _best_path
+
+
+def _list_dp(
+    matches_at: List[List[Tuple[int, int]]],
+) -> List[Tuple[int, int, int]]:
+    """
+    The DP `find_quote_matches` did before the back-pointer DP, with (position, length, quote_index) tuples
+    standing in for the Match objects it built.
+    """
+
+    n = len(matches_at)
+    dp_contig = [(i, 0, []) for i in range(n + 1)]
+
+    for k in range(n - 1, -1, -1):
+        shuffle(matches_at[k])
+        if not matches_at[k]:
+            continue
+
+        best_reach, best_segs, best_matches_list = k, 0, []
+        for length, q_idx in matches_at[k]:
+            next_reach, next_segs, next_matches = dp_contig[k + length]
+            if (next_reach > best_reach) or (
+                next_reach == best_reach
+                and (not best_matches_list or 1 + next_segs < best_segs)
+            ):
+                best_reach = next_reach
+                best_segs = 1 + next_segs
+                best_matches_list = [(k, length, q_idx)] + next_matches
+
+        dp_contig[k] = (best_reach, best_segs, best_matches_list)
+
+    best_cov, best_segs_overall, best_match_list_overall = 0, 0, []
+    for i in range(n):
+        reach_i, segs_i, matches_i = dp_contig[i]
+        if reach_i - i == 0:
+            continue
+        if (reach_i - i > best_cov) or (
+            reach_i - i == best_cov
+            and (not best_match_list_overall or segs_i < best_segs_overall)
+        ):
+            best_cov, best_segs_overall, best_match_list_overall = (
+                reach_i - i,
+                segs_i,
+                matches_i,
+            )
+
+    return best_match_list_overall
+
+
+def _measure(function, *args) -> Tuple[object, float, float]:
+    """
+    Returns the result of a call, its duration in seconds and its peak memory allocation in MiB,
+    measured in a second call so that tracing the allocations doesn't slow down the timed one.
+    """
+
+    start = time.perf_counter()
+    result = function(*args)
+    duration = time.perf_counter() - start
+
+    tracemalloc.start()
+    function(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, duration, peak / 2**20
+
+
+def main():
+    quotes = make_quotes(4000)
+    index = build_index(quotes)
+    rng = random.Random(0)
+
+    print(
+        f"{'tokens':>8} {'list (s)':>9} {'list (MiB)':>11} {'pointers (s)':>13}"
+        f" {'pointers (MiB)':>15} {'cover (s)':>10} {'covered':>8}"
+    )
+    # An album has around 4000 words of lyrics
+    for tokens in [1000, 4000, 16000, 32000]:
+        # Lyrics sung mostly in quotes, so that the runs of matches span the whole song,
+        # with a few synthetic lines in between that leave gaps
+        lines = []
+        while sum(len(line.split()) for line in lines) < tokens:
+            lines.append(
+                rng.choice(quotes).text
+                if rng.random() < 0.99
+                else make_lyrics(8, len(lines))
+            )
+        matches_at = find_candidates(index, normalize_and_tokenize("\n".join(lines)))
+        token_count = len(matches_at)
+
+        expected, list_time, list_memory = _measure(_list_dp, matches_at)
+        actual, pointer_time, pointer_memory = _measure(_best_path, matches_at)
+        cover, cover_time, _ = _measure(_best_path, matches_at, "cover")
+
+        # Candidates are shuffled, so only the coverage and segment count are deterministic
+        assert sum(length for _, length, _ in actual) == sum(
+            length for _, length, _ in expected
+        )
+        assert len(actual) == len(expected)
+
+        print(
+            f"{token_count:>8} {list_time:>9.3f} {list_memory:>11.1f} {pointer_time:>13.3f}"
+            f" {pointer_memory:>15.1f} {cover_time:>10.3f}"
+            f" {sum(length for _, length, _ in cover) / token_count:>7.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Compares mixing the stretched quotes with the Mixer against overlaying them one by one on an AudioSegment.
+Every overlay copies the whole accompaniment, so its cost per match grows with the song length, while the
+Mixer only touches the samples of each clip and scales linearly with the number of matches.
+"""
+
+import time
+
+from benchmarks.synthetic import make_clip
+from pcm import to_audio_segment
+from mixer import Mixer
+
+
+SAMPLE_RATE = 44100
+SONG_SECONDS = 240
+
+
+def main():
+    accompaniment = make_clip(SONG_SECONDS, SAMPLE_RATE, channels=2)
+    accompaniment_audio = to_audio_segment(accompaniment, SAMPLE_RATE)
+    clip = make_clip(0.8, SAMPLE_RATE, seed=1)
+    clip_audio = to_audio_segment(clip, SAMPLE_RATE)
+
+    print(
+        f"{'matches':>8} {'overlay (s)':>12} {'mixer (s)':>10} {'add / match (ms)':>17}"
+    )
+    for matches in [25, 50, 100, 200]:
+        positions = [i * (SONG_SECONDS - 1) * 1000 / matches for i in range(matches)]
+
+        start = time.perf_counter()
+        output = accompaniment_audio - 15
+        for position in positions:
+            output = output.overlay(clip_audio, position=position)
+        overlay_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        mixer = Mixer(accompaniment, SAMPLE_RATE, accompaniment_gain_db=-15)
+        add_start = time.perf_counter()
+        for position in positions:
+            mixer.add(clip, position)
+        add_time = time.perf_counter() - add_start
+        mixer.render()
+        mixer_time = time.perf_counter() - start
+
+        print(
+            f"{matches:>8} {overlay_time:>12.3f} {mixer_time:>10.4f}"
+            f" {add_time * 1000 / matches:>17.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Runs the scraper against the local stand-in wiki of `benchmarks.wiki_fixture`, offline. Every URL of the wiki fails
+once and every response is delayed, so a full scrape goes through the retries and gains from concurrent requests.
+A refresh of the scraped corpus then checks that unchanged audio isn't downloaded again, and that changed audio is.
+Transcoding the audio needs ffmpeg, like the scraper itself.
+"""
+
+from typing import List, Tuple
+import tempfile
+import time
+import os
+
+from benchmarks.wiki_fixture import FixtureWiki, make_ogg
+from quotes import get_all_quotes
+from models import Quote
+
+
+def _scrape(wiki: FixtureWiki, concurrency: int) -> Tuple[List[Quote], float]:
+    start = time.perf_counter()
+    quotes = get_all_quotes(
+        refresh=True,
+        wiki_url=wiki.url,
+        concurrency=concurrency,
+        transcode_workers=2,
+        min_interval=0,
+        retries=3,
+    )
+    return list(quotes), time.perf_counter() - start
+
+
+def main(concurrencies: List[int] = [1, 4, 16]):
+    print(
+        f"{'concurrency':>11} {'quotes':>7} {'requests':>9} {'retried':>8} {'at once':>8}"
+        f" {'scrape (s)':>11} {'refresh (s)':>12}"
+    )
+    for concurrency in concurrencies:
+        working_directory = os.getcwd()
+        with tempfile.TemporaryDirectory() as directory, FixtureWiki(
+            characters=4, quotes_per_character=25, latency_s=0.02, failures=1
+        ) as wiki:
+            # The scraper writes the corpus to data/ in the working directory
+            os.chdir(directory)
+            try:
+                quotes, scrape_seconds = _scrape(wiki, concurrency)
+                assert len(quotes) == wiki.quote_count
+                assert wiki.audio_downloads == wiki.quote_count
+                assert all(os.path.exists(quote.audio_path) for quote in quotes)
+                requests = sum(wiki.requests.values())
+                retried = requests - len(wiki.requests)
+                assert retried == len(wiki.requests)
+
+                refreshed, refresh_seconds = _scrape(wiki, concurrency)
+                assert len(refreshed) == wiki.quote_count
+                assert wiki.audio_downloads == wiki.quote_count
+
+                wiki.change_audio(make_ogg(400))
+                changed, _ = _scrape(wiki, concurrency)
+                assert len(changed) == wiki.quote_count
+                assert wiki.audio_downloads == 2 * wiki.quote_count
+            finally:
+                os.chdir(working_directory)
+
+        print(
+            f"{concurrency:>11} {len(quotes):>7} {requests:>9} {retried:>8} {wiki.max_concurrent:>8}"
+            f" {scrape_seconds:>11.2f} {refresh_seconds:>12.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Measures the cold start of every entry point: the time a fresh interpreter takes to import what the entry point
+needs, and the packages whose imports cost the most. Models and heavy libraries (TensorFlow, torch, librosa, the
+Genius and YouTube clients) are imported by the functions using them, so an entry point only pays for the ones it
+touches.
+"""
+
+from typing import Dict, Tuple
+import subprocess
+import statistics
+import time
+import sys
+import os
+
+
+# Every entry point and the code its cold start runs
+ENTRY_POINTS: Dict[str, str] = {
+    "corpus": "from quotes import get_all_quotes",
+    "matcher": "from matcher import find_cover_plans",
+    "pipeline": "import pipeline",
+    "batch": "import batch",
+    "server": "import server",
+    "cli": "import runpy, sys; sys.argv = ['__main__.py', '--help']; runpy.run_path('__main__.py')",
+}
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _cold_start(code: str) -> Tuple[float, Dict[str, int]]:
+    """
+    Runs code in a fresh interpreter and returns its wall time in seconds, and the import time in microseconds
+    of every package, the modules of the project each being one.
+    """
+
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    duration = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    packages: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        own, _, name = line[len("import time:") :].split("|")
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(own)
+
+    return duration, packages
+
+
+def main(repeat: int = 5):
+    print(f"{'entry point':<12} {'cold start (s)':>15}  slowest packages")
+    for name, code in ENTRY_POINTS.items():
+        try:
+            runs = [_cold_start(code) for _ in range(repeat)]
+        except RuntimeError as e:
+            print(f"{name:<12} {'failed':>15}  {e}")
+            continue
+
+        duration = statistics.median(duration for duration, _ in runs)
+        packages = runs[-1][1]
+        slowest = sorted(packages, key=packages.get, reverse=True)[:4]
+        print(
+            f"{name:<12} {duration:>15.3f}  "
+            + ", ".join(
+                f"{package} {packages[package] / 1e6:.2f}s" for package in slowest
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+Measures the throughput and the peak memory of the hot paths of a render across several sizes, offline: matching
+lyrics with the quotes, looking up the timestamps of the matches in the aligned lyrics, stretching the clips of the
+matches and mixing them. The corpus, the lyrics and the audio are synthetic, and so are the word timings and the
+stems these stages take (see `benchmarks.synthetic`): the aligner and the separator themselves aren't measured.
+Synthetic quotes have no audio files, so they're matched without word timings. Cases whose dependencies aren't
+installed (e.g. librosa for the phase vocoder) are skipped with a notice.
+
+Results are compared with the baselines stored in baselines.json, and a case that got slower or bigger than the
+tolerance fails the run. Baselines depend on the machine, so store your own before comparing:
+
+    python -m benchmarks.suite --save
+    python -m benchmarks.suite --only match timestamps
+"""
+
+from typing import Callable, Dict, List, Tuple
+import tempfile
+import argparse
+import random
+import tracemalloc
+import json
+import time
+import sys
+import os
+
+from benchmarks.synthetic import (
+    fake_align,
+    fake_separate,
+    make_clip,
+    make_quote_clips,
+    make_quote_lyrics,
+    make_quotes,
+)
+from index import load_matcher_corpus, normalize_and_tokenize
+from matcher import find_quote_matches
+from align import lyric_word_indexes, spans_timestamps
+from stretch import stretch_batch
+from pcm import SAMPLE_RATE
+from mixer import Mixer
+
+
+BASELINES_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+
+# The index files of the synthetic corpora, kept away from the index of the real corpus
+_INDEX_DIR = tempfile.mkdtemp(prefix="ow2-sing-bench-")
+
+# The corpus the timestamp case takes its matches from
+_CORPUS_SIZE = 4000
+
+
+def _match_case(quote_count: int) -> Tuple[int, Callable]:
+    quotes = make_quotes(quote_count)
+    lyrics = make_quote_lyrics(quotes, 1000)
+    load_matcher_corpus(
+        quotes, "english", os.path.join(_INDEX_DIR, f"{quote_count}.json")
+    )
+    return len(normalize_and_tokenize(lyrics)), lambda: find_quote_matches(
+        lyrics, quotes, with_audio=False, objective="cover", require_timings=False
+    )
+
+
+def _timestamps_case(word_count: int) -> Tuple[int, Callable]:
+    quotes = make_quotes(_CORPUS_SIZE)
+    lyrics = make_quote_lyrics(quotes, word_count)
+    load_matcher_corpus(
+        quotes, "english", os.path.join(_INDEX_DIR, f"{_CORPUS_SIZE}.json")
+    )
+    words = fake_align(lyrics, word_count / 2)
+    spans = [
+        (match.position, len(match.quote_segment.split()))
+        for match in find_quote_matches(
+            lyrics, quotes, with_audio=False, objective="cover", require_timings=False
+        )
+    ]
+    return len(words), lambda: spans_timestamps(
+        words, lyric_word_indexes(lyrics), spans
+    )
+
+
+def _stretch_case(mode: str) -> Callable[[int], Tuple[int, Callable]]:
+    def case(clip_count: int) -> Tuple[int, Callable]:
+        rng = random.Random(0)
+        clips = list(make_quote_clips(make_quotes(clip_count), SAMPLE_RATE).values())
+        targets = [
+            len(clip) * 1000 / SAMPLE_RATE * rng.uniform(0.7, 1.4) for clip in clips
+        ]
+        return clip_count, lambda: stretch_batch(
+            clips, targets, SAMPLE_RATE, mode, workers=1
+        )
+
+    return case
+
+
+def _mix_case(match_count: int) -> Tuple[int, Callable]:
+    song_seconds = 240
+    accompaniment = fake_separate(make_clip(song_seconds, SAMPLE_RATE, channels=2))[
+        "accompaniment"
+    ]
+    clips = list(make_quote_clips(make_quotes(match_count), SAMPLE_RATE).values())
+    positions = [
+        i * (song_seconds - 1) * 1000 / match_count for i in range(match_count)
+    ]
+
+    def mix():
+        mixer = Mixer(accompaniment, SAMPLE_RATE, accompaniment_gain_db=-15)
+        for clip, position in zip(clips, positions):
+            mixer.add(clip, position)
+        return mixer.render()
+
+    return match_count, mix
+
+
+# Every case: how it's set up for a size, the sizes it runs at, what the sizes count and what its throughput counts
+CASES: Dict[str, Tuple[Callable[[int], Tuple[int, Callable]], List[int], str, str]] = {
+    "match": (_match_case, [1000, 4000, 16000], "quotes", "tokens"),
+    "timestamps": (_timestamps_case, [500, 2000, 8000], "words", "words"),
+    "stretch-fast": (_stretch_case("fast"), [25, 100], "clips", "clips"),
+    "stretch-quality": (_stretch_case("quality"), [25, 100], "clips", "clips"),
+    "mix": (_mix_case, [50, 200, 800], "matches", "matches"),
+}
+
+
+def _measure(function: Callable, repeat: int) -> Tuple[float, float]:
+    """
+    Returns the shortest duration of `repeat` calls in seconds, and the peak memory allocation of a call in MiB,
+    measured in a separate call so that tracing the allocations doesn't slow down the timed ones.
+    """
+
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(durations), peak / 2**20
+
+
+def run(
+    cases: List[str],
+    baselines: Dict[str, Dict[str, float]],
+    tolerance: float,
+    repeat: int,
+) -> Tuple[Dict[str, Dict[str, float]], List[str]]:
+    """
+    Runs the given cases at all their sizes and prints their results next to their baselines.
+
+    Args:
+        cases (List[str]): The names of the cases to run.
+        baselines (Dict[str, Dict[str, float]]): The stored results, by case and size (e.g. "match/4000").
+        tolerance (float): The ratio to its baseline a duration or a peak memory may reach before it's a regression.
+        repeat (int): The number of timed calls of every case, the fastest one counts.
+
+    Returns:
+        Tuple[Dict[str, Dict[str, float]], List[str]]: The results of this run, by case and size, and the
+            cases and sizes that regressed.
+    """
+
+    print(
+        f"{'case':<16} {'size':>14} {'time (s)':>9} {'per second':>16} {'peak (MiB)':>11}"
+        f" {'time':>6} {'memory':>7}"
+    )
+
+    results = {}
+    regressions = []
+    for name in cases:
+        setup, sizes, size_unit, throughput_unit = CASES[name]
+        for size in sizes:
+            key = f"{name}/{size}"
+            try:
+                work, function = setup(size)
+                seconds, peak_mib = _measure(function, repeat)
+            except ModuleNotFoundError as e:
+                print(f"{name:<16} skipped, {e.name} isn't installed")
+                break
+            results[key] = {"seconds": seconds, "peak_mib": peak_mib}
+
+            baseline = baselines.get(key)
+            if baseline:
+                time_ratio = seconds / baseline["seconds"]
+                memory_ratio = peak_mib / max(baseline["peak_mib"], 0.01)
+                if time_ratio > tolerance or memory_ratio > tolerance:
+                    regressions.append(key)
+                ratios = f"{time_ratio:>5.2f}x {memory_ratio:>6.2f}x"
+            else:
+                ratios = f"{'-':>6} {'-':>7}"
+
+            print(
+                f"{name:<16} {f'{size} {size_unit}':>14} {seconds:>9.4f}"
+                f" {f'{work / seconds:.0f} {throughput_unit}':>16} {peak_mib:>11.1f} {ratios}"
+            )
+
+    return results, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the hot paths of a render against stored baselines."
+    )
+    parser.add_argument(
+        "--only", nargs="+", choices=list(CASES), help="cases to run (default: all)"
+    )
+    parser.add_argument(
+        "--save", action="store_true", help="store the results as the new baselines"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1.5,
+        help="ratio to the baseline above which a case regressed",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="timed calls per case, the fastest counts"
+    )
+    args = parser.parse_args()
+
+    baselines = {}
+    if os.path.exists(BASELINES_PATH):
+        with open(BASELINES_PATH, "r") as file:
+            baselines = json.load(file)
+
+    results, regressions = run(
+        args.only or list(CASES), baselines, args.tolerance, args.repeat
+    )
+
+    if args.save:
+        with open(BASELINES_PATH, "w") as file:
+            json.dump({**baselines, **results}, file, indent=2, sort_keys=True)
+        print(f"Stored {len(results)} baselines in {BASELINES_PATH}.")
+    elif regressions:
+        print(f"Regressed: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
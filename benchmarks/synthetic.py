@@ -0,0 +1,173 @@
+"""
+This module generates synthetic quote corpora, lyrics and audio for the benchmarks, and the word timings and stems
+the models would make of them, so that the benchmarks run offline.
+"""
+
+from typing import Dict, List
+import random
+
+import numpy as np
+
+from align import _transcript_words
+from timings import WordTiming
+from models import Quote
+
+
+_VOCABULARY = (
+    "i you we they me my your our the a an to of in on for with without and but or not "
+    "never always now here there what who why how this that it life love die dark light "
+    "wake up save call name inside bring heart time world fight hero stand fall run home "
+    "night day fire ice stone hope fear dream eyes hands voice soul sleep nothing something"
+).split() + [f"word{i}" for i in range(5000)]
+
+# Word frequencies follow Zipf's law, like in real speech
+_WEIGHTS = [1 / (rank + 1) for rank in range(len(_VOCABULARY))]
+
+
+def make_quotes(count: int, seed: int = 0) -> List[Quote]:
+    """
+    Generates a synthetic corpus of quotes with short random texts.
+
+    Args:
+        count (int): The number of quotes to generate.
+        seed (int): The random seed.
+
+    Returns:
+        List[Quote]: The generated quotes.
+    """
+
+    rng = random.Random(seed)
+    return [
+        Quote(
+            id=f"Synthetic{i + 1}",
+            character=f"Character{i % 40}",
+            character_picture="",
+            text=" ".join(rng.choices(_VOCABULARY, _WEIGHTS, k=rng.randint(2, 12))),
+            audio_url=f"https://example.com/Synthetic{i + 1}.ogg",
+            audio_path=f"data/audios/Synthetic{i + 1}.mp3",
+            language="english",
+        )
+        for i in range(count)
+    ]
+
+
+def make_lyrics(token_count: int, seed: int = 0) -> str:
+    """
+    Generates synthetic lyrics with a line break every eight words.
+
+    Args:
+        token_count (int): The number of words in the lyrics.
+        seed (int): The random seed.
+
+    Returns:
+        str: The generated lyrics.
+    """
+
+    rng = random.Random(seed)
+    words = rng.choices(_VOCABULARY, _WEIGHTS, k=token_count)
+    return "\n".join(" ".join(words[i : i + 8]) for i in range(0, token_count, 8))
+
+
+def make_quote_lyrics(quotes: List[Quote], token_count: int, seed: int = 0) -> str:
+    """
+    Generates lyrics sung mostly in quotes, one quote per line, with a synthetic line every tenth line, so that
+    the matcher finds long runs of matches with a few gaps between them.
+
+    Args:
+        quotes (List[Quote]): The quotes to take lines from.
+        token_count (int): The minimum number of words in the lyrics.
+        seed (int): The random seed.
+
+    Returns:
+        str: The generated lyrics.
+    """
+
+    rng = random.Random(seed)
+    lines = []
+    words = 0
+    while words < token_count:
+        line = (
+            rng.choice(quotes).text
+            if rng.random() < 0.9
+            else make_lyrics(8, rng.randrange(2**32))
+        )
+        lines.append(line)
+        words += len(line.split())
+    return "\n".join(lines)
+
+
+def make_clip(
+    duration_s: float, sample_rate: int, channels: int = 1, seed: int = 0
+) -> np.ndarray:
+    """
+    Generates a clip of a sine tone with some noise, standing in for a voice line or a song.
+
+    Args:
+        duration_s (float): The duration of the clip in seconds.
+        sample_rate (int): The sample rate of the clip.
+        channels (int): The number of channels of the clip.
+        seed (int): The random seed.
+
+    Returns:
+        np.ndarray: The float32 samples of the clip, of shape (channels, n_frames).
+    """
+
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration_s * sample_rate)) / sample_rate
+    tone = 0.3 * np.sin(2 * np.pi * rng.uniform(100, 400) * t)
+    noise = 0.05 * rng.standard_normal((channels, len(t)))
+    return (tone + noise).astype(np.float32)
+
+
+def make_quote_clips(quotes: List[Quote], sample_rate: int) -> Dict[str, np.ndarray]:
+    """
+    Generates a mono clip for every quote, a third of a second per word.
+
+    Args:
+        quotes (List[Quote]): The quotes to generate clips for.
+        sample_rate (int): The sample rate of the clips.
+
+    Returns:
+        Dict[str, np.ndarray]: The float32 samples of every quote's clip, of shape (n_frames,), by quote id.
+    """
+
+    return {
+        quote.id: make_clip(len(quote.text.split()) / 3, sample_rate, seed=i)[0]
+        for i, quote in enumerate(quotes)
+    }
+
+
+def fake_align(lyrics: str, duration_s: float) -> List[WordTiming]:
+    """
+    Generates word timings shaped like the output of `align.align_song_words`, without running the aligner: the
+    words of the lyrics are spread evenly over the song, like the aligner does with the words of a part it fails
+    to align.
+
+    Args:
+        lyrics (str): The lyrics of the song.
+        duration_s (float): The duration of the song in seconds.
+
+    Returns:
+        List[WordTiming]: The timings of the words of the lyrics.
+    """
+
+    words = _transcript_words(lyrics)
+    step = duration_s / max(1, len(words))
+    return [(word, i * step, (i + 1) * step) for i, word in enumerate(words)]
+
+
+def fake_separate(song: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Generates stems shaped like the output of `separator.separate_waveforms`, without running the separator: the
+    centre of a stereo song stands for its vocals and the rest for its accompaniment. The stems are laid out like
+    the Mixer takes them, channels first.
+
+    Args:
+        song (np.ndarray): The float32 samples of the song, of shape (channels, n_frames).
+
+    Returns:
+        Dict[str, np.ndarray]: The "vocals" and "accompaniment" stems, of the same shape as the song.
+    """
+
+    vocals = np.broadcast_to(song.mean(axis=0), song.shape)
+    return {"vocals": vocals.copy(), "accompaniment": song - vocals}
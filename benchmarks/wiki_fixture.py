@@ -0,0 +1,184 @@
+"""
+This module contains a local stand-in for the Overwatch wiki: an HTTP server serving fixture quote pages, character
+pages, images and quote audio in the layout the scraper expects, so that the scraper can be run offline. The server
+can delay its responses and fail the first requests of every URL, and it counts the requests it gets, so that the
+concurrent downloads, the retries and the conditional requests of a refresh can be checked.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote as url_quote, unquote, urlparse
+from typing import Dict
+from io import BytesIO
+import threading
+import hashlib
+import time
+
+from pydub.generators import Sine
+
+
+def make_ogg(duration_ms: int = 300) -> bytes:
+    """
+    Encodes a short tone as OGG, the format of the quote audio on the wiki.
+    """
+
+    file = BytesIO()
+    Sine(440).to_audio_segment(duration=duration_ms).export(file, format="ogg")
+    return file.getvalue()
+
+
+class FixtureWiki:
+    """
+    A fixture wiki served on a free local port, e.g.:
+
+        with FixtureWiki(characters=4, quotes_per_character=25, failures=1) as wiki:
+            get_all_quotes(refresh=True, wiki_url=wiki.url)
+    """
+
+    def __init__(
+        self,
+        characters: int = 4,
+        quotes_per_character: int = 25,
+        latency_s: float = 0,
+        failures: int = 0,
+        audio: bytes | None = None,
+    ):
+        """
+        Args:
+            characters (int): The number of characters with a quotes page.
+            quotes_per_character (int): The number of quotes on every quotes page.
+            latency_s (float): The time every response is delayed by, in seconds.
+            failures (int): The number of times every URL answers 503 before it's served.
+            audio (bytes | None): The OGG content of every quote, a short tone by default.
+        """
+
+        self.latency_s = latency_s
+        self.failures = failures
+        self.audio = audio if audio is not None else make_ogg()
+
+        self.names = [f"Fixture{i}" for i in range(characters)]
+        self.texts = {
+            name: [f"Line number {j} of {name}" for j in range(quotes_per_character)]
+            for name in self.names
+        }
+
+        # The requests of every path, the successful audio downloads, and the most requests served at once
+        self.requests: Dict[str, int] = {}
+        self.audio_downloads = 0
+        self.max_concurrent = 0
+        self._concurrent = 0
+        self._lock = threading.Lock()
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def __enter__(self) -> "FixtureWiki":
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+        return False
+
+    def audio_path(self, name: str, text: str) -> str:
+        """
+        Returns the path of the audio of a quote, laid out like the wiki's: the file name, which holds the
+        character name and the quote text, is the third part from the end.
+        """
+
+        file_name = url_quote(f"{name}_-_{text.replace(' ', '_')}.ogg")
+        return f"/images/0/00/{file_name}/revision/latest"
+
+    def change_audio(self, audio: bytes):
+        """
+        Replaces the audio of every quote, so that a refresh downloads it again.
+        """
+
+        self.audio = audio
+
+    def _page(self, path: str) -> str | None:
+        if path == "/wiki/Category:Quotations":
+            links = "".join(
+                f'<li><a href="/wiki/{name}/Quotes">{name}/Quotes</a></li>'
+                for name in self.names
+            )
+            return f'<div class="mw-category-group"><ul>{links}</ul></div>'
+
+        for name in self.names:
+            if path == f"/wiki/{name}/Quotes":
+                sources = "".join(
+                    f'<audio><source src="{self.url}{self.audio_path(name, text)}"></audio>'
+                    for text in self.texts[name]
+                )
+                return f'<span class="mw-page-title-main">{name}/Quotes</span>{sources}'
+            if path == f"/wiki/{name}":
+                return f'<table class="infoboxtable"><tr><td><img src="{self.url}/images/{name}.png"></td></tr></table>'
+
+        return None
+
+    def _handler(self) -> type:
+        wiki = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body: bytes, headers: Dict[str, str]):
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                path = urlparse(self.path).path
+                with wiki._lock:
+                    wiki.requests[path] = wiki.requests.get(path, 0) + 1
+                    attempt = wiki.requests[path]
+                    wiki._concurrent += 1
+                    wiki.max_concurrent = max(wiki.max_concurrent, wiki._concurrent)
+
+                try:
+                    time.sleep(wiki.latency_s)
+                    if attempt <= wiki.failures:
+                        return self._send(503, b"Try again later", {})
+
+                    if path.endswith("/revision/latest"):
+                        audio = wiki.audio
+                        etag = f'"{hashlib.sha1(audio).hexdigest()}"'
+                        if self.headers.get("If-None-Match") == etag:
+                            return self._send(304, b"", {"ETag": etag})
+                        with wiki._lock:
+                            wiki.audio_downloads += 1
+                        return self._send(
+                            200, audio, {"Content-Type": "audio/ogg", "ETag": etag}
+                        )
+
+                    if path.startswith("/images/"):
+                        return self._send(
+                            200, b"\x89PNG", {"Content-Type": "image/png"}
+                        )
+
+                    page = wiki._page(unquote(path))
+                    if page is None:
+                        return self._send(404, b"Not found", {})
+                    return self._send(
+                        200,
+                        f"<html><body>{page}</body></html>".encode(),
+                        {"Content-Type": "text/html; charset=utf-8"},
+                    )
+                finally:
+                    with wiki._lock:
+                        wiki._concurrent -= 1
+
+        return Handler
+
+    @property
+    def quote_count(self) -> int:
+        """
+        The number of quotes on the wiki.
+        """
+
+        return sum(len(texts) for texts in self.texts.values())
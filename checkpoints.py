@@ -0,0 +1,202 @@
+"""
+This module caches the outputs of the pipeline stages, keyed by the content of their inputs, so that
+re-running the pipeline only recomputes the stages whose inputs changed.
+"""
+
+from typing import Any, Callable, Dict, List, Set
+import hashlib
+import shutil
+import json
+import time
+import uuid
+import os
+
+
+CHECKPOINTS_DIR = "data/cache/stages"
+
+
+class _Uncached(Exception):
+    """
+    Carries a stage output that isn't cached out of the stage's workspace.
+    """
+
+    def __init__(self, value: Any):
+        self.value = value
+
+
+# Pins not renewed for this long, in seconds, are left over from a job that didn't finish and are ignored
+_PIN_TTL_S = 24 * 3600
+
+
+class Checkpoints:
+    """
+    A content-addressed store of stage outputs. Every entry is a directory named after the stage and a hash
+    of the stage's inputs. Stages write their outputs to a private workspace first, which is moved in place
+    only once the stage succeeded, so concurrent jobs never see partial outputs. Least recently used entries
+    are evicted when the store grows past its size limit, except the entries pinned by unfinished jobs.
+    """
+
+    def __init__(
+        self,
+        root: str = CHECKPOINTS_DIR,
+        max_bytes: int = 5 * 2**30,
+        pin: str | None = None,
+    ):
+        """
+        Args:
+            root (str): The directory of the store.
+            max_bytes (int): The size the store is kept under by evicting entries.
+            pin (str | None): The id of the job the entries used through this object are pinned for, which keeps
+                them from being evicted, by any process, until `unpin` is called with it.
+        """
+
+        self.root = root
+        self.max_bytes = max_bytes
+        self.pin = pin
+        os.makedirs(os.path.join(root, "workspaces"), exist_ok=True)
+        os.makedirs(os.path.join(root, "pins"), exist_ok=True)
+
+    def _pin_entry(self, entry: str):
+        # Entries are pinned before they are produced, so another job can't evict them in the meantime
+        with open(os.path.join(self.root, "pins", self.pin), "a") as file:
+            file.write(f"{os.path.basename(entry)}\n")
+
+    def _pinned(self) -> Set[str]:
+        pinned: Set[str] = set()
+        directory = os.path.join(self.root, "pins")
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            try:
+                if time.time() - os.path.getmtime(path) > _PIN_TTL_S:
+                    os.remove(path)
+                    continue
+                with open(path, "r") as file:
+                    pinned.update(file.read().split())
+            except OSError:
+                # The job finished in the meantime
+                continue
+        return pinned
+
+    def unpin(self, pin: str):
+        """
+        Releases the entries pinned for a job, once it's finished.
+
+        Args:
+            pin (str): The id of the job.
+        """
+
+        try:
+            os.remove(os.path.join(self.root, "pins", pin))
+        except FileNotFoundError:
+            pass
+
+    def _entry(self, stage: str, inputs: Dict[str, Any]) -> str:
+        key = hashlib.sha1(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+        return os.path.join(self.root, f"{stage}-{key}")
+
+    def _run(self, entry: str, produce: Callable[[str], None]):
+        workspace = os.path.join(self.root, "workspaces", uuid.uuid4().hex)
+        os.makedirs(workspace)
+        try:
+            produce(workspace)
+            try:
+                os.rename(workspace, entry)
+            except OSError:
+                # Another job produced the same entry in the meantime
+                pass
+        finally:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+        self._evict(keep=entry)
+
+    def _evict(self, keep: str):
+        pinned = self._pinned()
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name in ("workspaces", "pins") or name in pinned or path == keep:
+                continue
+            size = sum(
+                os.path.getsize(os.path.join(directory, file))
+                for directory, _, files in os.walk(path)
+                for file in files
+            )
+            entries.append((os.path.getmtime(path), size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def files(
+        self,
+        stage: str,
+        inputs: Dict[str, Any],
+        names: List[str],
+        produce: Callable[[str], None],
+    ) -> Dict[str, str]:
+        """
+        Returns the output files of a stage, running it only if they aren't cached for these inputs.
+
+        Args:
+            stage (str): The name of the stage.
+            inputs (Dict[str, Any]): Everything the outputs depend on, JSON serializable (e.g. hashes and parameters).
+            names (List[str]): The names of the files the stage outputs.
+            produce (Callable[[str], None]): Runs the stage, writing the named files to the given directory.
+
+        Returns:
+            Dict[str, str]: The paths of the cached output files by name.
+        """
+
+        entry = self._entry(stage, inputs)
+        if self.pin is not None:
+            self._pin_entry(entry)
+        if not all(os.path.exists(os.path.join(entry, name)) for name in names):
+            shutil.rmtree(entry, ignore_errors=True)
+            self._run(entry, produce)
+        else:
+            os.utime(entry)
+
+        return {name: os.path.join(entry, name) for name in names}
+
+    def value(
+        self,
+        stage: str,
+        inputs: Dict[str, Any],
+        produce: Callable[[], Any],
+        cache_if: Callable[[Any], bool] | None = None,
+    ) -> Any:
+        """
+        Returns the output value of a stage, running it only if it isn't cached for these inputs.
+
+        Args:
+            stage (str): The name of the stage.
+            inputs (Dict[str, Any]): Everything the output depends on, JSON serializable (e.g. hashes and parameters).
+            produce (Callable[[], Any]): Runs the stage and returns its JSON serializable output.
+            cache_if (Callable[[Any], bool] | None): Whether an output is cached, e.g. not when a lookup found
+                nothing, so that the stage runs again next time. Cached outputs it rejects are dropped.
+
+        Returns:
+            Any: The output of the stage, as it was deserialized from JSON.
+        """
+
+        def produce_file(directory: str):
+            value = produce()
+            if cache_if is not None and not cache_if(value):
+                raise _Uncached(value)
+            with open(os.path.join(directory, "value.json"), "w") as file:
+                json.dump(value, file)
+
+        try:
+            path = self.files(stage, inputs, ["value.json"], produce_file)["value.json"]
+        except _Uncached as uncached:
+            return uncached.value
+
+        with open(path, "r") as file:
+            value = json.load(file)
+        if cache_if is not None and not cache_if(value):
+            shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+            return self.value(stage, inputs, produce, cache_if)
+        return value
@@ -0,0 +1,293 @@
+"""
+This module contains the acoustic feature table: the loudness, pitch and silences of every word of every aligned quote,
+computed once from its audio and stored next to the corpus, so that voice lines can be ranked and mixed by how they
+sound without decoding them again.
+"""
+
+from typing import Dict, List, Sequence
+import os
+
+import numpy as np
+
+from pcm import SAMPLE_RATE, decode, file_version, get_bank
+from timings import WordTiming, get_timings, timings_audio_version
+from models import Quote
+
+
+FEATURES_PATH = "data/quote_features.npz"
+
+# The columns of the table, which has a row for every word of every aligned quote
+COLUMNS = [
+    "start_s",
+    "end_s",
+    "rms_db",
+    "f0_hz",
+    "leading_silence_s",
+    "trailing_silence_s",
+]
+
+# Frame length, in seconds, of the loudness and pitch analysis
+_FRAME_S = 0.02
+# The loudness, relative to the loudest frame of a quote, below which a frame is silent
+_SILENCE_DB = -35
+
+_table: "FeatureTable | None" = None
+
+
+def _word_features(samples: np.ndarray, words: List[WordTiming]) -> np.ndarray:
+    """
+    Computes the features of every word of a quote: its RMS loudness in dBFS, its median pitch (NaN if the word
+    has no sound) and the silence before and after its sound within its timing.
+
+    Args:
+        samples (np.ndarray): The float32 mono samples of the quote at pcm.SAMPLE_RATE.
+        words (List[WordTiming]): The word timings of the quote.
+
+    Returns:
+        np.ndarray: The float32 rows of the words, with the columns of COLUMNS.
+    """
+
+    # librosa takes around a second to import, so it's only imported when features are computed
+    import librosa
+
+    hop = int(_FRAME_S * SAMPLE_RATE)
+    frame_count = len(samples) // hop
+    frames = samples[: frame_count * hop].reshape(frame_count, hop)
+    frame_db = 10 * np.log10(np.mean(frames**2, axis=1) + 1e-10)
+    voiced = frame_db > frame_db.max(initial=-100) + _SILENCE_DB
+
+    f0 = np.full(frame_count, np.nan)
+    if len(samples) >= 2048:
+        f0[:] = librosa.yin(
+            samples, fmin=65, fmax=1000, sr=SAMPLE_RATE, hop_length=hop
+        )[:frame_count]
+
+    rows = np.zeros((len(words), len(COLUMNS)), dtype=np.float32)
+    for i, (_, start, end) in enumerate(words):
+        span = samples[int(start * SAMPLE_RATE) : int(end * SAMPLE_RATE)]
+        first_frame = min(frame_count, int(start / _FRAME_S))
+        last_frame = min(
+            frame_count, max(first_frame + 1, int(np.ceil(end / _FRAME_S)))
+        )
+        word_voiced = voiced[first_frame:last_frame]
+
+        rms_db = 10 * np.log10(np.mean(span**2) + 1e-10) if len(span) else -100
+        rows[i] = start, end, rms_db, np.nan, 0, 0
+
+        # Pitch and silences are only measured in words with sound
+        if word_voiced.any():
+            rows[i, 3] = np.median(f0[first_frame:last_frame][word_voiced])
+            rows[i, 4] = min(end - start, np.argmax(word_voiced) * _FRAME_S)
+            rows[i, 5] = min(end - start, np.argmax(word_voiced[::-1]) * _FRAME_S)
+
+    return rows
+
+
+def compute_features(quotes: Sequence[Quote], path: str = FEATURES_PATH) -> int:
+    """
+    Computes the features of every aligned quote and writes the feature table, replacing the previous one. The rows
+    of quotes whose audio and word timings didn't change are taken from the previous table. Audio is read from the
+    PCM bank if it's packed, quotes without word timings (see `align.align_corpus`) are skipped.
+
+    Args:
+        quotes (Sequence[Quote]): All quotes of the corpus.
+        path (str): The path of the feature table.
+
+    Returns:
+        int: The number of quotes whose features were computed.
+    """
+
+    global _table
+
+    previous = FeatureTable(path) if os.path.exists(path) else None
+    bank = get_bank()
+
+    ids, versions, offsets, rows = [], [], [0], []
+    computed = 0
+    for quote in quotes:
+        words = get_timings(quote)
+        if words is None:
+            continue
+
+        quote_rows = (
+            previous.quote_rows(quote.id)
+            if previous is not None and quote in previous
+            else None
+        )
+        if quote_rows is None or len(quote_rows) != len(words):
+            try:
+                samples = (
+                    np.array(bank.samples(quote.audio_path))
+                    if bank is not None and quote.audio_path in bank
+                    else decode(quote.audio_path)
+                )
+                quote_rows = _word_features(samples, words)
+            except Exception as e:
+                print(f"Error computing the features of quote {quote.id}: {e}")
+                print("Continuing with the next quote...")
+                continue
+            computed += 1
+
+        ids.append(quote.id)
+        versions.append(file_version(quote.audio_path))
+        offsets.append(offsets[-1] + len(quote_rows))
+        rows.append(quote_rows)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(f"{path}.tmp", "wb") as file:
+        np.savez(
+            file,
+            ids=np.array(ids, dtype=str),
+            versions=np.array(versions, dtype=np.int64).reshape(-1, 2),
+            offsets=np.array(offsets, dtype=np.int64),
+            words=(
+                np.concatenate(rows)
+                if rows
+                else np.zeros((0, len(COLUMNS)), dtype=np.float32)
+            ),
+        )
+    os.replace(f"{path}.tmp", path)
+
+    _table = None
+    return computed
+
+
+class FeatureTable:
+    """
+    The feature table, held in memory. The features of segments (runs of words of a quote) are computed for many
+    segments at once from prefix sums over the words, without any loop over the segments.
+    """
+
+    def __init__(self, path: str = FEATURES_PATH):
+        with np.load(path) as data:
+            self.words: np.ndarray = data["words"]
+            self._offsets: np.ndarray = data["offsets"]
+            self._versions: np.ndarray = data["versions"]
+            self._rows: Dict[str, int] = {
+                id: row for row, id in enumerate(data["ids"].tolist())
+            }
+
+        start, end, rms_db, f0 = (self.words[:, i].astype(np.float64) for i in range(4))
+        duration = end - start
+        voiced = ~np.isnan(f0)
+        self._duration = np.concatenate([[0], np.cumsum(duration)])
+        self._energy = np.concatenate([[0], np.cumsum(10 ** (rms_db / 10) * duration)])
+        self._voiced = np.concatenate([[0], np.cumsum(np.where(voiced, duration, 0))])
+        # Words without sound have a log pitch of 0 and count for no duration of sound
+        log_f0 = np.log2(np.where(voiced, f0, 1))
+        self._log_f0 = np.concatenate([[0], np.cumsum(log_f0 * duration)])
+
+    def __contains__(self, quote: Quote) -> bool:
+        """
+        Checks whether a quote is in the table and its audio hasn't changed since its features were computed.
+        """
+
+        row = self._rows.get(quote.id)
+        return (
+            row is not None
+            and os.path.exists(quote.audio_path)
+            and self._versions[row].tolist() == file_version(quote.audio_path)
+        )
+
+    def rows(self, quotes: Sequence[Quote], last_words: Sequence[int]) -> np.ndarray:
+        """
+        Finds the rows of quotes in the table without reading their audio: a quote's features are used if they were
+        computed from the audio its word timings were aligned with (which the matcher checks, see
+        `matcher._aligned_candidates`).
+
+        Args:
+            quotes (Sequence[Quote]): The quotes to find.
+            last_words (Sequence[int]): The index of the last word of every quote that's used.
+
+        Returns:
+            np.ndarray: The row of every quote, or -1 if it isn't in the table, its features are older than its
+                word timings or it has fewer words.
+        """
+
+        if not self._rows:
+            return np.full(len(quotes), -1, dtype=np.int64)
+
+        rows = np.array(
+            [self._rows.get(quote.id, -1) for quote in quotes], dtype=np.int64
+        )
+        versions = np.array(
+            [timings_audio_version(quote.id) or [-1, -1] for quote in quotes],
+            dtype=np.int64,
+        ).reshape(-1, 2)
+
+        found = rows >= 0
+        found &= np.all(self._versions[rows] == versions, axis=1)
+        found &= np.asarray(last_words, dtype=np.int64) < np.diff(self._offsets)[rows]
+        return np.where(found, rows, -1)
+
+    def quote_rows(self, quote_id: str) -> np.ndarray | None:
+        """
+        Returns the rows of the words of a quote, or None if the quote isn't in the table.
+        """
+
+        row = self._rows.get(quote_id)
+        if row is None:
+            return None
+        return self.words[self._offsets[row] : self._offsets[row + 1]]
+
+    def segments(
+        self, rows: np.ndarray, first_words: List[int], last_words: List[int]
+    ) -> Dict[str, np.ndarray]:
+        """
+        Returns the features of segments of quotes, which must be in the table.
+
+        Args:
+            rows (np.ndarray): The row of the quote of every segment, see `rows`.
+            first_words (List[int]): The index of the first word of every segment in its quote.
+            last_words (List[int]): The index of the last word of every segment in its quote.
+
+        Returns:
+            Dict[str, np.ndarray]: For every segment, its "duration_s", its "rms_db" loudness, its typical pitch
+                "f0_hz" (the mean of the pitch of its words on a log scale, NaN if it has no sound), and the
+                "leading_silence_s" and "trailing_silence_s" at its ends.
+        """
+
+        offsets = self._offsets[rows]
+        first = offsets + np.asarray(first_words, dtype=np.int64)
+        last = offsets + np.asarray(last_words, dtype=np.int64)
+
+        duration = self._duration[last + 1] - self._duration[first]
+        energy = self._energy[last + 1] - self._energy[first]
+        voiced = self._voiced[last + 1] - self._voiced[first]
+        log_f0 = self._log_f0[last + 1] - self._log_f0[first]
+
+        return {
+            "duration_s": self.words[last, 1] - self.words[first, 0],
+            "rms_db": 10 * np.log10(energy / np.maximum(duration, 1e-9) + 1e-10),
+            "f0_hz": np.where(
+                voiced > 0, 2 ** (log_f0 / np.maximum(voiced, 1e-9)), np.nan
+            ),
+            "leading_silence_s": self.words[first, 4],
+            "trailing_silence_s": self.words[last, 5],
+        }
+
+
+def features_version(path: str = FEATURES_PATH) -> List[int] | None:
+    """
+    Returns the version of the feature table, which changes whenever it's computed, or None if there's none.
+    """
+
+    return file_version(path) if os.path.exists(path) else None
+
+
+def get_features(path: str = FEATURES_PATH) -> FeatureTable | None:
+    """
+    Returns the feature table of the process, loading it on first use.
+
+    Args:
+        path (str): The path of the feature table.
+
+    Returns:
+        FeatureTable | None: The table, or None if the features haven't been computed.
+    """
+
+    global _table
+
+    if _table is None and os.path.exists(path):
+        _table = FeatureTable(path)
+    return _table
@@ -0,0 +1,309 @@
+"""
+This module contains a positional inverted index over the quote corpus, used to find the quote segments
+that match a piece of text without scanning every quote.
+"""
+
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Sequence, Tuple
+import hashlib
+import json
+import uuid
+import re
+import os
+
+import numpy as np
+
+from models import Quote
+
+
+INDEX_PATH = "data/quotes_index.json"
+_INDEX_VERSION = 1
+
+_loaded_indexes: Dict[str, "QuoteIndex"] = {}
+_matcher_corpora: Dict[Tuple[str, str], "MatcherCorpus"] = {}
+
+
+def normalize_and_tokenize(s: str) -> List[str]:
+    """
+    Lowercase the string, remove punctuation (except apostrophes), and split into word tokens.
+    """
+
+    s = s.lower()
+    s = re.sub(r"[^a-z0-9']+", " ", s)
+    tokens = s.split()
+    return tokens
+
+
+@dataclass
+class QuoteIndex:
+    """
+    Maps every normalized token to the (quote index, token position) pairs it appears at.
+    Quote indexes refer to the position of the quote in the list the index was built from.
+    """
+
+    fingerprint: str
+    postings: Dict[str, List[Tuple[int, int]]]
+
+
+def corpus_fingerprint(quotes: Sequence[Quote]) -> str:
+    """
+    Computes a fingerprint of the quote corpus, which changes whenever a quote is added, removed,
+    reordered or has its text changed. The corpus store (see `store.CorpusStore`) keeps the fingerprint
+    of its quotes in its header, so it's returned without decoding them.
+
+    Args:
+        quotes (Sequence[Quote]): The quotes the index is built from.
+
+    Returns:
+        str: A hex digest identifying the corpus.
+    """
+
+    fingerprint = getattr(quotes, "fingerprint", None)
+    if isinstance(fingerprint, str):
+        return fingerprint
+
+    digest = hashlib.sha1(f"v{_INDEX_VERSION}\n".encode())
+    for quote in quotes:
+        digest.update(f"{quote.id}\0{quote.text}\n".encode())
+    return digest.hexdigest()
+
+
+def build_index(quotes: List[Quote]) -> QuoteIndex:
+    """
+    Builds the positional index of a list of quotes.
+
+    Args:
+        quotes (List[Quote]): The quotes to index.
+
+    Returns:
+        QuoteIndex: The index of the quotes.
+    """
+
+    return _build_index(
+        corpus_fingerprint(quotes),
+        [normalize_and_tokenize(quote.text) for quote in quotes],
+    )
+
+
+def _build_index(fingerprint: str, token_lists: List[List[str]]) -> QuoteIndex:
+    postings: Dict[str, List[Tuple[int, int]]] = {}
+    for q_idx, tokens in enumerate(token_lists):
+        for k, token in enumerate(tokens):
+            postings.setdefault(token, []).append((q_idx, k))
+
+    return QuoteIndex(fingerprint, postings)
+
+
+def save_index(index: QuoteIndex, path: str = INDEX_PATH):
+    """
+    Saves an index to disk. Postings are stored flattened as [q0, k0, q1, k1, ...] to keep the file small.
+
+    Args:
+        index (QuoteIndex): The index to save.
+        path (str): The path of the index file.
+    """
+
+    # Other processes may be reading the index, so it's written next to it and then moved in place
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temporary_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(temporary_path, "w") as file:
+        json.dump(
+            {
+                "version": _INDEX_VERSION,
+                "fingerprint": index.fingerprint,
+                "postings": {
+                    token: [value for posting in postings for value in posting]
+                    for token, postings in index.postings.items()
+                },
+            },
+            file,
+        )
+    os.replace(temporary_path, path)
+
+
+def load_index(quotes: List[Quote], path: str = INDEX_PATH) -> QuoteIndex:
+    """
+    Returns the index of the given quotes. The index is read from disk if it was built from the same corpus,
+    otherwise it is rebuilt and saved. Loaded indexes are kept in memory for the lifetime of the process.
+
+    Args:
+        quotes (List[Quote]): The quotes to get the index of.
+        path (str): The path of the index file.
+
+    Returns:
+        QuoteIndex: The index of the quotes.
+    """
+
+    return _load_index(
+        corpus_fingerprint(quotes),
+        lambda: [normalize_and_tokenize(quote.text) for quote in quotes],
+        path,
+    )
+
+
+def _load_index(
+    fingerprint: str, token_lists: Callable[[], List[List[str]]], path: str
+) -> QuoteIndex:
+    """
+    Returns the index with the given fingerprint, from memory, from disk or built from the tokens of its quotes,
+    which are only computed if the index is built.
+    """
+
+    if fingerprint in _loaded_indexes:
+        return _loaded_indexes[fingerprint]
+
+    index = None
+    if os.path.exists(path):
+        with open(path, "r") as file:
+            data = json.load(file)
+        if data.get("fingerprint") == fingerprint:
+            index = QuoteIndex(
+                fingerprint,
+                {
+                    token: list(zip(flat[::2], flat[1::2]))
+                    for token, flat in data["postings"].items()
+                },
+            )
+
+    if index is None:
+        index = _build_index(fingerprint, token_lists())
+        save_index(index, path)
+
+    _loaded_indexes[fingerprint] = index
+    return index
+
+
+def find_candidates(
+    index: QuoteIndex, tokens: List[str]
+) -> List[List[Tuple[int, int]]]:
+    """
+    Finds, for each position in a token list, the longest match of every quote that starts there.
+
+    The tokens are walked right to left: a quote token at position k matching tokens[i] extends
+    the run that the same quote had at position k + 1 for tokens[i + 1], so every run length is
+    computed from index lookups alone.
+
+    Args:
+        index (QuoteIndex): The index of the quotes.
+        tokens (List[str]): The normalized tokens to match.
+
+    Returns:
+        List[List[Tuple[int, int]]]: For every position i, a list of (length_in_words, quote_index) pairs.
+    """
+
+    n = len(tokens)
+    matches_at: List[List[Tuple[int, int]]] = [[] for _ in range(n)]
+    next_runs: Dict[Tuple[int, int], int] = {}
+
+    for i in range(n - 1, -1, -1):
+        runs: Dict[Tuple[int, int], int] = {}
+        best_len: Dict[int, int] = {}
+
+        for q_idx, k in index.postings.get(tokens[i], ()):
+            length = 1 + next_runs.get((q_idx, k + 1), 0)
+            runs[(q_idx, k)] = length
+            if length > best_len.get(q_idx, 0):
+                best_len[q_idx] = length
+
+        matches_at[i] = [(length, q_idx) for q_idx, length in best_len.items()]
+        next_runs = runs
+
+    return matches_at
+
+
+@dataclass
+class MatcherCorpus:
+    """
+    The quotes of one language grouped by their normalized text, which is what the matcher searches:
+    quotes with the same words are one entry of the index, no matter how many voice lines say them.
+    Quote indexes of the index refer to the number of the group. Groups hold the positions of their quotes
+    in `quotes`, which are only decoded when a group is chosen.
+    """
+
+    quotes: Sequence[Quote]
+    # The positions of the quotes of group g are members[offsets[g] : offsets[g + 1]]
+    offsets: np.ndarray
+    members: np.ndarray
+    index: QuoteIndex
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def voices(self, group: int) -> List[Quote]:
+        """
+        Returns the quotes of a group, the voice lines that say its text.
+        """
+
+        return [
+            self.quotes[i]
+            for i in self.members[
+                self.offsets[group] : self.offsets[group + 1]
+            ].tolist()
+        ]
+
+
+def _token_groups(quotes: Sequence[Quote], language: str) -> List[List[int]]:
+    """
+    Groups the positions of the quotes in a language by their normalized tokens, like
+    `store.CorpusStore.token_groups` does from its columns.
+    """
+
+    groups: Dict[Tuple[str, ...], List[int]] = {}
+    for i, quote in enumerate(quotes):
+        if quote.language == language:
+            tokens = tuple(normalize_and_tokenize(quote.text))
+            if tokens:
+                groups.setdefault(tokens, []).append(i)
+    return list(groups.values())
+
+
+def _quote_tokens(quotes: Sequence[Quote], i: int) -> List[str]:
+    # The corpus store keeps the normalized tokens of its quotes
+    if hasattr(quotes, "tokens"):
+        return quotes.tokens(i)
+    return normalize_and_tokenize(quotes[i].text)
+
+
+def load_matcher_corpus(
+    quotes: Sequence[Quote], language: str = "english", path: str = INDEX_PATH
+) -> MatcherCorpus:
+    """
+    Returns the matcher corpus of the given quotes, keeping only the quotes in `language` and grouping them by
+    normalized text. The index of the groups is loaded like `load_index`, and matcher corpora are kept in memory
+    for the lifetime of the process. Quotes of the corpus store are grouped and indexed from its language and
+    token columns, without decoding them.
+
+    Args:
+        quotes (Sequence[Quote]): All quotes of the corpus.
+        language (str): The language of the quotes to match.
+        path (str): The path of the index file.
+
+    Returns:
+        MatcherCorpus: The grouped quotes and their index.
+    """
+
+    fingerprint = corpus_fingerprint(quotes)
+    key = (fingerprint, language)
+    if key in _matcher_corpora:
+        return _matcher_corpora[key]
+
+    groups = (
+        quotes.token_groups(language)
+        if hasattr(quotes, "token_groups")
+        else _token_groups(quotes, language)
+    )
+
+    corpus = MatcherCorpus(
+        quotes,
+        np.cumsum([0] + [len(group) for group in groups]),
+        np.array([i for group in groups for i in group], dtype=np.int64),
+        _load_index(
+            hashlib.sha1(
+                f"v{_INDEX_VERSION}\n{fingerprint}\n{language}".encode()
+            ).hexdigest(),
+            lambda: [_quote_tokens(quotes, group[0]) for group in groups],
+            path,
+        ),
+    )
+    _matcher_corpora[key] = corpus
+    return corpus
@@ -2,164 +2,437 @@
 This module contains logic for matching a given string to Overwatch character quotes.
 """
 
-from typing import List, Tuple
-from random import shuffle
-import re
+from typing import Dict, List, Tuple
+import random
+import heapq
 
+import numpy as np
+
+from index import (
+    MatcherCorpus,
+    normalize_and_tokenize,
+    load_matcher_corpus,
+    find_candidates,
+)
+from timings import has_timings, timings_version
 from models import Quote, Match
-from align import align_quote
+from align import align_quote, align_quote_samples, quote_word_span
+from features import get_features
+from pcm import SAMPLE_RATE, to_audio_segment
+from profiling import span
+
+
+OBJECTIVES = ["contiguous", "cover"]
 
+# How much quieter than the loudest voice line of a match, in dB, a voice line may be
+_MAX_LOUDNESS_GAP_DB = 10
 
-def _normalize_and_tokenize(s: str) -> List[str]:
+# The aligned voice lines of the groups looked up so far, for the corpus and timing table they were looked up in
+_aligned_key: Tuple | None = None
+_aligned_voices: Dict[int, List[Quote]] = {}
+
+
+def load_match_audio(matches: List[Match]) -> List[Match]:
     """
-    Lowercase the string, remove punctuation (except apostrophes), and split into word tokens.
+    Cuts the audio of every match out of its quote, as a PCM bank view if the quote is packed.
+
+    Args:
+        matches (List[Match]): The matches to load the audio of.
+
+    Returns:
+        List[Match]: The same matches, with their audio set.
     """
 
-    s = s.lower()
-    s = re.sub(r"[^a-z0-9']+", " ", s)
-    tokens = s.split()
-    return tokens
+    for match in matches:
+        with span("align_quote", quote=match.quote.id):
+            match.samples = align_quote_samples(match.quote, match.quote_segment)
+            match.audio_segment = (
+                to_audio_segment(match.samples, SAMPLE_RATE)
+                if match.samples is not None
+                else align_quote(match.quote, match.quote_segment)
+            )
+
+    return matches
 
 
-def find_quote_matches(input_string: str, quotes: List[Quote]) -> List[Match]:
+def _rank_voices(voices: List[Quote], segment: str) -> List[Quote]:
     """
-    Find the largest contiguous coverage of input_string by segments of quotes (from `quotes`),
-    using as few matched segments as possible. Matches may be any contiguous sequence of whole words
-    from a quote. Case and punctuation are ignored for matching; returned segments are normalized
-    (lowercase, no punctuation).
+    Keeps the voice lines of a match that sound the best for it, using the feature table (see
+    `features.compute_features`): the ones sung about as loud as the loudest, and with as much sound as silence in
+    the segment at least. All voice lines are kept if the features haven't been computed.
 
-    I literally don't know how this works, is was written completely by LLM (vibe-coding).
+    Args:
+        voices (List[Quote]): The quotes that the segment of the match can be sung from.
+        segment (str): The segment of the match.
+
+    Returns:
+        List[Quote]: The voice lines to choose from.
     """
 
-    # Select only quotes in English
-    quotes = [
-        q
-        for q in quotes
-        for black_word in [
-            "French",
-            "Spanish",
-            "German",
-            "Russian",
-            "Chinese",
-            "Dutch",
-            "Swedish",
-            "Egyptian",
-            "Arabic",
-            "Japanese",
-            "Samoan",
-            "Korean",
-        ]
-        if black_word not in q.audio_url
-    ]
+    features = get_features()
+    if features is None or len(voices) < 2:
+        return voices
 
-    shuffle(quotes)
+    # Voice lines of a group have the same words, so the words of the segment are found once per distinct text
+    spans: Dict[str, Tuple[int, int]] = {}
+    for voice in voices:
+        if voice.text not in spans:
+            spans[voice.text] = quote_word_span(voice, segment)
+    first_words, last_words = np.array([spans[voice.text] for voice in voices]).T
 
-    # 1) Normalize and tokenize the input string
-    input_tokens = _normalize_and_tokenize(input_string)
-    n = len(input_tokens)
-
-    # 2) For each quote, tokenize its text
-    quote_tokens_list: List[List[str]] = []
-    for q in quotes:
-        qtoks = _normalize_and_tokenize(q.text)
-        quote_tokens_list.append(qtoks)
-
-    # 3) Precompute, for each position i in input_tokens, all possible matches:
-    #    a match is (length_in_words, quote_index)
-    matches_at: List[List[Tuple[int, int]]] = [[] for _ in range(n)]
-
-    for i in range(n):
-        w_in = input_tokens[i]
-
-        for q_idx, qtoks in enumerate(quote_tokens_list):
-            m = len(qtoks)
-            # Find every start position k in the quote where qtoks[k] == w_in
-            start_positions = [k for k, w in enumerate(qtoks) if w == w_in]
-            best_len = 0
-            # For each start, see how many words match in sequence
-            for k in start_positions:
-                length = 0
-                while (
-                    i + length < n
-                    and k + length < m
-                    and input_tokens[i + length] == qtoks[k + length]
-                ):
-                    length += 1
-                if length > best_len:
-                    best_len = length
-            if best_len > 0:
-                # Record the single best (longest) match for this quote at position i
-                matches_at[i].append((best_len, q_idx))
-
-    # 4) Build a DP array for contiguous matching:
-    #    dp_contig[k] = (reach_index, segment_count, list_of_Match_objects)
-    #    where 'reach_index' is the furthest index we can match if we start exactly at k
-    #    and proceed by chaining matches without gaps; 'segment_count' is the minimum number
-    #    of segments to get that reach. If no match starts at k, we cannot match k, so reach_index = k.
-    dp_contig: List[Tuple[int, int, List[Match]]] = [(i, 0, []) for i in range(n + 1)]
-    dp_contig[n] = (
-        n,
-        0,
-        [],
-    )  # Base case: at position n, we have matched nothing and we're "at" n
+    rows = features.rows(voices, last_words)
+    known = np.flatnonzero(rows >= 0)
+    if len(known) == 0:
+        return voices
 
-    for k in range(n - 1, -1, -1):
-        shuffle(matches_at[k])  # Shuffle to ensure randomness in matches
+    segments = features.segments(rows[known], first_words[known], last_words[known])
+    silence = segments["leading_silence_s"] + segments["trailing_silence_s"]
+    keep = (segments["rms_db"] >= segments["rms_db"].max() - _MAX_LOUDNESS_GAP_DB) & (
+        silence <= segments["duration_s"] / 2
+    )
 
-        # If no match starts at k, we can't cover k, so our reach is k itself (zero coverage from k).
-        if not matches_at[k]:
-            dp_contig[k] = (k, 0, [])
-            continue
+    ranked = [voices[i] for i in known[keep].tolist()]
+    return ranked or voices
 
-        # Otherwise, try each match (length, q_idx) at k
-        best_reach = k
-        best_segs = 0
-        best_matches_list: List[Match] = []
 
+def _aligned_candidates(
+    corpus: MatcherCorpus, matches_at: List[List[Tuple[int, int]]]
+) -> Tuple[List[List[Tuple[int, int]]], Dict[int, List[Quote]]]:
+    """
+    Keeps the candidates that can be sung: quotes are never aligned at render time, so only the voice lines with
+    word timings (see `align.align_corpus`) are kept, and the candidates of groups without any are dropped.
+
+    Args:
+        corpus (MatcherCorpus): The matcher corpus the candidates were found in.
+        matches_at (List[List[Tuple[int, int]]]): The candidates, see `index.find_candidates`.
+
+    Returns:
+        Tuple[List[List[Tuple[int, int]]], Dict[int, List[Quote]]]: The kept candidates, and the aligned voice lines
+            of their groups.
+    """
+
+    global _aligned_key, _aligned_voices
+
+    key = (id(corpus), corpus.index.fingerprint, str(timings_version()))
+    if key != _aligned_key:
+        _aligned_key, _aligned_voices = key, {}
+
+    for candidates in matches_at:
+        for _, g_idx in candidates:
+            if g_idx not in _aligned_voices:
+                _aligned_voices[g_idx] = [
+                    voice for voice in corpus.voices(g_idx) if has_timings(voice)
+                ]
+
+    return [
+        [(length, g_idx) for length, g_idx in candidates if _aligned_voices[g_idx]]
+        for candidates in matches_at
+    ], _aligned_voices
+
+
+def _best_path(
+    matches_at: List[List[Tuple[int, int]]], objective: str = "contiguous"
+) -> List[Tuple[int, int, int]]:
+    """
+    Chooses the matches that cover the tokens best, with a DP over token positions that only stores a score and a
+    back-pointer (the chosen match) per position. The path is reconstructed once at the end, so time and memory are
+    O(tokens * candidates).
+
+    Args:
+        matches_at (List[List[Tuple[int, int]]]): For every token position, the (length_in_words, quote_index) matches starting there.
+        objective (str): "contiguous" for the longest run of back-to-back matches, "cover" for the most tokens of the
+            whole input, leaving gaps where nothing matches.
+
+    Returns:
+        List[Tuple[int, int, int]]: The chosen matches as (position, length_in_words, quote_index), in input order.
+    """
+
+    if objective not in OBJECTIVES:
+        raise ValueError(
+            f"Unknown objective {objective!r}, expected one of {OBJECTIVES}"
+        )
+
+    n = len(matches_at)
+    cover = objective == "cover"
+
+    # covered[k] = tokens covered from k on: the reach of the run starting at k for "contiguous",
+    # the covered tokens of [k, n) for "cover". segments[k] = the segments used for it,
+    # choice[k] = the (length_in_words, quote_index) match taken at k, or None.
+    covered = [0] * (n + 1) if cover else list(range(n + 1))
+    segments = [0] * (n + 1)
+    choice: List[Tuple[int, int] | None] = [None] * (n + 1)
+
+    for k in range(n - 1, -1, -1):
+        if cover:
+            # Skipping token k leaves it uncovered
+            covered[k], segments[k] = covered[k + 1], segments[k + 1]
+
+        # When covering, skipping is an option the matches have to beat, otherwise the first match is taken
+        best_covered, best_segments, best_choice = covered[k], segments[k], None
+        has_best = cover
         for length, q_idx in matches_at[k]:
-            next_k = k + length
-            next_reach, next_segs, next_matches = dp_contig[next_k]
-            total_reach = next_reach
-            total_segs = 1 + next_segs
-
-            # Decide if this is better: prefer larger total_reach; if tie, fewer segments
-            if (total_reach > best_reach) or (
-                total_reach == best_reach
-                and (
-                    best_matches_list
-                    and total_segs < best_segs
-                    or not best_matches_list
-                )
+            total_covered = covered[k + length] + (length if cover else 0)
+
+            # Prefer more coverage; if tie, fewer segments
+            if total_covered > best_covered or (
+                total_covered == best_covered
+                and (not has_best or segments[k + length] + 1 < best_segments)
             ):
-                segment_str = " ".join(input_tokens[k : k + length])
-                new_match = Match(quotes[q_idx], segment_str)
-                best_reach = total_reach
-                best_segs = total_segs
-                best_matches_list = [new_match] + next_matches
-
-        dp_contig[k] = (best_reach, best_segs, best_matches_list)
-
-    # 5) Among all starting positions i, pick the one with the largest contiguous coverage (reach - i),
-    #    breaking ties by fewer segments. If coverage is zero, skip.
-    best_cov = 0
-    best_segs_overall = 0
-    best_match_list_overall: List[Match] = []
-
-    for i in range(n):
-        reach_i, segs_i, matches_i = dp_contig[i]
-        coverage_i = reach_i - i
-        if coverage_i == 0:
+                has_best = True
+                best_covered = total_covered
+                best_segments = segments[k + length] + 1
+                best_choice = (length, q_idx)
+
+        if best_choice is not None:
+            covered[k], segments[k], choice[k] = (
+                best_covered,
+                best_segments,
+                best_choice,
+            )
+
+    if objective == "contiguous":
+        # Start at the position with the largest contiguous coverage (reach - i), breaking ties by fewer segments
+        start, best_coverage = 0, 0
+        for i in range(n):
+            coverage = covered[i] - i
+            if choice[i] is not None and (
+                coverage > best_coverage
+                or (coverage == best_coverage and segments[i] < segments[start])
+            ):
+                start, best_coverage = i, coverage
+        k = start if best_coverage else n
+    else:
+        k = 0
+
+    path = []
+    while k < n:
+        if choice[k] is None:
+            if objective == "contiguous":
+                break
+            k += 1
             continue
-        if (coverage_i > best_cov) or (
-            coverage_i == best_cov
-            and (not best_match_list_overall or segs_i < best_segs_overall)
-        ):
-            best_cov = coverage_i
-            best_segs_overall = segs_i
-            best_match_list_overall = matches_i
+        length, q_idx = choice[k]
+        path.append((k, length, q_idx))
+        k += length
+
+    return path
+
+
+def _best_paths(
+    matches_at: List[List[Tuple[int, int]]],
+    objective: str,
+    count: int,
+    rng: random.Random,
+) -> List[List[Tuple[int, int, int]]]:
+    """
+    Finds the `count` best paths of the DP of `_best_path` in one pass. Every position keeps its `count` best
+    scores, each with a back-pointer to the match taken and the rank of the score it continues at the next position.
+    Of the matches of the same length at a position, which only differ in the quote filling the span, one is kept,
+    picked with `rng`, so that the paths differ in how they segment the tokens. Candidates are shuffled with `rng`
+    too, which decides between paths that score the same.
+
+    Args:
+        matches_at (List[List[Tuple[int, int]]]): For every token position, the (length_in_words, quote_index) matches starting there.
+        objective (str): "contiguous" or "cover", see `_best_path`.
+        count (int): The number of paths to find.
+        rng (random.Random): The random generator breaking ties.
+
+    Returns:
+        List[List[Tuple[int, int, int]]]: The paths, best first, as lists of (position, length_in_words, quote_index).
+    """
+
+    if objective not in OBJECTIVES:
+        raise ValueError(
+            f"Unknown objective {objective!r}, expected one of {OBJECTIVES}"
+        )
+
+    n = len(matches_at)
+    cover = objective == "cover"
+
+    def rank(entry: Tuple[int, int, Tuple[int, int] | None, int | None]):
+        # Prefer more coverage; if tie, fewer segments
+        return -entry[0], entry[1]
+
+    # entries[k] = up to `count` (covered, segments, choice, next_rank), best first, where covered and segments are
+    # as in `_best_path`, choice is the match taken at k (None to skip k or, for "contiguous", to end the run at k)
+    # and next_rank the rank of the entry continued at the next position.
+    entries: List[List[Tuple[int, int, Tuple[int, int] | None, int | None]]] = [
+        [] for _ in range(n + 1)
+    ]
+    entries[n] = [(0 if cover else n, 0, None, None)]
+
+    for k in range(n - 1, -1, -1):
+        shuffled = list(matches_at[k])
+        rng.shuffle(shuffled)
+        candidates: Dict[int, int] = {}
+        for length, q_idx in shuffled:
+            candidates.setdefault(length, q_idx)
+
+        options = [
+            (covered + (length if cover else 0), segments + 1, (length, q_idx), r)
+            for length, q_idx in candidates.items()
+            for r, (covered, segments, _, _) in enumerate(entries[k + length])
+        ]
+        if cover:
+            options += [
+                (covered, segments, None, r)
+                for r, (covered, segments, _, _) in enumerate(entries[k + 1])
+            ]
+        else:
+            options.append((k, 0, None, None))
+
+        entries[k] = heapq.nsmallest(count, options, key=rank)
+
+    if cover:
+        starts = [(0, r) for r, entry in enumerate(entries[0]) if entry[0] > 0]
+    else:
+        # Runs may start anywhere: the best runs by contiguous coverage (reach - k), breaking ties by fewer segments
+        starts = heapq.nsmallest(
+            count,
+            [
+                (k, r)
+                for k in range(n)
+                for r, entry in enumerate(entries[k])
+                if entry[2] is not None
+            ],
+            key=lambda start: (
+                -(entries[start[0]][start[1]][0] - start[0]),
+                entries[start[0]][start[1]][1],
+            ),
+        )
+
+    paths = []
+    for k, r in starts:
+        path = []
+        while k < n and r is not None:
+            _, _, choice, r = entries[k][r]
+            if choice is None:
+                k += 1
+                continue
+            length, q_idx = choice
+            path.append((k, length, q_idx))
+            k += length
+        paths.append(path)
+
+    return paths
+
+
+def find_quote_matches(
+    input_string: str,
+    quotes: List[Quote],
+    with_audio: bool = True,
+    objective: str = "contiguous",
+    require_timings: bool = True,
+) -> List[Match]:
+    """
+    Find the largest contiguous coverage of input_string by segments of quotes (from `quotes`),
+    using as few matched segments as possible. With the "cover" objective, the whole input_string is
+    covered instead, as much of it as possible, leaving gaps where no quote matches. Matches may be any contiguous sequence of whole words
+    from a quote. Case and punctuation are ignored for matching; returned segments are normalized
+    (lowercase, no punctuation). Unless `with_audio` is False, the audio of the matches is loaded too.
+    Only quotes with word timings are matched, unless `require_timings` is False (which plans can't be rendered).
+
+    I literally don't know how this works, is was written completely by LLM (vibe-coding).
+    """
+
+    # 1) Normalize and tokenize the input string
+    input_tokens = normalize_and_tokenize(input_string)
+
+    # 2) Precompute, for each position i in input_tokens, all possible matches from the index of the
+    #    English quotes grouped by text: a match is (length_in_words, group_index)
+    corpus = load_matcher_corpus(quotes, "english")
+    matches_at: List[List[Tuple[int, int]]] = find_candidates(
+        corpus.index, input_tokens
+    )
+    voices_of = corpus.voices
+    if require_timings:
+        matches_at, aligned = _aligned_candidates(corpus, matches_at)
+        voices_of = aligned.__getitem__
+
+    # 3) Choose the matches with the DP over token positions, then a random voice line for each of them, among the
+    #    ones that sound the best
+    matches = []
+    for k, length, g_idx in _best_path(matches_at, objective):
+        segment = " ".join(input_tokens[k : k + length])
+        voices = _rank_voices(voices_of(g_idx), segment)
+        matches.append(Match(random.choice(voices), segment, position=k))
 
     # Calculate the audio segments for the best matches
-    for match in best_match_list_overall:
-        match.audio_segment = align_quote(match.quote, match.quote_segment)
+    if with_audio:
+        load_match_audio(matches)
+
+    return matches
+
+
+def find_cover_plans(
+    input_string: str,
+    quotes: List[Quote],
+    count: int = 10,
+    objective: str = "contiguous",
+    diversity: float = 0,
+    seed: int | None = None,
+    with_audio: bool = False,
+    require_timings: bool = True,
+) -> List[List[Match]]:
+    """
+    Finds the `count` best sequences of matches (cover plans) of input_string, like `find_quote_matches` but from a
+    single DP pass. Plans are ranked by the number of words they cover plus `diversity` times the number of distinct
+    characters singing them, then by their number of segments. No two plans segment the lyrics the same way, so
+    they differ in which words are sung and how they're split between quotes, not only in the voice lines. With a
+    positive `diversity`, every match is sung by one of the characters used the least so far in its plan. The same
+    seed gives the same plans.
+
+    Args:
+        input_string (str): The text to cover, e.g. the lyrics of a song.
+        quotes (List[Quote]): All quotes of the corpus.
+        count (int): The number of plans to find.
+        objective (str): "contiguous" or "cover", see `find_quote_matches`.
+        diversity (float): The weight of the number of distinct characters in the ranking.
+        seed (int | None): The seed of the random choices (ties between matches and voice lines).
+        with_audio (bool): Whether the audio of the matches is loaded too.
+        require_timings (bool): Whether only quotes with word timings are matched, see `find_quote_matches`.
+
+    Returns:
+        List[List[Match]]: Up to `count` plans, best first.
+    """
+
+    rng = random.Random(seed)
+    input_tokens = normalize_and_tokenize(input_string)
+    corpus = load_matcher_corpus(quotes, "english")
+    matches_at = find_candidates(corpus.index, input_tokens)
+    voices_of = corpus.voices
+    if require_timings:
+        matches_at, aligned = _aligned_candidates(corpus, matches_at)
+        voices_of = aligned.__getitem__
+
+    plans = []
+    for path in _best_paths(matches_at, objective, count, rng):
+        uses: Dict[str, int] = {}
+        plan = []
+        for k, length, g_idx in path:
+            segment = " ".join(input_tokens[k : k + length])
+            voices = voices_of(g_idx)
+            if diversity > 0:
+                least = min(uses.get(voice.character, 0) for voice in voices)
+                voices = [
+                    voice for voice in voices if uses.get(voice.character, 0) == least
+                ]
+            quote = rng.choice(_rank_voices(voices, segment))
+            uses[quote.character] = uses.get(quote.character, 0) + 1
+            plan.append(Match(quote, segment, position=k))
+        plans.append(plan)
+
+    plans.sort(
+        key=lambda plan: (
+            sum(len(match.quote_segment.split()) for match in plan)
+            + diversity * len({match.quote.character for match in plan}),
+            -len(plan),
+        ),
+        reverse=True,
+    )
+
+    if with_audio:
+        for plan in plans:
+            load_match_audio(plan)
 
-    return best_match_list_overall
+    return plans
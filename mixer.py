@@ -0,0 +1,88 @@
+"""
+This module mixes the stretched quotes over the accompaniment in a single float32 buffer.
+"""
+
+import numpy as np
+
+from pcm import to_audio_segment
+from profiling import span
+
+
+class Mixer:
+    """
+    Mixes clips into a copy of the accompaniment. Every clip is added in place at its sample offset,
+    so mixing a clip only costs as much as the clip itself, regardless of the length of the song.
+    """
+
+    def __init__(
+        self,
+        accompaniment: np.ndarray,
+        sample_rate: int,
+        accompaniment_gain_db: float = -15,
+    ):
+        """
+        Args:
+            accompaniment (np.ndarray): The float32 samples of the accompaniment, of shape (channels, n_frames).
+            sample_rate (int): The sample rate of the accompaniment and of every mixed clip.
+            accompaniment_gain_db (float): The gain applied to the accompaniment, in dB.
+        """
+
+        self.sample_rate = sample_rate
+        self.buffer = np.array(accompaniment, dtype=np.float32, ndmin=2)
+        self.buffer *= 10 ** (accompaniment_gain_db / 20)
+
+    def add(self, samples: np.ndarray, position_ms: float, gain_db: float = 0):
+        """
+        Adds a clip to the mix. Mono clips are added to every channel, and the part of a clip
+        that falls outside of the buffer is dropped.
+
+        Args:
+            samples (np.ndarray): The float32 samples of the clip, of shape (n_frames,) or (channels, n_frames).
+            position_ms (float): The position of the clip in the mix, in milliseconds.
+            gain_db (float): The gain applied to the clip, in dB.
+        """
+
+        samples = np.atleast_2d(samples)
+        if samples.shape[0] != self.buffer.shape[0]:
+            samples = samples.mean(axis=0, keepdims=True)
+
+        start = int(position_ms * self.sample_rate / 1000)
+        end = min(self.buffer.shape[1], start + samples.shape[1])
+        if end <= max(start, 0):
+            return
+
+        skipped = max(0, -start)
+        samples = samples[:, skipped : skipped + end - max(start, 0)]
+        if gain_db:
+            samples = samples * np.float32(10 ** (gain_db / 20))
+        self.buffer[:, max(start, 0) : end] += samples
+
+    def render(self, ceiling: float = 0.99) -> np.ndarray:
+        """
+        Returns the mixed samples. If overlapping clips push the peak above the ceiling, the whole mix
+        is scaled down to it instead of clipping.
+
+        Args:
+            ceiling (float): The maximum absolute sample value of the output.
+
+        Returns:
+            np.ndarray: The float32 samples of the mix, of shape (channels, n_frames).
+        """
+
+        peak = float(np.max(np.abs(self.buffer), initial=0))
+        if peak <= ceiling:
+            return self.buffer
+        return self.buffer * (ceiling / peak)
+
+    def export(self, path: str, format: str = "mp3"):
+        """
+        Encodes the mix to a file.
+
+        Args:
+            path (str): The path of the output file.
+            format (str): The format of the output file.
+        """
+
+        audio = to_audio_segment(self.render(), self.sample_rate)
+        with span("encode", path=path):
+            audio.export(path, format=format)
@@ -6,9 +6,10 @@ from dataclasses import dataclass
 from typing import List
 
 from pydub import AudioSegment
+import numpy as np
 
 
-@dataclass
+@dataclass(slots=True)
 class Quote:
     id: str
     character: str
@@ -16,6 +17,9 @@ class Quote:
     text: str
     audio_url: str
     audio_path: str
+    etag: str | None = None
+    last_modified: str | None = None
+    language: str | None = None
 
 
 @dataclass
@@ -23,3 +27,15 @@ class Match:
     quote: Quote
     quote_segment: str
     audio_segment: AudioSegment | None = None
+    # A view into the PCM bank, at pcm.SAMPLE_RATE, if the quote audio is packed
+    samples: np.ndarray | None = None
+    # The position of the first token of the segment in the matched text, as `index.normalize_and_tokenize` splits it
+    position: int | None = None
+
+
+@dataclass
+class Word:
+    # A word of a transcript and its time in the aligned audio, in seconds
+    word: str
+    time_start: float
+    time_end: float
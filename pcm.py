@@ -0,0 +1,189 @@
+"""
+This module contains the PCM bank: every quote clip decoded once into a single memory-mapped file of float32
+mono samples at a common sample rate, so clips can be used as NumPy views without decoding them again.
+"""
+
+from typing import Dict, List, Sequence
+import json
+import os
+
+from pydub import AudioSegment
+import numpy as np
+
+from models import Quote
+from profiling import span
+
+
+BANK_PATH = "data/audios.f32"
+SAMPLE_RATE = 44100
+
+_bank: "PcmBank | None" = None
+
+
+def file_version(audio_path: str) -> List[int]:
+    """
+    Returns the size and modification time of a file, used to detect clips that changed since they were packed.
+    """
+
+    stat = os.stat(audio_path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def decode(audio_path: str) -> np.ndarray:
+    """
+    Decodes an audio file to float32 mono samples in [-1.0, +1.0] at the bank's sample rate.
+    """
+
+    with span("decode", path=audio_path):
+        audio = AudioSegment.from_file(audio_path)
+    audio = audio.set_channels(1).set_frame_rate(SAMPLE_RATE)
+    samples = np.array(audio.get_array_of_samples(), dtype=np.float32)
+    return samples / float(2 ** (8 * audio.sample_width - 1))
+
+
+def pack_audio(quotes: Sequence[Quote], path: str = BANK_PATH) -> int:
+    """
+    Decodes the audio of every quote into the PCM bank, replacing the previous bank. The samples are written
+    to `path` and their offset and length in samples, per audio path, to `path`.json.
+
+    Args:
+        quotes (Sequence[Quote]): The quotes whose audio is packed.
+        path (str): The path of the bank.
+
+    Returns:
+        int: The number of packed clips.
+    """
+
+    clips: Dict[str, List[int]] = {}
+    offset = 0
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(f"{path}.tmp", "wb") as file:
+        for quote in quotes:
+            try:
+                samples = decode(quote.audio_path)
+            except Exception as e:
+                print(f"Error decoding audio of quote {quote.id}: {e}")
+                print("Continuing with the next quote...")
+                continue
+
+            file.write(samples.tobytes())
+            clips[quote.audio_path] = [
+                offset,
+                len(samples),
+                *file_version(quote.audio_path),
+            ]
+            offset += len(samples)
+
+    with open(f"{path}.json.tmp", "w") as file:
+        json.dump({"sample_rate": SAMPLE_RATE, "clips": clips}, file)
+    os.replace(f"{path}.tmp", path)
+    os.replace(f"{path}.json.tmp", f"{path}.json")
+
+    return len(clips)
+
+
+class PcmBank:
+    """
+    A read-only view of the PCM bank. Samples are returned as views into the memory-mapped file, without copying.
+    """
+
+    def __init__(self, path: str = BANK_PATH):
+        with open(f"{path}.json", "r") as file:
+            index = json.load(file)
+
+        self.sample_rate: int = index["sample_rate"]
+        self._clips: Dict[str, List[int]] = index["clips"]
+        self._samples = (
+            np.memmap(path, dtype=np.float32, mode="r")
+            if os.path.getsize(path)
+            else np.empty(0, dtype=np.float32)
+        )
+
+    def __contains__(self, audio_path: str) -> bool:
+        """
+        Checks whether an audio file is in the bank and hasn't changed since it was packed.
+        """
+
+        clip = self._clips.get(audio_path)
+        return (
+            clip is not None
+            and os.path.exists(audio_path)
+            and clip[2:] == file_version(audio_path)
+        )
+
+    def samples(
+        self, audio_path: str, start_s: float = 0, end_s: float | None = None
+    ) -> np.ndarray:
+        """
+        Returns the samples of an audio file, optionally limited to a time range.
+
+        Args:
+            audio_path (str): The path of the audio file.
+            start_s (float): The start of the range in seconds.
+            end_s (float | None): The end of the range in seconds, defaults to the end of the audio.
+
+        Returns:
+            np.ndarray: A read-only float32 view of the samples.
+        """
+
+        offset, length = self._clips[audio_path][:2]
+        start = min(length, max(0, int(start_s * self.sample_rate)))
+        end = length if end_s is None else min(length, int(end_s * self.sample_rate))
+        return self._samples[offset + start : offset + max(start, end)]
+
+
+def get_bank(path: str = BANK_PATH) -> PcmBank | None:
+    """
+    Returns the PCM bank of the process, opening it on first use.
+
+    Args:
+        path (str): The path of the bank.
+
+    Returns:
+        PcmBank | None: The bank, or None if the audio hasn't been packed.
+    """
+
+    global _bank
+
+    if _bank is None and os.path.exists(f"{path}.json"):
+        _bank = PcmBank(path)
+    return _bank
+
+
+def to_audio_segment(samples: np.ndarray, sample_rate: int) -> AudioSegment:
+    """
+    Converts float32 samples in [-1.0, +1.0] to a 16-bit AudioSegment.
+
+    Args:
+        samples (np.ndarray): The samples, of shape (n_frames,) for mono or (channels, n_frames).
+        sample_rate (int): The sample rate of the samples.
+
+    Returns:
+        AudioSegment: The audio segment.
+    """
+
+    samples = np.atleast_2d(samples)
+    pcm = np.clip(samples.T * 32768, -32768, 32767).astype(np.int16)
+    return AudioSegment(
+        data=pcm.tobytes(),
+        sample_width=2,
+        frame_rate=sample_rate,
+        channels=samples.shape[0],
+    )
+
+
+def from_audio_segment(audio: AudioSegment) -> np.ndarray:
+    """
+    Converts an AudioSegment to float32 samples in [-1.0, +1.0].
+
+    Args:
+        audio (AudioSegment): The audio segment.
+
+    Returns:
+        np.ndarray: The samples, of shape (channels, n_frames).
+    """
+
+    samples = np.array(audio.get_array_of_samples(), dtype=np.float32)
+    samples = samples.reshape((-1, audio.channels)).T
+    return samples / float(2 ** (8 * audio.sample_width - 1))
@@ -0,0 +1,366 @@
+"""
+This module contains the stages of the render pipeline, shared by the interactive render and the batch mode.
+Every stage caches its output in the stage checkpoints, keyed by the content of its inputs.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Sequence, Tuple
+import os
+
+from pydub import AudioSegment
+import numpy as np
+
+from songs import download_song, get_song_lyrics
+from align import (
+    align_song_words,
+    lyric_word_indexes,
+    quote_word_span,
+    spans_timestamps,
+    warm_up_aligner,
+)
+from stretch import StretchCache, stretch_matches
+from matcher import find_cover_plans, load_match_audio
+from checkpoints import Checkpoints
+from index import corpus_fingerprint, load_matcher_corpus
+from timings import WordTiming, audio_hash, timings_version
+from models import Match, Quote
+from separator import separate_audio, warm_up_separator
+from pcm import SAMPLE_RATE, from_audio_segment
+from mixer import Mixer
+from features import features_version, get_features
+from profiling import span, stage
+
+
+# The loudness, in dBFS, that the clips of quotes are levelled to, and the most gain levelling may apply
+_QUOTE_RMS_DB = -20
+_MAX_GAIN_DB = 12
+
+
+@dataclass
+class RenderOptions:
+    """
+    The options of a render, see `__main__.py render --help`.
+    """
+
+    stretch_mode: str = "quality"
+    workers: int | None = None
+    objective: str = "contiguous"
+    variants: int = 1
+    diversity: float = 0
+    seed: int | None = None
+
+
+def warm_up(quotes: Sequence[Quote]):
+    """
+    Loads everything the stages share between songs: the matcher corpus of the quotes and the models.
+    """
+
+    load_matcher_corpus(quotes, "english")
+    warm_up_separator()
+    warm_up_aligner()
+
+
+def fetch_lyrics(checkpoints: Checkpoints, song: str) -> str | None:
+    """
+    Returns the lyrics of a song from Genius, or None if they weren't found, which isn't cached.
+    """
+
+    with stage("lyrics"):
+        return checkpoints.value(
+            "lyrics",
+            {"song": song},
+            lambda: get_song_lyrics(song),
+            cache_if=lambda lyrics: lyrics is not None,
+        )
+
+
+def fetch_audio(checkpoints: Checkpoints, song: str) -> str:
+    """
+    Downloads the audio of a song from YouTube and returns its path.
+    """
+
+    with stage("download"):
+        return checkpoints.files(
+            "download",
+            {"song": song},
+            ["song.wav"],
+            lambda directory: download_song(song, f"{directory}/song.wav"),
+        )["song.wav"]
+
+
+def separate(checkpoints: Checkpoints, song_path: str) -> Dict[str, str]:
+    """
+    Separates a song into its vocals and accompaniment and returns the paths of the stems by file name.
+    """
+
+    with stage("separate"):
+        return checkpoints.files(
+            "separate",
+            {"audio": audio_hash(song_path), "model": "spleeter:2stems"},
+            ["vocals.wav", "accompaniment.wav"],
+            lambda directory: separate_audio(song_path, directory),
+        )
+
+
+def align(
+    checkpoints: Checkpoints, vocals_path: str, lyrics: str, workers: int | None
+) -> List[WordTiming]:
+    """
+    Aligns the lyrics of a song with its vocals. Every cover plan of the song is timed with this alignment.
+    """
+
+    with stage("align"):
+        return checkpoints.value(
+            "align",
+            {
+                "vocals": audio_hash(vocals_path),
+                "lyrics": lyrics,
+                "aligner": "sectioned",
+            },
+            lambda: [
+                [w.word, w.time_start, w.time_end]
+                for w in align_song_words(vocals_path, lyrics, workers)
+            ],
+        )
+
+
+def match(
+    checkpoints: Checkpoints,
+    lyrics: str,
+    quotes: Sequence[Quote],
+    options: RenderOptions,
+) -> List[List[Tuple[str, str, int]]]:
+    """
+    Finds the cover plans of the lyrics of a song.
+
+    Plans are only cached when a seed is set: without one, every render draws new random choices, which is how a
+    different cover of the same song is made.
+
+    Returns:
+        List[List[Tuple[str, str, int]]]: The plans, best first, as lists of (quote id, quote segment, position of
+            the segment in the lyrics tokens).
+    """
+
+    def find_plans() -> List[List[Tuple[str, str, int]]]:
+        return [
+            [[match.quote.id, match.quote_segment, match.position] for match in plan]
+            for plan in find_cover_plans(
+                lyrics,
+                quotes,
+                options.variants,
+                options.objective,
+                options.diversity,
+                options.seed,
+            )
+        ]
+
+    with stage("match"):
+        if options.seed is None:
+            return find_plans()
+
+        return checkpoints.value(
+            "match",
+            {
+                "lyrics": lyrics,
+                "corpus": corpus_fingerprint(quotes),
+                "timings": timings_version(),
+                "features": features_version(),
+                "objective": options.objective,
+                "variants": options.variants,
+                "diversity": options.diversity,
+                "seed": options.seed,
+                "fields": ["id", "segment", "position"],
+            },
+            find_plans,
+        )
+
+
+def _trim_and_level(
+    matches: List[Match], clips: List[np.ndarray]
+) -> Tuple[List[np.ndarray], List[float]]:
+    """
+    Trims the silence at the ends of the clips of matches and finds the gain levelling their loudness, using the
+    feature table (see `features.compute_features`). Clips of quotes without features are left as they are.
+
+    Args:
+        matches (List[Match]): The matches of a plan.
+        clips (List[np.ndarray]): The float32 samples of their clips, of shape (n_frames,) or (channels, n_frames).
+
+    Returns:
+        Tuple[List[np.ndarray], List[float]]: The trimmed clips, and the gain of every clip in dB.
+    """
+
+    gains_db = [0.0] * len(clips)
+    features = get_features()
+    if features is None:
+        return clips, gains_db
+
+    first_words, last_words = (
+        np.array(
+            [quote_word_span(match.quote, match.quote_segment) for match in matches],
+            dtype=np.int64,
+        )
+        .reshape(-1, 2)
+        .T
+    )
+    rows = features.rows([match.quote for match in matches], last_words)
+    known = np.flatnonzero(rows >= 0).tolist()
+    if not known:
+        return clips, gains_db
+
+    segments = features.segments(rows[known], first_words[known], last_words[known])
+    gains = np.clip(_QUOTE_RMS_DB - segments["rms_db"], -_MAX_GAIN_DB, _MAX_GAIN_DB)
+    leading = (segments["leading_silence_s"] * SAMPLE_RATE).astype(int)
+    trailing = (segments["trailing_silence_s"] * SAMPLE_RATE).astype(int)
+
+    clips = list(clips)
+    for j, i in enumerate(known):
+        gains_db[i] = float(gains[j])
+        frames = clips[i].shape[-1]
+        # Clips are only trimmed if most of them is left, in case the timings are off
+        if frames - leading[j] - trailing[j] >= frames // 2:
+            clips[i] = clips[i][..., leading[j] : frames - trailing[j]]
+
+    return clips, gains_db
+
+
+def _mix_plan(
+    matches: List[Match],
+    timed_lyrics: List[Tuple[float, float]],
+    accompaniment: np.ndarray,
+    stretch_cache: StretchCache,
+    options: RenderOptions,
+    output_path: str,
+    debug_path: str,
+):
+    start_time = timed_lyrics[0][0]
+    end_time = timed_lyrics[-1][1]
+    padding = 2000
+    segment_start = max(0, start_time - padding)
+    segment_end = end_time + padding
+
+    mixer = Mixer(
+        accompaniment[
+            :,
+            int(segment_start * SAMPLE_RATE / 1000) : int(
+                segment_end * SAMPLE_RATE / 1000
+            ),
+        ],
+        SAMPLE_RATE,
+        accompaniment_gain_db=-15,
+    )
+
+    clips, gains_db = _trim_and_level(
+        matches,
+        [
+            (
+                match.samples
+                if match.samples is not None
+                else from_audio_segment(match.audio_segment.set_frame_rate(SAMPLE_RATE))
+            )
+            for match in matches
+        ],
+    )
+
+    with span("stretch", clips=len(matches)):
+        scaled_clips = stretch_matches(
+            matches,
+            clips,
+            [end_ms - start_ms for start_ms, end_ms in timed_lyrics],
+            SAMPLE_RATE,
+            stretch_cache,
+            mode=options.stretch_mode,
+            workers=options.workers,
+        )
+
+    with open(debug_path, "w") as f:
+        for i in range(len(timed_lyrics)):
+            start_ms, _ = timed_lyrics[i]
+            relative_start = start_ms - segment_start
+            with span("mix", quote=matches[i].quote.id):
+                mixer.add(scaled_clips[i], relative_start, gains_db[i])
+
+            f.write(
+                f"{matches[i].quote.character}: {matches[i].quote_segment} @{relative_start}\n"
+            )
+
+    mixer.export(output_path, format="mp3")
+
+
+def render_plans(
+    plans: List[List[Tuple[str, str, int]]],
+    quotes: Sequence[Quote],
+    lyrics: str,
+    words: List[WordTiming],
+    accompaniment_path: str,
+    options: RenderOptions,
+    output_path: str,
+    debug_path: str,
+    stretch_cache: StretchCache | None = None,
+) -> List[str]:
+    """
+    Mixes every cover plan of a song over its accompaniment. With several plans, the outputs and their debug
+    files are numbered (e.g. output-1.mp3 and debug-1.txt).
+
+    Args:
+        plans (List[List[Tuple[str, str, int]]]): The cover plans, as returned by `match`.
+        quotes (Sequence[Quote]): All quotes of the corpus.
+        lyrics (str): The lyrics of the song.
+        words (List[WordTiming]): The aligned words of the lyrics, as returned by `align`.
+        accompaniment_path (str): The path of the accompaniment stem.
+        options (RenderOptions): The options of the render.
+        output_path (str): The path of the rendered MP3 file.
+        debug_path (str): The path of the debug file, listing the matches and their positions.
+        stretch_cache (StretchCache | None): The cache of stretched clips, a new one by default.
+
+    Returns:
+        List[str]: The paths of the rendered files.
+    """
+
+    with stage("render", plans=len(plans)):
+        # The corpus store finds quotes by id without decoding the others
+        find_quote = (
+            quotes.find
+            if hasattr(quotes, "find")
+            else {quote.id: quote for quote in quotes}.get
+        )
+        with span("decode", path=accompaniment_path):
+            accompaniment = from_audio_segment(
+                AudioSegment.from_file(accompaniment_path).set_frame_rate(SAMPLE_RATE)
+            )
+        stretch_cache = stretch_cache or StretchCache()
+        word_indexes = lyric_word_indexes(lyrics)
+
+        base, extension = os.path.splitext(output_path)
+        debug_base, debug_extension = os.path.splitext(debug_path)
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        os.makedirs(os.path.dirname(debug_path) or ".", exist_ok=True)
+
+        outputs = []
+        for i, plan in enumerate(plans):
+            matches = load_match_audio(
+                [
+                    Match(find_quote(id), segment, position=position)
+                    for id, segment, position in plan
+                ]
+            )
+            suffix = "" if len(plans) == 1 else f"-{i + 1}"
+            _mix_plan(
+                matches,
+                spans_timestamps(
+                    words,
+                    word_indexes,
+                    [
+                        (match.position, len(match.quote_segment.split()))
+                        for match in matches
+                    ],
+                ),
+                accompaniment,
+                stretch_cache,
+                options,
+                f"{base}{suffix}{extension}",
+                f"{debug_base}{suffix}{debug_extension}",
+            )
+            outputs.append(f"{base}{suffix}{extension}")
+
+        return outputs
@@ -0,0 +1,223 @@
+"""
+This module records where a render spends its time. Stages (e.g. separation or alignment) record their wall time,
+CPU time and peak RSS, and spans inside them (e.g. cutting a match out of its quote, or an ffmpeg call) record their
+wall time. Records can be exported as a Chrome trace, viewable in chrome://tracing or https://ui.perfetto.dev, and
+summarized as a table.
+
+Profiling is off until `enable` is called, and while it's off `span` and `stage` return a shared no-op context
+manager, so instrumented code only pays for a function call.
+"""
+
+from typing import Any, Dict, List
+import threading
+import resource
+import json
+import time
+import os
+
+
+_enabled = False
+_lock = threading.Lock()
+_events: List[Dict[str, Any]] = []
+# The stages currently open in any thread, whose peak RSS the sampler keeps up to date
+_open_stages: List["_Stage"] = []
+_start = time.perf_counter()
+
+# How often the RSS of the process is sampled while a stage is open
+_SAMPLE_INTERVAL_S = 0.01
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def _rss_bytes() -> int:
+    """
+    Returns the current RSS of the process, or its peak RSS so far where /proc isn't available.
+    """
+
+    try:
+        with open("/proc/self/statm", "r") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # ru_maxrss is in KiB on Linux and in bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+def _sample_rss():
+    while True:
+        time.sleep(_SAMPLE_INTERVAL_S)
+        rss = _rss_bytes()
+        with _lock:
+            for stage in _open_stages:
+                stage.peak_rss = max(stage.peak_rss, rss)
+
+
+def _record(name: str, category: str, start: float, end: float, args: Dict):
+    event = {
+        "name": name,
+        "cat": category,
+        "ph": "X",
+        "ts": (start - _start) * 1e6,
+        "dur": (end - start) * 1e6,
+        "pid": os.getpid(),
+        "tid": threading.get_ident(),
+        "args": args,
+    }
+    with _lock:
+        _events.append(event)
+
+
+class _Span:
+    def __init__(self, name: str, args: Dict[str, Any]):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _record(self.name, "span", self.start, time.perf_counter(), self.args)
+        return False
+
+
+class _Stage(_Span):
+    def __enter__(self):
+        self.peak_rss = _rss_bytes()
+        with _lock:
+            _open_stages.append(self)
+        self.cpu = time.process_time()
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self.children_cpu = children.ru_utime + children.ru_stime
+        return super().__enter__()
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        rss = _rss_bytes()
+        with _lock:
+            _open_stages.remove(self)
+        _record(
+            self.name,
+            "stage",
+            self.start,
+            end,
+            {
+                **self.args,
+                "cpu_ms": (time.process_time() - self.cpu) * 1000,
+                # Worker processes are only counted once they have exited
+                "children_cpu_ms": (
+                    children.ru_utime + children.ru_stime - self.children_cpu
+                )
+                * 1000,
+                "peak_rss_mib": max(self.peak_rss, rss) / 2**20,
+            },
+        )
+        return False
+
+
+def enable():
+    """
+    Starts recording stages and spans, in this process.
+    """
+
+    global _enabled
+    if not _enabled:
+        _enabled = True
+        threading.Thread(target=_sample_rss, daemon=True).start()
+
+
+def enabled() -> bool:
+    """
+    Returns whether stages and spans are recorded.
+    """
+
+    return _enabled
+
+
+def span(name: str, **args):
+    """
+    Returns a context manager recording the wall time of a span of work, e.g. `with span("decode", path=path):`.
+
+    Args:
+        name (str): The name of the span, spans of the same name are summarized together.
+        **args: Details shown with the span in the trace.
+    """
+
+    return _Span(name, args) if _enabled else _NO_SPAN
+
+
+def stage(name: str, **args):
+    """
+    Returns a context manager recording the wall time, the CPU time (of this process and of its finished worker
+    processes) and the peak RSS of a stage of the pipeline.
+
+    Args:
+        name (str): The name of the stage.
+        **args: Details shown with the stage in the trace.
+    """
+
+    return _Stage(name, args) if _enabled else _NO_SPAN
+
+
+def export_trace(path: str):
+    """
+    Writes the recorded stages and spans as a Chrome trace (JSON object format).
+
+    Args:
+        path (str): The path of the trace file.
+    """
+
+    with _lock:
+        events = list(_events)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as file:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+
+
+def summary() -> str:
+    """
+    Returns a table of the recorded stages and spans, grouped by name in the order they first started: their count,
+    total and mean wall time and, for stages, their total CPU time and peak RSS.
+    """
+
+    with _lock:
+        events = sorted(_events, key=lambda event: event["ts"])
+
+    rows: Dict[str, Dict[str, Any]] = {}
+    for event in events:
+        row = rows.setdefault(
+            event["name"],
+            {"cat": event["cat"], "count": 0, "wall": 0.0, "cpu": 0.0, "rss": 0.0},
+        )
+        row["count"] += 1
+        row["wall"] += event["dur"] / 1000
+        if event["cat"] == "stage":
+            row["cpu"] += event["args"]["cpu_ms"] + event["args"]["children_cpu_ms"]
+            row["rss"] = max(row["rss"], event["args"]["peak_rss_mib"])
+
+    lines = [
+        f"{'name':<20} {'count':>6} {'wall (ms)':>10} {'mean (ms)':>10} {'cpu (ms)':>10} {'rss (MiB)':>10}"
+    ]
+    for name, row in rows.items():
+        cpu, rss = (
+            (f"{row['cpu']:.0f}", f"{row['rss']:.0f}")
+            if row["cat"] == "stage"
+            else ("", "")
+        )
+        lines.append(
+            f"{name:<20} {row['count']:>6} {row['wall']:>10.0f}"
+            f" {row['wall'] / row['count']:>10.1f} {cpu:>10} {rss:>10}"
+        )
+
+    return "\n".join(lines)
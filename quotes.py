@@ -2,34 +2,108 @@
 This module fetches and processes Overwatch character quotes from the Overwatch Fandom wiki.
 """
 
-from urllib.parse import unquote
-from typing import List
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import unquote, urlparse
+from typing import TYPE_CHECKING, Dict, List, Sequence, Tuple
 from io import BytesIO
-import json
+import threading
+import hashlib
+import time
 import re
 import os
 
 from pydub import AudioSegment
-import requests as req
-import bs4 as bs
 
+from store import STORE_VERSION, CorpusStore, write_store, import_json
 from models import Quote
 
+# The scraping libraries are imported by the functions scraping the wiki, so that loading the corpus doesn't pay for them
+if TYPE_CHECKING:
+    import requests as req
+
+
+WIKI_URL = "https://overwatch.fandom.com"
+QUOTES_PATH = "data/quotes.json"
+STORE_PATH = "data/quotes.bin"
+AUDIO_FORMAT = "flac"
+
+_NON_ENGLISH = [
+    "French",
+    "Spanish",
+    "German",
+    "Russian",
+    "Chinese",
+    "Dutch",
+    "Swedish",
+    "Egyptian",
+    "Arabic",
+    "Japanese",
+    "Samoan",
+    "Korean",
+]
+
+
+class _Fetcher:
+    """
+    A connection-pooled HTTP client shared by all scraping threads. It retries failed requests with
+    exponential backoff and waits at least `min_interval` seconds between two requests to the same host.
+    """
+
+    def __init__(self, concurrency: int, min_interval: float, retries: int):
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        import requests as req
+
+        self._session = req.Session()
+        adapter = HTTPAdapter(
+            pool_connections=concurrency,
+            pool_maxsize=concurrency,
+            max_retries=Retry(
+                total=retries,
+                backoff_factor=0.5,
+                status_forcelist=[429, 500, 502, 503, 504],
+            ),
+        )
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+        self._min_interval = min_interval
+        self._next_request_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def get(self, url: str, headers: Dict[str, str] | None = None) -> "req.Response":
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            request_at = max(now, self._next_request_at.get(host, now))
+            self._next_request_at[host] = request_at + self._min_interval
+        time.sleep(request_at - now)
+
+        res = self._session.get(url, headers=headers, timeout=30)
+        res.raise_for_status()
+        return res
 
-def _get_pages() -> List[str]:
+
+def _get_pages(fetcher: _Fetcher, wiki_url: str) -> List[str]:
     """
     Fetches the pages containing Overwatch character quotes.
 
+    Args:
+        fetcher (_Fetcher): The HTTP client to use.
+        wiki_url (str): The base URL of the wiki.
+
     Returns:
         List[str]: A list of URLs to the pages containing character quotes.
     """
 
-    res = req.get("https://overwatch.fandom.com/wiki/Category:Quotations")
+    import bs4 as bs
+
+    res = fetcher.get(f"{wiki_url}/wiki/Category:Quotations")
     soup = bs.BeautifulSoup(res.text, "html.parser")
     links = soup.select(".mw-category-group a")
 
     return [
-        f"https://overwatch.fandom.com{link.get('href')}"
+        f"{wiki_url}{link.get('href')}"
         for link in links
         if not any(
             black_word in link.text
@@ -66,39 +140,84 @@ def _get_pages() -> List[str]:
     ]
 
 
-def _download_audio(id: str, url: str) -> str:
+def _transcode_audio(id: str, ogg_content: bytes) -> str:
     """
-    Downloads an audio file from a given URL and saves it as an MP3 file.
+    Converts an OGG audio file to FLAC, which is lossless, so the clip isn't encoded to a lossy format
+    a second time. This is CPU bound, so it runs in a worker process.
 
     Args:
         id (str): A unique identifier for the audio file, used to create a filename.
-        url (str): The URL of the audio file to be downloaded.
+        ogg_content (bytes): The content of the OGG file.
 
     Returns:
-        str: The path where the MP3 file is saved.
+        str: The path where the FLAC file is saved.
     """
 
-    res = req.get(url)
-    ogg_audio = AudioSegment.from_ogg(BytesIO(res.content))
+    ogg_audio = AudioSegment.from_ogg(BytesIO(ogg_content))
 
     os.makedirs("data/audios", exist_ok=True)
-    path = f"data/audios/{id}.mp3"
-    ogg_audio.export(path, format="mp3")
+    path = f"data/audios/{id}.{AUDIO_FORMAT}"
+    ogg_audio.export(path, format=AUDIO_FORMAT)
     return path
 
 
-def _download_character_image(character_name: str) -> str:
+def _download_audio(
+    fetcher: _Fetcher,
+    transcoder: ProcessPoolExecutor,
+    quote: Quote,
+    previous: Quote | None,
+) -> Future | None:
+    """
+    Downloads the audio file of a quote and hands it over to the transcoding workers to save it as a FLAC file.
+    If the quote was downloaded before, the request is conditional, so unchanged audio is not downloaded again.
+    The ETag and Last-Modified validators of the response are stored in the quote.
+
+    Args:
+        fetcher (_Fetcher): The HTTP client to use.
+        transcoder (ProcessPoolExecutor): The worker pool that converts the audio to FLAC.
+        quote (Quote): The quote whose audio is downloaded.
+        previous (Quote | None): The same quote in the local corpus, if any.
+
+    Returns:
+        Future | None: A future resolving to the path where the FLAC file is saved, or None if the audio didn't change.
+    """
+
+    headers = {}
+    if previous is not None and os.path.exists(previous.audio_path):
+        if previous.etag:
+            headers["If-None-Match"] = previous.etag
+        if previous.last_modified:
+            headers["If-Modified-Since"] = previous.last_modified
+
+    res = fetcher.get(quote.audio_url, headers)
+    if res.status_code == 304:
+        quote.etag = previous.etag
+        quote.last_modified = previous.last_modified
+        return None
+
+    quote.etag = res.headers.get("ETag")
+    quote.last_modified = res.headers.get("Last-Modified")
+    return transcoder.submit(_transcode_audio, quote.id, res.content)
+
+
+def _download_character_image(
+    fetcher: _Fetcher, wiki_url: str, character_name: str
+) -> str:
     """
     Downloads the image of a given Overwatch character.
 
     Args:
+        fetcher (_Fetcher): The HTTP client to use.
+        wiki_url (str): The base URL of the wiki.
         character_name (str): The name of the Overwatch character whose image is to be downloaded.
 
     Returns:
         str: The path to the downloaded image file.
     """
 
-    res = req.get(f"https://overwatch.fandom.com/wiki/{character_name}")
+    import bs4 as bs
+
+    res = fetcher.get(f"{wiki_url}/wiki/{character_name}")
     soup = bs.BeautifulSoup(res.text, "html.parser")
 
     image_tag = soup.select_one(".infoboxtable img")
@@ -110,7 +229,7 @@ def _download_character_image(character_name: str) -> str:
         else image_tag.get("data-src")
     )
 
-    res = req.get(image_url)
+    res = fetcher.get(image_url)
 
     os.makedirs("data/images", exist_ok=True)
     path = f"data/images/{character_name}.png"
@@ -120,22 +239,60 @@ def _download_character_image(character_name: str) -> str:
     return path
 
 
-def _get_quotes(url: str) -> List[Quote]:
+def _quote_id(character_name: str, audio_url: str) -> str:
+    """
+    Derives a stable id for a quote from its audio file name, which doesn't change when the wiki page is reordered.
+
+    Args:
+        character_name (str): The name of the character saying the quote.
+        audio_url (str): The URL of the audio file of the quote.
+
+    Returns:
+        str: The id of the quote.
+    """
+
+    file_name = unquote(audio_url).split("/")[-3]
+    return f"{character_name}-{hashlib.sha1(file_name.encode()).hexdigest()[:10]}"
+
+
+def _language(audio_url: str) -> str:
+    """
+    Tells the language of a quote from its audio URL, where non-English lines are tagged with their language.
+
+    Args:
+        audio_url (str): The URL of the audio file of the quote.
+
+    Returns:
+        str: The lowercase name of the language, e.g. "english".
     """
-    Fetches quotes from a given Overwatch character quotes page.
+
+    for language in _NON_ENGLISH:
+        if language in audio_url:
+            return language.lower()
+    return "english"
+
+
+def _get_quotes(fetcher: _Fetcher, wiki_url: str, url: str) -> List[Quote]:
+    """
+    Fetches quotes from a given Overwatch character quotes page. The audio of the quotes is not downloaded,
+    the returned quotes only have their audio URL set.
 
     Args:
+        fetcher (_Fetcher): The HTTP client to use.
+        wiki_url (str): The base URL of the wiki.
         url (str): The URL of the Overwatch character quotes page.
 
     Returns:
         List[Quote]: A list of Quote objects containing the character's quotes and other details.
     """
 
-    res = req.get(url)
+    import bs4 as bs
+
+    res = fetcher.get(url)
     soup = bs.BeautifulSoup(res.text, "html.parser")
 
     character_name = soup.select_one(".mw-page-title-main").text.split("/")[0].strip()
-    character_picture = _download_character_image(character_name)
+    character_picture = _download_character_image(fetcher, wiki_url, character_name)
 
     audio_urls = [
         audio_tag.get("src")
@@ -143,7 +300,7 @@ def _get_quotes(url: str) -> List[Quote]:
         if character_name in audio_tag.get("src")
     ]
 
-    quotes = []
+    quotes = {}
 
     for audio_url in audio_urls:
         try:
@@ -156,38 +313,169 @@ def _get_quotes(url: str) -> List[Quote]:
             if not quote_text:
                 continue
 
-            id = f"{character_name}{len(quotes) + 1}"
-
-            quotes.append(
-                Quote(
-                    id=id,
-                    character=character_name,
-                    character_picture=character_picture,
-                    text=quote_text,
-                    audio_url=audio_url,
-                    audio_path=_download_audio(id, audio_url),
-                )
+            id = _quote_id(character_name, audio_url)
+            quotes[id] = Quote(
+                id=id,
+                character=character_name,
+                character_picture=character_picture,
+                text=quote_text,
+                audio_url=audio_url,
+                audio_path=f"data/audios/{id}.{AUDIO_FORMAT}",
+                language=_language(audio_url),
             )
         except Exception as e:
             print(f"Error processing quote for {character_name}: {e}")
             print("Continuing with the next quote...")
 
-    return quotes
+    return list(quotes.values())
 
 
-def get_all_quotes() -> List[Quote]:
+def _scrape_quotes(
+    previous_quotes: Sequence[Quote],
+    wiki_url: str,
+    concurrency: int,
+    transcode_workers: int | None,
+    min_interval: float,
+    retries: int,
+) -> List[Quote]:
     """
-    Fetches all Overwatch character quotes, either from a local cache or by scraping the web.
+    Scrapes all quotes from the wiki, downloading only the audio of quotes that are new or changed since
+    `previous_quotes` were scraped. Pages and audio files are fetched concurrently over a shared connection pool,
+    while the downloaded audio is converted to FLAC by a separate pool of worker processes, so that network and
+    transcoding overlap. Audio files of quotes that are no longer on the wiki are deleted.
+
+    Args:
+        previous_quotes (Sequence[Quote]): The quotes of the local corpus, empty to scrape everything.
+        wiki_url (str): The base URL of the wiki.
+        concurrency (int): The maximum number of concurrent HTTP requests.
+        transcode_workers (int | None): The number of transcoding processes, defaults to the number of CPUs.
+        min_interval (float): The minimum time in seconds between two requests to the same host.
+        retries (int): The number of times a failed request is retried.
 
     Returns:
-        List[Quote]: A list of all Overwatch character quotes.
+        List[Quote]: A list of all quotes on the wiki whose audio is available locally.
+    """
+
+    # Older corpora used positional ids, so previous quotes are matched by the id derived from their audio
+    previous = {
+        _quote_id(quote.character, quote.audio_url): quote for quote in previous_quotes
+    }
+    fetcher = _Fetcher(concurrency, min_interval, retries)
+
+    with ThreadPoolExecutor(concurrency) as downloader, ProcessPoolExecutor(
+        transcode_workers
+    ) as transcoder:
+        pages = _get_pages(fetcher, wiki_url)
+        quotes = [
+            quote
+            for page_quotes in downloader.map(
+                lambda page: _get_quotes(fetcher, wiki_url, page), pages
+            )
+            for quote in page_quotes
+        ]
+
+        downloads: List[Tuple[Quote, Future]] = [
+            (
+                quote,
+                downloader.submit(
+                    _download_audio,
+                    fetcher,
+                    transcoder,
+                    quote,
+                    previous.get(quote.id),
+                ),
+            )
+            for quote in quotes
+        ]
+
+        scraped = []
+        downloaded = 0
+        for quote, download in downloads:
+            try:
+                transcoding = download.result()
+                if transcoding is not None:
+                    transcoding.result()
+                    downloaded += 1
+                else:
+                    # Unchanged audio keeps its format, clips saved as MP3 by older versions aren't converted
+                    previous_path = previous[quote.id].audio_path
+                    quote.audio_path = (
+                        os.path.splitext(quote.audio_path)[0]
+                        + os.path.splitext(previous_path)[1]
+                    )
+                    if previous_path != quote.audio_path:
+                        os.replace(previous_path, quote.audio_path)
+                scraped.append(quote)
+            except Exception as e:
+                print(f"Error downloading audio of quote {quote.id}: {e}")
+                if quote.id in previous:
+                    print("Keeping the local version of the quote...")
+                    scraped.append(previous[quote.id])
+                else:
+                    print("Continuing with the next quote...")
+
+    kept_paths = {quote.audio_path for quote in scraped}
+    listed_ids = {quote.id for quote in quotes}
+    removed = [id for id in previous if id not in listed_ids]
+    for quote in previous.values():
+        if quote.audio_path not in kept_paths and os.path.exists(quote.audio_path):
+            os.remove(quote.audio_path)
+
+    print(
+        f"Scraped {len(scraped)} quotes: {downloaded} downloaded, "
+        f"{len(scraped) - downloaded} unchanged, {len(removed)} removed."
+    )
+    return scraped
+
+
+def get_all_quotes(
+    refresh: bool = False,
+    wiki_url: str = WIKI_URL,
+    concurrency: int = 8,
+    transcode_workers: int | None = None,
+    min_interval: float = 0.05,
+    retries: int = 3,
+) -> Sequence[Quote]:
     """
+    Fetches all Overwatch character quotes, either from the local corpus store or by scraping the web.
+    A corpus in the JSON format (data/quotes.json) is imported into the store the first time it's loaded.
+    Derived data (the matcher index and the quote timings) is keyed by the corpus content, so it is updated
+    the next time it is used.
 
-    if os.path.exists("data/quotes.json"):
-        with open("data/quotes.json", "r") as file:
-            return [Quote(**data) for data in json.load(file)]
+    Args:
+        refresh (bool): If True, the local corpus is brought up to date with the wiki, downloading only
+            new or changed audio and removing quotes that were deleted from the wiki.
+        wiki_url (str): The base URL of the wiki to scrape.
+        concurrency (int): The maximum number of concurrent HTTP requests while scraping.
+        transcode_workers (int | None): The number of processes converting audio to FLAC, defaults to the number of CPUs.
+        min_interval (float): The minimum time in seconds between two requests to the same host.
+        retries (int): The number of times a failed request is retried, with exponential backoff.
 
-    quotes = [quote for page in _get_pages() for quote in _get_quotes(page)]
+    Returns:
+        Sequence[Quote]: All Overwatch character quotes, backed by the memory-mapped corpus store.
+    """
+
+    if not os.path.exists(STORE_PATH) and os.path.exists(QUOTES_PATH):
+        quotes = import_json(QUOTES_PATH)
+        for quote in quotes:
+            # Corpora exported before quotes had a language
+            if quote.language is None:
+                quote.language = _language(quote.audio_url)
+        write_store(quotes, STORE_PATH)
+
+    previous_quotes = []
+    if os.path.exists(STORE_PATH):
+        previous_quotes = CorpusStore(STORE_PATH)
+        # Stores of older versions are rewritten in the current format once
+        if previous_quotes.version < STORE_VERSION:
+            write_store(list(previous_quotes), STORE_PATH)
+            previous_quotes = CorpusStore(STORE_PATH)
+        if not refresh:
+            return previous_quotes
+
+    quotes = _scrape_quotes(
+        previous_quotes, wiki_url, concurrency, transcode_workers, min_interval, retries
+    )
+    write_store(quotes, STORE_PATH)
 
-    with open("data/quotes.json", "w") as file:
-        json.dump([quote.__dict__ for quote in quotes], file, indent=4)
+    return CorpusStore(STORE_PATH)
@@ -2,19 +2,209 @@
 This module is responsible for separating the instrumental and vocal parts of a song.
 """
 
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, Dict, Iterable, List
 import logging
+import os
+
+from pydub.utils import mediainfo
+import numpy as np
+
+from sessions import get_model
 from utils import suppress_all_output
 
 logging.getLogger("spleeter").disabled = True
 
-with suppress_all_output():
+if TYPE_CHECKING:
+    from spleeter.audio.adapter import AudioAdapter
     from spleeter.separator import Separator
 
 
-def separate_audio(audio_path: str):
-    separator = Separator("spleeter:2stems")
+SAMPLE_RATE = 44100
+STEMS = ["vocals", "accompaniment"]
+
+
+def _audio_adapter() -> "AudioAdapter":
+    """
+    Returns spleeter's audio adapter. Spleeter and TensorFlow are only imported here, on first use, since
+    importing them takes seconds.
+    """
+
+    with suppress_all_output():
+        from spleeter.audio.adapter import AudioAdapter
+
+    return AudioAdapter.default()
+
 
+def _load_separator() -> "Separator":
     with suppress_all_output():
-        separator.separate_to_file(
-            audio_path, "data", codec="mp3", filename_format="{instrument}.{codec}"
+        from spleeter.separator import Separator
+
+    return Separator("spleeter:2stems")
+
+
+def _separator() -> "Separator":
+    return get_model("spleeter:2stems", _load_separator)
+
+
+def warm_up_separator():
+    """
+    Loads the separation model into the model session of the process, so that the first separation doesn't wait for it.
+    """
+
+    _separator()
+
+
+def _separate_chunk(audio_path: str, offset_s: float, duration_s: float) -> np.ndarray:
+    """
+    Separates a chunk of a song, loading only that chunk. Runs in a worker process when chunks are separated
+    in parallel, where the separator is loaded once per worker.
+
+    Args:
+        audio_path (str): The path to the song.
+        offset_s (float): The start of the chunk in seconds.
+        duration_s (float): The duration of the chunk in seconds.
+
+    Returns:
+        np.ndarray: The stems of the chunk in the order of STEMS, of shape (stems, n_frames, channels).
+    """
+
+    with suppress_all_output():
+        waveform, _ = _audio_adapter().load(
+            audio_path, offset=offset_s, duration=duration_s, sample_rate=SAMPLE_RATE
         )
+        prediction = _separator().separate(waveform)
+    return np.stack([prediction[stem] for stem in STEMS]).astype(np.float32)
+
+
+def _fade(length: int, overlap: int, fade_in: bool, fade_out: bool) -> np.ndarray:
+    """
+    Returns the gain curve of a chunk: linear ramps over the overlapping parts, so that crossfaded
+    neighbouring chunks add up to unity gain.
+    """
+
+    gain = np.ones(length, dtype=np.float32)
+    overlap = min(overlap, length)
+    if fade_in:
+        gain[:overlap] = np.linspace(0, 1, overlap, endpoint=False)
+    if fade_out:
+        gain[length - overlap :] *= np.linspace(1, 0, overlap, endpoint=False)
+    return gain
+
+
+def _crossfade(
+    chunks: Iterable[np.ndarray],
+    offsets: List[float],
+    start_s: float,
+    end_s: float,
+    overlap_s: float,
+) -> Dict[str, np.ndarray]:
+    """
+    Assembles the separated chunks into full stems, crossfading the overlapping parts. Chunks are consumed
+    one at a time, so only the output and a single chunk are held in memory.
+
+    Returns:
+        Dict[str, np.ndarray]: The waveform of every stem, of shape (n_frames, channels).
+    """
+
+    overlap = int(overlap_s * SAMPLE_RATE)
+    output = None
+
+    for k, (offset, chunk) in enumerate(zip(offsets, chunks)):
+        if output is None:
+            frames = int((end_s - start_s) * SAMPLE_RATE) + chunk.shape[1]
+            output = np.zeros((len(STEMS), frames, chunk.shape[2]), dtype=np.float32)
+
+        start = int(round((offset - start_s) * SAMPLE_RATE))
+        gain = _fade(chunk.shape[1], overlap, k > 0, k < len(offsets) - 1)
+        output[:, start : start + chunk.shape[1]] += chunk * gain[None, :, None]
+
+    frames = int((end_s - start_s) * SAMPLE_RATE)
+    return {stem: output[i, :frames] for i, stem in enumerate(STEMS)}
+
+
+def separate_waveforms(
+    audio_path: str,
+    start_s: float = 0,
+    end_s: float | None = None,
+    chunk_s: float = 30,
+    overlap_s: float = 2,
+    workers: int = 1,
+) -> Dict[str, np.ndarray]:
+    """
+    Separates a song into its vocals and accompaniment, returned as float32 waveforms at SAMPLE_RATE.
+
+    The song is separated in overlapping chunks that are crossfaded at their seams, so the memory used by the
+    model doesn't grow with the length of the song. Chunks can be separated in parallel by worker processes.
+
+    Args:
+        audio_path (str): The path to the song.
+        start_s (float): The start of the range to separate in seconds, the stems start at this time.
+        end_s (float | None): The end of the range to separate in seconds, defaults to the end of the song.
+        chunk_s (float): The duration of a chunk in seconds.
+        overlap_s (float): The duration chunks overlap by, in seconds.
+        workers (int): The number of processes separating chunks in parallel, 1 to separate in this process.
+
+    Returns:
+        Dict[str, np.ndarray]: The waveform of every stem in STEMS, of shape (n_frames, channels).
+    """
+
+    duration_s = float(mediainfo(audio_path)["duration"])
+    end_s = duration_s if end_s is None else min(end_s, duration_s)
+
+    step_s = chunk_s - overlap_s
+    offsets: List[float] = [start_s]
+    while offsets[-1] + chunk_s < end_s:
+        offsets.append(offsets[-1] + step_s)
+    durations = [min(chunk_s, end_s - offset) for offset in offsets]
+
+    if workers > 1 and len(offsets) > 1:
+        with ProcessPoolExecutor(min(workers, len(offsets))) as executor:
+            chunks = executor.map(
+                _separate_chunk, [audio_path] * len(offsets), offsets, durations
+            )
+            return _crossfade(chunks, offsets, start_s, end_s, overlap_s)
+
+    chunks = map(_separate_chunk, [audio_path] * len(offsets), offsets, durations)
+    return _crossfade(chunks, offsets, start_s, end_s, overlap_s)
+
+
+def separate_audio(
+    audio_path: str,
+    output_dir: str = "data",
+    codec: str = "wav",
+    start_s: float = 0,
+    end_s: float | None = None,
+    chunk_s: float = 30,
+    overlap_s: float = 2,
+    workers: int = 1,
+):
+    """
+    Separates a song into its vocals and accompaniment (see `separate_waveforms`), written to `output_dir`
+    as vocals.{codec} and accompaniment.{codec}. WAV stems are lossless, so the following stages don't
+    decode a lossy encoding of the song again.
+
+    Args:
+        audio_path (str): The path to the song.
+        output_dir (str): The directory to write the stems to.
+        codec (str): The codec of the stems, e.g. "wav" or "mp3".
+        start_s (float): The start of the range to separate in seconds, the stems start at this time.
+        end_s (float | None): The end of the range to separate in seconds, defaults to the end of the song.
+        chunk_s (float): The duration of a chunk in seconds.
+        overlap_s (float): The duration chunks overlap by, in seconds.
+        workers (int): The number of processes separating chunks in parallel, 1 to separate in this process.
+    """
+
+    stems = separate_waveforms(audio_path, start_s, end_s, chunk_s, overlap_s, workers)
+
+    os.makedirs(output_dir, exist_ok=True)
+    audio_adapter = _audio_adapter()
+    with suppress_all_output():
+        for stem, waveform in stems.items():
+            audio_adapter.save(
+                os.path.join(output_dir, f"{stem}.{codec}"),
+                waveform,
+                SAMPLE_RATE,
+                codec,
+                "128k",
+            )
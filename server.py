@@ -0,0 +1,368 @@
+"""
+This module contains the render server: a long-running HTTP server that loads the quote corpus, the matcher index
+and the models once, and renders the jobs it's sent from a queue, so that a job only pays for the compute of its song.
+
+Endpoints:
+    POST /jobs                  Queues a render job, see `RenderServer.submit`. Returns {"id": ...}.
+    GET  /status                Returns the number of jobs in every state and the load time and reuses of the models.
+    GET  /jobs/<id>             Returns the state, progress events and number of outputs of a job.
+    GET  /jobs/<id>/events      Streams the progress events of a job as JSON lines, until the job is finished.
+    GET  /jobs/<id>/output/<n>  Returns the n-th rendered cover of a job as MP3, counting from 1.
+"""
+
+from dataclasses import dataclass, field, fields, replace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List
+import threading
+import base64
+import shutil
+import queue
+import json
+import time
+import uuid
+import os
+
+from pipeline import RenderOptions, align, match, render_plans, separate, warm_up
+from checkpoints import Checkpoints
+from stretch import MODES, StretchCache
+from matcher import OBJECTIVES
+from sessions import session_stats
+from quotes import get_all_quotes
+
+
+SERVER_DIR = "data/server"
+
+# The render options a job can set, the server decides on the number of processes
+_JOB_OPTIONS = [
+    option.name for option in fields(RenderOptions) if option.name != "workers"
+]
+
+# The file extensions uploaded audio may have
+_AUDIO_FORMATS = ["mp3", "wav", "flac", "ogg", "opus", "m4a", "aac", "webm"]
+
+# How long finished jobs and their files are kept, in seconds, and how many of them are kept at most
+_JOB_TTL_S = 3600
+_MAX_FINISHED_JOBS = 100
+
+# The most cover plans a job can ask for, every one of them is rendered
+_MAX_VARIANTS = 8
+
+
+def _job_options(request: Dict[str, Any]) -> RenderOptions:
+    """
+    Returns the render options set by a job request, raising a ValueError if one of them is invalid.
+    """
+
+    options = {name: request[name] for name in _JOB_OPTIONS if name in request}
+
+    if options.get("stretch_mode", MODES[0]) not in MODES:
+        raise ValueError(f"Expected stretch_mode to be one of {', '.join(MODES)}")
+    if options.get("objective", OBJECTIVES[0]) not in OBJECTIVES:
+        raise ValueError(f"Expected objective to be one of {', '.join(OBJECTIVES)}")
+
+    variants = options.get("variants", 1)
+    if type(variants) is not int or not 1 <= variants <= _MAX_VARIANTS:
+        raise ValueError(f"Expected variants to be between 1 and {_MAX_VARIANTS}")
+
+    diversity = options.get("diversity", 0)
+    if type(diversity) not in (int, float) or not 0 <= diversity <= 1000:
+        raise ValueError("Expected diversity to be a number between 0 and 1000")
+
+    seed = options.get("seed")
+    if seed is not None and type(seed) is not int:
+        raise ValueError("Expected seed to be an integer")
+
+    return replace(RenderOptions(workers=1), **options)
+
+
+@dataclass
+class _Job:
+    id: str
+    lyrics: str
+    audio_path: str
+    options: RenderOptions
+    submitted: float = field(default_factory=time.perf_counter)
+    # One of "queued", "running", "done" and "failed"
+    state: str = "queued"
+    events: List[Dict[str, Any]] = field(default_factory=list)
+    outputs: List[str] = field(default_factory=list)
+    finished: float | None = None
+
+
+class RenderServer:
+    """
+    Renders jobs with a fixed number of worker threads, which share the corpus and the models loaded when the
+    server starts. Stages run in the server process, so that they use the warm models, and every worker keeps
+    its own stretch cache in memory between jobs. Finished jobs and their files are deleted after an hour, or
+    sooner once more than 100 jobs are finished.
+    """
+
+    def __init__(self, workers: int = 1, directory: str = SERVER_DIR):
+        """
+        Args:
+            workers (int): The number of jobs rendered at once.
+            directory (str): The directory of the uploaded audio and the rendered covers, one subdirectory per job.
+        """
+
+        self.directory = directory
+        self.quotes = get_all_quotes()
+        warm_up(self.quotes)
+
+        self._jobs: Dict[str, _Job] = {}
+        self._queue: "queue.Queue[_Job]" = queue.Queue()
+        self._changed = threading.Condition()
+        # The separation model isn't safe to run from several threads at once
+        self._separation_lock = threading.Lock()
+
+        for _ in range(workers):
+            threading.Thread(target=self._work, daemon=True).start()
+
+    def submit(self, request: Dict[str, Any]) -> str:
+        """
+        Queues a render job.
+
+        Args:
+            request (Dict[str, Any]): The "lyrics" of the song and its audio, either uploaded as base64 ("audio",
+                with its file extension in "audio_format", "wav" by default) or as a path on the server
+                ("audio_path"). Render options (e.g. "objective" or "variants", at most 8) may be set too.
+
+        Returns:
+            str: The id of the job.
+        """
+
+        if not isinstance(request.get("lyrics"), str):
+            raise ValueError("Expected the lyrics of the song")
+        options = _job_options(request)
+
+        id = uuid.uuid4().hex
+        if "audio" in request:
+            audio_format = str(request.get("audio_format", "wav")).strip(".").lower()
+            if audio_format not in _AUDIO_FORMATS:
+                raise ValueError(
+                    f"Unsupported audio format, expected one of {', '.join(_AUDIO_FORMATS)}"
+                )
+            audio_path = os.path.join(self.directory, id, f"input.{audio_format}")
+            os.makedirs(os.path.dirname(audio_path), exist_ok=True)
+            with open(audio_path, "wb") as file:
+                file.write(base64.b64decode(request["audio"]))
+        elif "audio_path" in request:
+            audio_path = request["audio_path"]
+            if not os.path.exists(audio_path):
+                raise ValueError(f"{audio_path} doesn't exist")
+        else:
+            raise ValueError("Expected the audio of the song")
+
+        job = _Job(id, request["lyrics"], audio_path, options)
+
+        with self._changed:
+            self._jobs[id] = job
+        self._event(job, "queued", f"{self._queue.qsize()} jobs ahead")
+        self._queue.put(job)
+        return id
+
+    def _event(self, job: _Job, stage: str, message: str = ""):
+        with self._changed:
+            job.events.append(
+                {
+                    "stage": stage,
+                    "message": message,
+                    "seconds": round(time.perf_counter() - job.submitted, 3),
+                }
+            )
+            self._changed.notify_all()
+
+    def _work(self):
+        stretch_cache = StretchCache()
+        while True:
+            job = self._queue.get()
+            job.state = "running"
+            try:
+                self._run(job, stretch_cache)
+                job.state = "done"
+                self._event(job, "done", f"rendered {len(job.outputs)} covers")
+            except Exception as e:
+                job.state = "failed"
+                self._event(job, "failed", str(e))
+            job.finished = time.perf_counter()
+            self._evict_jobs()
+
+    def _evict_jobs(self):
+        """
+        Deletes the finished jobs, and their directories, that are older than the TTL or beyond the cap.
+        """
+
+        now = time.perf_counter()
+        with self._changed:
+            finished = sorted(
+                (job for job in self._jobs.values() if job.finished is not None),
+                key=lambda job: job.finished,
+            )
+            evicted = [
+                job
+                for i, job in enumerate(finished)
+                if now - job.finished > _JOB_TTL_S
+                or i < len(finished) - _MAX_FINISHED_JOBS
+            ]
+            for job in evicted:
+                del self._jobs[job.id]
+
+        for job in evicted:
+            shutil.rmtree(os.path.join(self.directory, job.id), ignore_errors=True)
+
+    def _run(self, job: _Job, stretch_cache: StretchCache):
+        # Pinned so that the other workers' evictions keep the stems until the job is rendered
+        checkpoints = Checkpoints(pin=job.id)
+
+        try:
+            self._event(job, "separate")
+            with self._separation_lock:
+                stems = separate(checkpoints, job.audio_path)
+
+            self._event(job, "match")
+            plans = match(checkpoints, job.lyrics, self.quotes, job.options)
+            if not plans:
+                raise ValueError("Found no matches")
+
+            self._event(job, "align", f"{len(plans)} cover plans")
+            words = align(checkpoints, stems["vocals.wav"], job.lyrics, workers=1)
+
+            self._event(job, "render")
+            job.outputs = render_plans(
+                plans,
+                self.quotes,
+                job.lyrics,
+                words,
+                stems["accompaniment.wav"],
+                job.options,
+                os.path.join(self.directory, job.id, "output.mp3"),
+                os.path.join(self.directory, job.id, "debug.txt"),
+                stretch_cache,
+            )
+        finally:
+            checkpoints.unpin(job.id)
+
+    def status(self) -> Dict[str, Any]:
+        """
+        Returns the number of jobs in every state, and how long loading every model took and how many times it was
+        reused since (see `sessions.session_stats`).
+        """
+
+        with self._changed:
+            states = [job.state for job in self._jobs.values()]
+        return {
+            "jobs": {
+                state: states.count(state)
+                for state in ["queued", "running", "done", "failed"]
+            },
+            "sessions": session_stats(),
+        }
+
+    def job(self, id: str) -> _Job | None:
+        """
+        Returns a job by id, or None if there's no such job.
+        """
+
+        return self._jobs.get(id)
+
+    def events(self, job: _Job) -> Iterator[Dict[str, Any]]:
+        """
+        Yields the progress events of a job as they happen, until the job is finished.
+        """
+
+        sent = 0
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: len(job.events) > sent)
+                events = job.events[sent:]
+            sent += len(events)
+
+            yield from events
+            if events[-1]["stage"] in ("done", "failed"):
+                return
+
+
+def serve(host: str = "127.0.0.1", port: int = 8765, workers: int = 1):
+    """
+    Starts the render server and serves requests until interrupted.
+
+    Args:
+        host (str): The address to listen on.
+        port (int): The port to listen on.
+        workers (int): The number of jobs rendered at once.
+    """
+
+    server = RenderServer(workers)
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send_json(self, status: int, body: Any):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            if self.path != "/jobs":
+                return self._send_json(404, {"error": "Not found"})
+
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                id = server.submit(json.loads(self.rfile.read(length)))
+            except (ValueError, TypeError) as e:
+                return self._send_json(400, {"error": str(e)})
+            self._send_json(202, {"id": id})
+
+        def do_GET(self):
+            if self.path == "/status":
+                return self._send_json(200, server.status())
+
+            parts = self.path.strip("/").split("/")
+            job = (
+                server.job(parts[1]) if len(parts) > 1 and parts[0] == "jobs" else None
+            )
+            if job is None:
+                return self._send_json(404, {"error": "Not found"})
+
+            if len(parts) == 2:
+                return self._send_json(
+                    200,
+                    {
+                        "id": job.id,
+                        "state": job.state,
+                        "events": job.events,
+                        "outputs": len(job.outputs),
+                    },
+                )
+
+            if parts[2:] == ["events"]:
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.end_headers()
+                for event in server.events(job):
+                    self.wfile.write(json.dumps(event).encode() + b"\n")
+                    self.wfile.flush()
+                return
+
+            if len(parts) == 4 and parts[2] == "output" and parts[3].isdigit():
+                n = int(parts[3])
+                if 1 <= n <= len(job.outputs):
+                    with open(job.outputs[n - 1], "rb") as file:
+                        data = file.read()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "audio/mpeg")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                    return
+
+            self._send_json(404, {"error": "Not found"})
+
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    print(f"Serving on http://{host}:{port} with {workers} workers.")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
@@ -0,0 +1,68 @@
+"""
+This module keeps the heavy models (source separation, acoustic model) loaded once per process,
+so that every call after the first one reuses the same warm session.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Callable, Dict
+import threading
+import time
+
+
+@dataclass
+class _Session:
+    model: Any
+    load_seconds: float
+    reuses: int = 0
+
+
+_sessions: Dict[str, _Session] = {}
+_locks: Dict[str, threading.Lock] = {}
+_registry_lock = threading.Lock()
+
+
+def get_model(name: str, loader: Callable[[], Any]) -> Any:
+    """
+    Returns the model registered under a name, loading it with `loader` on first use.
+    Concurrent first calls for the same name load the model only once.
+
+    Args:
+        name (str): The name of the model.
+        loader (Callable[[], Any]): A function that loads the model.
+
+    Returns:
+        Any: The loaded model.
+    """
+
+    session = _sessions.get(name)
+    if session is None:
+        with _registry_lock:
+            lock = _locks.setdefault(name, threading.Lock())
+
+        with lock:
+            session = _sessions.get(name)
+            if session is None:
+                start = time.perf_counter()
+                model = loader()
+                session = _Session(model, time.perf_counter() - start)
+                _sessions[name] = session
+                return session.model
+
+    with _registry_lock:
+        session.reuses += 1
+    return session.model
+
+
+def session_stats() -> Dict[str, Dict[str, float]]:
+    """
+    Returns, for every loaded model, how long loading it took and how many times it was reused since.
+
+    Returns:
+        Dict[str, Dict[str, float]]: A mapping of model names to {"load_seconds": ..., "reuses": ...}.
+    """
+
+    with _registry_lock:
+        return {
+            name: {"load_seconds": session.load_seconds, "reuses": session.reuses}
+            for name, session in _sessions.items()
+        }
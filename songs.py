@@ -2,22 +2,37 @@
 This module provides functionality for searching songs and downloading them and their lyrics from YouTube and Genius.
 """
 
-from typing import List
+from typing import TYPE_CHECKING, List
 import warnings
+import os
 
 from dotenv import dotenv_values
-from lyricsgenius import Genius
-from yt_dlp import YoutubeDL
 
+if TYPE_CHECKING:
+    from lyricsgenius import Genius
 
-warnings.simplefilter(action="ignore", category=FutureWarning)
-ACCESS_TOKEN = dotenv_values()["GENIUS_CLIENT_ACCESS_TOKEN"]
-_genius = Genius(ACCESS_TOKEN)
-_genius.verbose = False
-_genius.remove_section_headers = True
-_genius.skip_non_songs = False
 
-_genius.excluded_terms = ["(Remix)", "(Live)"]
+_genius: "Genius | None" = None
+
+
+def _client() -> "Genius":
+    """
+    Returns the Genius client, created on first use so that songs given as local files need no API token,
+    and modules importing this one don't pay for importing the client.
+    """
+
+    global _genius
+
+    if _genius is None:
+        warnings.simplefilter(action="ignore", category=FutureWarning)
+        from lyricsgenius import Genius
+
+        _genius = Genius(dotenv_values()["GENIUS_CLIENT_ACCESS_TOKEN"])
+        _genius.verbose = False
+        _genius.remove_section_headers = True
+        _genius.skip_non_songs = False
+        _genius.excluded_terms = ["(Remix)", "(Live)"]
+    return _genius
 
 
 def search_song(fuzzy_song_name: str) -> List[str]:
@@ -33,7 +48,7 @@ def search_song(fuzzy_song_name: str) -> List[str]:
 
     return [
         record["result"]["full_title"].replace("\xa0", " ")
-        for record in _genius.search_songs(fuzzy_song_name)["hits"]
+        for record in _client().search_songs(fuzzy_song_name)["hits"]
         if record["type"] == "song"
     ]
 
@@ -49,18 +64,34 @@ def get_song_lyrics(song_name: str) -> str | None:
         str | None: The lyrics of the song if found, otherwise None.
     """
 
-    song = _genius.search_song(song_name)
+    song = _client().search_song(song_name)
     return "\n".join(song.lyrics.split("\n")[1:]) if song else None
 
 
-def download_song(song_name: str) -> str:
+def download_song(song_name: str, output_path: str = "data/temp.wav") -> str:
+    """
+    This function downloads the audio of a song from YouTube. The audio is decoded to the format of
+    `output_path`'s extension, WAV by default so that it isn't re-encoded to a lossy format.
+
+    Args:
+        song_name (str): The name of the song to download.
+        output_path (str): The path of the audio file.
+
+    Returns:
+        str: The path of the audio file.
+    """
+
+    from yt_dlp import YoutubeDL
+
+    output_base, output_extension = os.path.splitext(output_path)
+
     ydl_opts = {
         "format": "bestaudio/best",
-        "outtmpl": "data/temp",
+        "outtmpl": output_base,
         "postprocessors": [
             {
                 "key": "FFmpegExtractAudio",
-                "preferredcodec": "mp3",
+                "preferredcodec": output_extension[1:],
                 "preferredquality": "192",
             }
         ],
@@ -73,7 +104,7 @@ def download_song(song_name: str) -> str:
     with YoutubeDL(ydl_opts) as ydl:
         ydl.download([search_query])
 
-    return "data/temp.mp3"
+    return output_path
 
 
 def select_song() -> str:
@@ -0,0 +1,265 @@
+"""
+This module contains the compact binary store of the quote corpus. All strings of the corpus (ids, texts,
+paths, interned character names and normalized tokens) live once in a string table, and quotes are stored as
+columns of string ids, so the file can be memory-mapped and quotes decoded only when they are accessed.
+
+File layout: the magic bytes, a little-endian uint64 header length, a JSON header describing the sections (and
+holding the fingerprint of the corpus, see `index.corpus_fingerprint`) and then the sections themselves, each
+aligned to 8 bytes.
+"""
+
+from dataclasses import asdict
+from typing import Dict, Iterator, List, Sequence
+import struct
+import json
+import mmap
+import os
+
+import numpy as np
+
+from index import corpus_fingerprint, normalize_and_tokenize
+from models import Quote
+
+
+_MAGIC = b"OWQSTORE"
+STORE_VERSION = 2
+
+# The string columns of a quote, in the order of the Quote fields
+_COLUMNS = [
+    "id",
+    "character",
+    "character_picture",
+    "text",
+    "audio_url",
+    "audio_path",
+    "etag",
+    "last_modified",
+    "language",
+]
+
+
+def write_store(quotes: Sequence[Quote], path: str):
+    """
+    Writes a quote corpus to a binary store. The file is written next to its destination first and then
+    moved in place, so readers never see a partially written store.
+
+    Args:
+        quotes (Sequence[Quote]): The quotes to store.
+        path (str): The path of the store.
+    """
+
+    string_ids: Dict[str, int] = {}
+
+    def intern(s: str | None) -> int:
+        if s is None:
+            return -1
+        return string_ids.setdefault(s, len(string_ids))
+
+    columns = {name: np.empty(len(quotes), dtype="<i4") for name in _COLUMNS}
+    token_offsets = np.zeros(len(quotes) + 1, dtype="<u4")
+    tokens: List[int] = []
+
+    for i, quote in enumerate(quotes):
+        for name in _COLUMNS:
+            columns[name][i] = intern(getattr(quote, name))
+        tokens.extend(intern(token) for token in normalize_and_tokenize(quote.text))
+        token_offsets[i + 1] = len(tokens)
+
+    # The quotes sorted by id, so that a quote is found by id with a binary search
+    id_order = np.array(
+        sorted(range(len(quotes)), key=lambda i: quotes[i].id), dtype="<u4"
+    )
+
+    encoded = [s.encode() for s in string_ids]
+    string_offsets = np.zeros(len(encoded) + 1, dtype="<u8")
+    string_offsets[1:] = np.cumsum([len(s) for s in encoded])
+
+    sections = {
+        "strings": np.frombuffer(b"".join(encoded), dtype="u1"),
+        "string_offsets": string_offsets,
+        **columns,
+        "token_offsets": token_offsets,
+        "tokens": np.array(tokens, dtype="<i4"),
+        "id_order": id_order,
+    }
+
+    header = {
+        "version": STORE_VERSION,
+        "count": len(quotes),
+        "fingerprint": corpus_fingerprint(quotes),
+        "sections": {},
+    }
+    offset = 0
+    for name, array in sections.items():
+        header["sections"][name] = [offset, array.dtype.str, len(array)]
+        offset += -(-array.nbytes // 8) * 8
+
+    header_bytes = json.dumps(header).encode()
+    header_bytes += b" " * (-(len(_MAGIC) + 8 + len(header_bytes)) % 8)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(f"{path}.tmp", "wb") as file:
+        file.write(_MAGIC + struct.pack("<Q", len(header_bytes)) + header_bytes)
+        for array in sections.values():
+            file.write(array.tobytes())
+            file.write(b"\0" * (-array.nbytes % 8))
+    os.replace(f"{path}.tmp", path)
+
+
+class CorpusStore(Sequence[Quote]):
+    """
+    A read-only, memory-mapped quote corpus. Indexing it decodes a single Quote from the columns,
+    so loading the store takes the same time regardless of the size of the corpus. Stores written by
+    older versions can be read, but only support decoding quotes, see `quotes.get_all_quotes`.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mmap[: len(_MAGIC)] != _MAGIC:
+            raise ValueError(f"{path} is not a quote store")
+
+        (header_length,) = struct.unpack_from("<Q", self._mmap, len(_MAGIC))
+        data_start = len(_MAGIC) + 8 + header_length
+        header = json.loads(self._mmap[len(_MAGIC) + 8 : data_start])
+        if header["version"] > STORE_VERSION:
+            raise ValueError(f"{path} has unsupported version {header['version']}")
+
+        self.version: int = header["version"]
+        self._fingerprint: str | None = header.get("fingerprint")
+        self._count = header["count"]
+        self._strings_start = data_start + header["sections"]["strings"][0]
+        self._sections = {
+            name: np.frombuffer(
+                self._mmap, dtype=dtype, count=length, offset=data_start + offset
+            )
+            for name, (offset, dtype, length) in header["sections"].items()
+        }
+
+    def _string(self, string_id: int) -> str | None:
+        if string_id < 0:
+            return None
+        start, end = self._sections["string_offsets"][string_id : string_id + 2]
+        return self._mmap[
+            self._strings_start + int(start) : self._strings_start + int(end)
+        ].decode()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, i: int) -> Quote:
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._count))]
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError("quote index out of range")
+
+        return Quote(*[self._string(int(self._sections[name][i])) for name in _COLUMNS])
+
+    def __iter__(self) -> Iterator[Quote]:
+        return (self[i] for i in range(self._count))
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        The fingerprint of the corpus, read from the header.
+        """
+
+        if self._fingerprint is None:
+            self._fingerprint = corpus_fingerprint(self)
+        return self._fingerprint
+
+    def find(self, id: str) -> Quote | None:
+        """
+        Returns the quote with the given id, or None if there's no such quote. Only the ids on the path of a
+        binary search are decoded.
+        """
+
+        order = self._sections["id_order"]
+        ids = self._sections["id"]
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._string(int(ids[order[middle]])) < id:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._count and self._string(int(ids[order[low]])) == id:
+            return self[int(order[low])]
+        return None
+
+    def language(self, i: int) -> str:
+        """
+        Returns the language of the i-th quote.
+        """
+
+        return self._string(int(self._sections["language"][i]))
+
+    def tokens(self, i: int) -> List[str]:
+        """
+        Returns the normalized tokens of the i-th quote's text.
+        """
+
+        offsets = self._sections["token_offsets"]
+        return [
+            self._string(int(token))
+            for token in self._sections["tokens"][offsets[i] : offsets[i + 1]]
+        ]
+
+    def token_groups(self, language: str) -> List[List[int]]:
+        """
+        Groups the quotes in a language by their normalized tokens, from the language and token columns, without
+        decoding any quote. Quotes without tokens are left out.
+
+        Args:
+            language (str): The language of the quotes to group.
+
+        Returns:
+            List[List[int]]: The indexes of the quotes of every group, in the order of the store.
+        """
+
+        languages = self._sections["language"]
+        language_ids = [
+            string_id
+            for string_id in np.unique(languages).tolist()
+            if self._string(string_id) == language
+        ]
+        offsets = self._sections["token_offsets"]
+        tokens = self._sections["tokens"]
+
+        groups: Dict[bytes, List[int]] = {}
+        for i in np.flatnonzero(np.isin(languages, language_ids)).tolist():
+            if offsets[i] < offsets[i + 1]:
+                key = tokens[offsets[i] : offsets[i + 1]].tobytes()
+                groups.setdefault(key, []).append(i)
+        return list(groups.values())
+
+
+def import_json(path: str) -> List[Quote]:
+    """
+    Reads a quote corpus from the JSON format, a list of Quote dicts.
+
+    Args:
+        path (str): The path of the JSON file.
+
+    Returns:
+        List[Quote]: The quotes of the corpus.
+    """
+
+    with open(path, "r") as file:
+        return [Quote(**data) for data in json.load(file)]
+
+
+def export_json(quotes: Sequence[Quote], path: str):
+    """
+    Writes a quote corpus in the JSON format, a list of Quote dicts.
+
+    Args:
+        quotes (Sequence[Quote]): The quotes of the corpus.
+        path (str): The path of the JSON file.
+    """
+
+    with open(path, "w") as file:
+        json.dump([asdict(quote) for quote in quotes], file, indent=4)
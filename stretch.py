@@ -0,0 +1,310 @@
+"""
+This module time-stretches all clips of a song at once, spreading them over a pool of worker processes,
+and caches the stretched clips so that repeated lines are only stretched once.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+import hashlib
+import os
+
+import numpy as np
+
+from utils import stretch_samples
+from models import Match
+from profiling import span
+
+
+MODES = ["quality", "fast"]
+CACHE_DIR = "data/cache/stretch"
+
+# WSOLA frame length, in seconds, and the fraction of a frame the next one may be shifted by to match it
+_WSOLA_FRAME_S = 0.025
+_WSOLA_TOLERANCE = 0.25
+
+
+def _wsola(samples: np.ndarray, rate: float, sample_rate: int) -> np.ndarray:
+    """
+    Time-stretches samples with WSOLA (waveform similarity overlap-add), which preserves the pitch like
+    the phase vocoder but only copies and overlaps windows of the input instead of going through an STFT.
+
+    Args:
+        samples (np.ndarray): The float32 samples, of shape (channels, n_frames).
+        rate (float): The stretch factor, > 1 makes the result shorter.
+        sample_rate (int): The sample rate of the samples.
+
+    Returns:
+        np.ndarray: The stretched samples, of shape (channels, n_frames / rate).
+    """
+
+    frame = max(16, int(_WSOLA_FRAME_S * sample_rate))
+    hop = frame // 2
+    tolerance = int(frame * _WSOLA_TOLERANCE)
+    window = np.hanning(frame).astype(np.float32)
+
+    output_length = int(samples.shape[1] / rate)
+    frame_count = output_length // hop + 1
+
+    padded = np.pad(samples, ((0, 0), (tolerance, frame + hop + tolerance)))
+    mono = padded.mean(axis=0)
+    output = np.zeros((samples.shape[0], frame_count * hop + frame), dtype=np.float32)
+    norm = np.zeros(frame_count * hop + frame, dtype=np.float32)
+
+    position = tolerance
+    for k in range(frame_count):
+        nominal = min(
+            tolerance + int(k * hop * rate), len(mono) - frame - hop - tolerance
+        )
+        if k > 0:
+            # Shift the frame so it continues the waveform of the previous frame as closely as possible
+            template = mono[position + hop : position + hop + frame]
+            region = mono[nominal - tolerance : nominal + tolerance + frame]
+            nominal += int(np.argmax(np.correlate(region, template))) - tolerance
+        position = nominal
+
+        output[:, k * hop : k * hop + frame] += (
+            padded[:, position : position + frame] * window
+        )
+        norm[k * hop : k * hop + frame] += window
+
+    return output[:, :output_length] / np.maximum(norm[:output_length], 1e-3)
+
+
+def _stretch(
+    samples: np.ndarray, target_duration_ms: float, sample_rate: int, mode: str
+) -> np.ndarray:
+    """
+    Time-stretches a single clip, all of its channels at once.
+    """
+
+    if mode == "fast":
+        rate = samples.shape[-1] * 1000 / sample_rate / target_duration_ms
+        stretched = _wsola(np.atleast_2d(samples), rate, sample_rate)
+        return stretched if samples.ndim > 1 else stretched[0]
+    return stretch_samples(samples, target_duration_ms, sample_rate)
+
+
+def stretch_batch(
+    clips: List[np.ndarray],
+    target_durations_ms: List[float],
+    sample_rate: int,
+    mode: str = "quality",
+    workers: int | None = None,
+) -> List[np.ndarray]:
+    """
+    Time-stretches every clip of a song to its target duration, preserving their pitch. The clips are
+    spread over a pool of worker processes, one per CPU core by default.
+
+    Args:
+        clips (List[np.ndarray]): The float32 samples of the clips, of shape (n_frames,) or (channels, n_frames).
+        target_durations_ms (List[float]): The desired duration of every clip in milliseconds.
+        sample_rate (int): The sample rate of the clips.
+        mode (str): "quality" for librosa's phase vocoder, "fast" for WSOLA.
+        workers (int | None): The number of worker processes, 1 to stretch in this process.
+
+    Returns:
+        List[np.ndarray]: The stretched clips, in the given order.
+    """
+
+    if mode not in MODES:
+        raise ValueError(f"Unknown stretch mode {mode!r}, expected one of {MODES}")
+
+    workers = min(workers or os.cpu_count() or 1, len(clips))
+    if workers <= 1:
+        stretched = []
+        for clip, target in zip(clips, target_durations_ms):
+            with span("stretch_clip", target_ms=target):
+                stretched.append(_stretch(clip, target, sample_rate, mode))
+        return stretched
+
+    # Clips stretched by worker processes aren't recorded one by one
+    pool_span = span("stretch_pool", clips=len(clips), workers=workers)
+    with pool_span, ProcessPoolExecutor(workers) as executor:
+        return list(
+            executor.map(
+                _stretch,
+                clips,
+                target_durations_ms,
+                [sample_rate] * len(clips),
+                [mode] * len(clips),
+                chunksize=max(1, len(clips) // (workers * 4)),
+            )
+        )
+
+
+class StretchCache:
+    """
+    A two-tier LRU cache of stretched clips, keyed by quote, quote segment, stretch mode and target duration.
+    Target durations are rounded to buckets, so that nearly identical durations share one entry. Clips live in
+    memory and on disk, each tier bounded by a size in bytes; the disk tier persists across songs and runs.
+    """
+
+    def __init__(
+        self,
+        directory: str = CACHE_DIR,
+        bucket_ms: int = 20,
+        max_memory_bytes: int = 256 * 2**20,
+        max_disk_bytes: int = 2 * 2**30,
+    ):
+        self.directory = directory
+        self.bucket_ms = bucket_ms
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+        self._memory: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._memory_bytes = 0
+
+        os.makedirs(directory, exist_ok=True)
+        files = [
+            entry for entry in os.scandir(directory) if entry.name.endswith(".npy")
+        ]
+        files.sort(key=lambda entry: entry.stat().st_mtime_ns)
+        self._disk: OrderedDict[str, int] = OrderedDict(
+            (entry.name[: -len(".npy")], entry.stat().st_size) for entry in files
+        )
+        self._disk_bytes = sum(self._disk.values())
+
+    def bucket(self, target_duration_ms: float) -> int:
+        """
+        Rounds a target duration to its bucket, the duration clips are actually stretched to.
+        """
+
+        return max(1, round(target_duration_ms / self.bucket_ms)) * self.bucket_ms
+
+    def key(
+        self, match: Match, target_duration_ms: float, mode: str, frames: int
+    ) -> str:
+        """
+        Returns the cache key of a match stretched to a target duration. The key includes the size and
+        modification time of the quote audio, so clips of changed quotes are not served, and the length of the
+        clip, so clips trimmed differently (see `pipeline._trim_and_level`) are not mixed up.
+        """
+
+        stat = os.stat(match.quote.audio_path)
+        raw = (
+            f"{match.quote.id}\0{match.quote_segment}\0{mode}\0{frames}\0"
+            f"{self.bucket(target_duration_ms)}\0{stat.st_size}\0{stat.st_mtime_ns}"
+        )
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.npy")
+
+    def _put_memory(self, key: str, clip: np.ndarray):
+        if clip.nbytes > self.max_memory_bytes:
+            return
+
+        self._memory[key] = clip
+        self._memory_bytes += clip.nbytes
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.nbytes
+            self.stats["evictions"] += 1
+
+    def get(self, key: str) -> np.ndarray | None:
+        """
+        Returns a cached clip, or None on a miss. Clips found on disk are promoted to memory.
+        """
+
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.stats["memory_hits"] += 1
+            return self._memory[key]
+
+        if key in self._disk:
+            try:
+                clip = np.load(self._path(key))
+            except (OSError, ValueError, EOFError):
+                # A missing or corrupt file, e.g. one cut short by a crash while saving it
+                self._disk_bytes -= self._disk.pop(key)
+                if os.path.exists(self._path(key)):
+                    os.remove(self._path(key))
+            else:
+                os.utime(self._path(key))
+                self._disk.move_to_end(key)
+                self._put_memory(key, clip)
+                self.stats["disk_hits"] += 1
+                return clip
+
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, key: str, clip: np.ndarray):
+        """
+        Stores a clip in both tiers, evicting the least recently used clips past the size limits.
+        """
+
+        self._put_memory(key, clip)
+
+        if key in self._disk or clip.nbytes > self.max_disk_bytes:
+            return
+
+        np.save(self._path(key), clip)
+        size = os.path.getsize(self._path(key))
+        self._disk[key] = size
+        self._disk_bytes += size
+        while self._disk_bytes > self.max_disk_bytes:
+            evicted, evicted_size = self._disk.popitem(last=False)
+            self._disk_bytes -= evicted_size
+            self.stats["evictions"] += 1
+            if os.path.exists(self._path(evicted)):
+                os.remove(self._path(evicted))
+
+
+def stretch_matches(
+    matches: List[Match],
+    clips: List[np.ndarray],
+    target_durations_ms: List[float],
+    sample_rate: int,
+    cache: StretchCache,
+    mode: str = "quality",
+    workers: int | None = None,
+) -> List[np.ndarray]:
+    """
+    Time-stretches the clips of a song's matches like `stretch_batch`, serving repeated matches from the cache.
+    Every clip is stretched to the bucket of its target duration, and clips missing from the cache are
+    stretched in a single batch, once per distinct key.
+
+    Args:
+        matches (List[Match]): The matches the clips belong to.
+        clips (List[np.ndarray]): The float32 samples of the clips, of shape (n_frames,) or (channels, n_frames).
+        target_durations_ms (List[float]): The desired duration of every clip in milliseconds.
+        sample_rate (int): The sample rate of the clips.
+        cache (StretchCache): The cache of stretched clips.
+        mode (str): "quality" for librosa's phase vocoder, "fast" for WSOLA.
+        workers (int | None): The number of worker processes, 1 to stretch in this process.
+
+    Returns:
+        List[np.ndarray]: The stretched clips, in the given order.
+    """
+
+    keys = [
+        cache.key(match, target, mode, clip.shape[-1])
+        for match, clip, target in zip(matches, clips, target_durations_ms)
+    ]
+    stretched: Dict[str, np.ndarray] = {}
+    missing: Dict[str, Tuple[np.ndarray, int]] = {}
+
+    for key, clip, target in zip(keys, clips, target_durations_ms):
+        if key in stretched or key in missing:
+            continue
+        cached = cache.get(key)
+        if cached is not None:
+            stretched[key] = cached
+        else:
+            missing[key] = (clip, cache.bucket(target))
+
+    missing_clips = stretch_batch(
+        [clip for clip, _ in missing.values()],
+        [target for _, target in missing.values()],
+        sample_rate,
+        mode,
+        workers,
+    )
+    for key, clip in zip(missing, missing_clips):
+        cache.put(key, clip)
+        stretched[key] = clip
+
+    return [stretched[key] for key in keys]
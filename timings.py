@@ -0,0 +1,153 @@
+"""
+This module stores the word-level timings of every quote, so quotes don't have to be aligned at render time.
+Timings are tagged with the size and modification time of the quote audio they were aligned with, so that
+checking them doesn't read the audio.
+"""
+
+from typing import Dict, List, Tuple
+import threading
+import hashlib
+import json
+import uuid
+import os
+
+from models import Quote
+from pcm import file_version
+
+
+TIMINGS_PATH = "data/quote_timings.json"
+
+# A word timing is (word, start in seconds, end in seconds)
+WordTiming = Tuple[str, float, float]
+
+_table: Dict[str, dict] | None = None
+# Guards the table, which threads of the render server may update and save at the same time
+_lock = threading.Lock()
+
+
+def audio_hash(audio_path: str) -> str:
+    """
+    Computes the content hash of an audio file.
+
+    Args:
+        audio_path (str): The path to the audio file.
+
+    Returns:
+        str: The hex digest of the file's content.
+    """
+
+    with open(audio_path, "rb") as file:
+        return hashlib.sha1(file.read()).hexdigest()
+
+
+def load_timings(path: str = TIMINGS_PATH) -> Dict[str, dict]:
+    """
+    Loads the timing table, which maps quote ids to {"version": audio file version, "words": word timings}.
+    The table is kept in memory after the first load.
+
+    Args:
+        path (str): The path of the timing table.
+
+    Returns:
+        Dict[str, dict]: The timing table.
+    """
+
+    global _table
+
+    with _lock:
+        if _table is None:
+            table = {}
+            if os.path.exists(path):
+                with open(path, "r") as file:
+                    table = json.load(file)
+            _table = table
+
+    return _table
+
+
+def save_timings(path: str = TIMINGS_PATH):
+    """
+    Saves the in-memory timing table to disk, replacing the previous file at once.
+
+    Args:
+        path (str): The path of the timing table.
+    """
+
+    # Other processes may be reading the table, so it's written next to it and then moved in place
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temporary_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    table = load_timings(path)
+    with _lock, open(temporary_path, "w") as file:
+        json.dump(table, file)
+    os.replace(temporary_path, path)
+
+
+def timings_version(path: str = TIMINGS_PATH) -> List[int] | None:
+    """
+    Returns the version of the saved timing table, which changes whenever it's saved, or None if there's none.
+    """
+
+    return file_version(path) if os.path.exists(path) else None
+
+
+def get_timings(quote: Quote) -> List[WordTiming] | None:
+    """
+    Returns the word timings of a quote if they are in the table and its audio hasn't changed since.
+
+    Args:
+        quote (Quote): The quote to get the word timings of.
+
+    Returns:
+        List[WordTiming] | None: The word timings, or None if the quote has to be (re-)aligned.
+    """
+
+    entry = load_timings().get(quote.id)
+    if entry is None or not os.path.exists(quote.audio_path):
+        return None
+
+    version = file_version(quote.audio_path)
+    if "version" not in entry:
+        # Tables written before timings had versions tag them with a content hash, which is checked once
+        if entry.get("hash") != audio_hash(quote.audio_path):
+            return None
+        with _lock:
+            entry["version"] = version
+    if entry["version"] != version:
+        return None
+    return [tuple(word) for word in entry["words"]]
+
+
+def timings_audio_version(quote_id: str) -> List[int] | None:
+    """
+    Returns the version of the audio a quote's word timings were aligned with, without checking the audio,
+    or None if the quote has no timings.
+    """
+
+    entry = load_timings().get(quote_id)
+    return entry.get("version") if entry is not None else None
+
+
+def has_timings(quote: Quote) -> bool:
+    """
+    Checks whether the word timings of a quote are in the table and its audio hasn't changed since.
+    """
+
+    return get_timings(quote) is not None
+
+
+def set_timings(quote: Quote, words: List[WordTiming]):
+    """
+    Stores the word timings of a quote in the in-memory table, tagged with the version of its current audio.
+
+    Args:
+        quote (Quote): The aligned quote.
+        words (List[WordTiming]): The word timings of the quote.
+    """
+
+    entry = {
+        "version": file_version(quote.audio_path),
+        "words": [list(word) for word in words],
+    }
+    table = load_timings()
+    with _lock:
+        table[quote.id] = entry
@@ -3,7 +3,6 @@ import os
 
 from pydub import AudioSegment
 import numpy as np
-import librosa
 
 
 @contextmanager
@@ -32,6 +31,33 @@ def suppress_all_output():
             os.close(old_stderr)
 
 
+def stretch_samples(
+    samples: np.ndarray, target_duration_ms: int, sample_rate: int
+) -> np.ndarray:
+    """
+    Time‐stretches float samples to match a given target duration (in ms), preserving their pitch via librosa.
+    The input can be a read-only view (e.g. into the PCM bank), it is never modified.
+
+    Args:
+        samples: The float32 samples, of shape (n_frames,) for mono or (channels, n_frames).
+        target_duration_ms: The desired final duration in milliseconds.
+        sample_rate: The sample rate of the samples.
+
+    Returns:
+        The stretched float32 samples, with the same number of dimensions as the input.
+    """
+
+    # librosa takes around a second to import, so it's only imported by the first stretch
+    import librosa
+
+    original_duration_ms = samples.shape[-1] * 1000 / sample_rate
+    rate = original_duration_ms / target_duration_ms
+    #    If rate > 1, librosa will produce a shorter result.
+    #    If rate < 1, librosa will produce a longer result.
+
+    return librosa.effects.time_stretch(samples, rate=rate)
+
+
 def stretch_audio_segment(
     original: AudioSegment, target_duration_ms: int
 ) -> AudioSegment:
@@ -48,19 +74,13 @@ def stretch_audio_segment(
         A new AudioSegment of length ~ target_duration_ms, pitch‐preserved.
     """
 
-    # 1) Compute original duration and librosa rate
-    original_duration_ms = len(original)
-    rate = original_duration_ms / target_duration_ms
-    #    If rate > 1, librosa will produce a shorter result.
-    #    If rate < 1, librosa will produce a longer result.
-
-    # 2) Extract raw samples from the AudioSegment
+    # 1) Extract raw samples from the AudioSegment
     samples = np.array(original.get_array_of_samples())
     channels = original.channels
     sample_width_bytes = original.sample_width  # e.g. 2 for 16‐bit PCM
     sr = original.frame_rate
 
-    # 3) Reshape and normalize to float32 in [−1.0, +1.0]
+    # 2) Reshape and normalize to float32 in [−1.0, +1.0]
     if channels > 1:
         # Convert 1D interleaved to shape (channels, n_frames)
         samples = samples.reshape((-1, channels)).T
@@ -71,17 +91,11 @@ def stretch_audio_segment(
     max_int_value = float(2 ** (8 * sample_width_bytes - 1))
     samples_float = samples.astype(np.float32) / max_int_value
 
-    # 4) Stretch each channel with librosa
-    stretched_channels = []
-    for ch in range(channels):
-        y = samples_float[ch]
-        y_stretched = librosa.effects.time_stretch(y, rate=rate)
-        stretched_channels.append(y_stretched)
-
-    # 5) Stack back into shape (n_frames_new, channels)
-    stretched_arr = np.stack(stretched_channels, axis=1)  # (n_frames_new, channels)
+    # 3) Stretch all channels with librosa
+    stretched_arr = stretch_samples(samples_float, target_duration_ms, sr).T
+    # (n_frames_new, channels)
 
-    # 6) Convert float32 back to int (same bit depth), then to raw bytes
+    # 4) Convert float32 back to int (same bit depth), then to raw bytes
     stretched_int = np.clip(
         stretched_arr * max_int_value, -max_int_value, max_int_value - 1
     ).astype(f"int{8 * sample_width_bytes}")
@@ -93,7 +107,7 @@ def stretch_audio_segment(
         # Mono: take the first (only) column
         stretched_interleaved = stretched_int[:, 0].tobytes()
 
-    # 7) Build a new AudioSegment from the stretched raw data
+    # 5) Build a new AudioSegment from the stretched raw data
     stretched_segment = AudioSegment(
         data=stretched_interleaved,
         sample_width=sample_width_bytes,